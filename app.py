@@ -15,7 +15,6 @@ from folium.plugins import Draw
 from streamlit_folium import st_folium
 import matplotlib.cm as cm
 import matplotlib.colors as colors
-import datetime
 import os
 
 # Page Config
@@ -349,6 +348,8 @@ elif page == "🛰️ Remote Sensing Satellite Imagery Data":
     import geemap.foliumap as geemap
     import json
     from google.oauth2 import service_account
+    from gee_cache import get_scene_search, get_layer_cache
+    from ground_truth import viewport_bounds
     
     def initialize_gee():
         """Initializes Earth Engine safely with robust credential handling."""
@@ -387,6 +388,16 @@ elif page == "🛰️ Remote Sensing Satellite Imagery Data":
             return False
 
     gee_ready = initialize_gee()
+
+    # Offline fallback: the district stack, processed locally and served as
+    # map tiles by a background tile server (local_tiles.py).
+    local_server = None
+    if not gee_ready:
+        try:
+            from local_tiles import get_tile_server, local_scene
+            local_server = get_tile_server()
+        except Exception as e:
+            st.warning(f"Local processing backend unavailable: {e}")
     
     # Custom CSS for Fixed 100vh Layout
     st.markdown("""
@@ -411,6 +422,10 @@ elif page == "🛰️ Remote Sensing Satellite Imagery Data":
         cursor: pointer; transition: 0.2s; font-size: 0.9em;
     }
     .scene-card:hover { border-color: #00FF7F; background: #333; }
+    .gt-cluster {
+        width: 34px; height: 34px; line-height: 34px; border-radius: 17px; text-align: center;
+        background: rgba(0, 160, 80, 0.8); color: #fff; font-weight: bold; font-size: 0.8em;
+    }
     
     /* 4. Floating Action Button for Field Data */
     .fab-container {
@@ -440,7 +455,10 @@ elif page == "🛰️ Remote Sensing Satellite Imagery Data":
             with st.expander("📍 Search Location"):
                  loc_search = st.text_input("Place Name")
             
-            if not gee_ready:
+            if not gee_ready and local_server is not None:
+                st.warning("⚠️ Earth Engine not connected. Showing the local district scene (offline).")
+                scenes = [local_scene(local_server)]
+            elif not gee_ready:
                 st.error("⚠️ Earth Engine not connected. Real data unavailable.")
                 scenes = []
             else:
@@ -449,29 +467,12 @@ elif page == "🛰️ Remote Sensing Satellite Imagery Data":
                 # Ideally, we query based on a fixed Point or the last known location
                 roi = ee.Geometry.Point([default_center[1], default_center[0]])
                 
-                # Filter Sentinel-2
-                collection = (ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
-                              .filterBounds(roi)
-                              .filterDate(datetime.datetime.now() - datetime.timedelta(days=30), datetime.datetime.now())
-                              .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 20))
-                              .sort('system:time_start', False)
-                              .limit(5))
-                
-                # Fetch metadata client-side
+                # Sentinel-2 scenes of the last 30 days under 20% cloud, newest first.
+                # Served from the process-wide cache (shared by reruns and users);
+                # only a cache miss pays the round trip to Earth Engine.
                 try:
-                    features = collection.getInfo()['features']
-                    scenes = []
-                    for f in features:
-                        props = f['properties']
-                        date = datetime.datetime.fromtimestamp(props['system:time_start']/1000).strftime('%d %b %Y')
-                        cid = f['id']
-                        scenes.append({
-                            "date": date,
-                            "cloud": f"{props['CLOUDY_PIXEL_PERCENTAGE']:.1f}%",
-                            "sensor": "Sentinel-2 L2A",
-                            "id": cid,
-                            "ee_obj": f
-                        })
+                    scenes = get_scene_search(ee).search(default_center[1], default_center[0],
+                                                         days=30, max_cloud=20, limit=5)
                 except Exception as e:
                     st.warning(f"Could not fetch GEE scenes: {e}")
                     scenes = [] # Fail gracefully if query fails
@@ -489,6 +490,11 @@ elif page == "🛰️ Remote Sensing Satellite Imagery Data":
             
             selected_scene_meta = next((s for s in scenes if s['id'] == sel_id), None)
 
+            # Start fetching the map token of the layer the map will show, while
+            # the rest of the page renders.
+            if gee_ready and sel_id:
+                get_layer_cache(ee).prefetch(sel_id, st.session_state.get("current_analysis", {}).get("method", "True Color"), roi)
+
             # Render Cards
             for s in scenes:
                 color = "#00FF7F" if sel_id == s['id'] else "#555"
@@ -533,10 +539,14 @@ elif page == "🛰️ Remote Sensing Satellite Imagery Data":
                 ai_model = st.selectbox("Model", ["Land Cover Classification (ESA WorldCover)", "Mineral Potential Heatmap"])
                 index_choice = f"AI: {ai_model}"
 
+            # Warm the chosen analysis of the selected scene, so Run Processing is instant.
+            if gee_ready and sel_id:
+                get_layer_cache(ee).prefetch(sel_id, index_choice, roi)
+
             st.divider()
              
             if st.button("⚡ Run Processing", type="primary", use_container_width=True):
-                 if not gee_ready:
+                 if not gee_ready and local_server is None:
                      st.error("Cannot run processing: Earth Engine not connected.")
                  elif not selected_scene_meta:
                      st.warning("Please select an image scene first.")
@@ -552,6 +562,9 @@ elif page == "🛰️ Remote Sensing Satellite Imagery Data":
         with tab_info:
             if gee_ready:
                 st.success("✅ GEE Connected")
+            elif local_server is not None:
+                st.warning("🛰️ Offline: local tile server")
+                st.caption(local_server.base_url)
             else:
                 st.error("❌ GEE Disconnected")
             
@@ -572,87 +585,82 @@ elif page == "🛰️ Remote Sensing Satellite Imagery Data":
 
         # 2. Add Selected Scene (Visual)
         if gee_ready and selected_scene_meta:
-             # Load the image
-             img = ee.Image(selected_scene_meta['id'])
-             
-             # PROCESSING LOGIC
+             # PROCESSING LOGIC (gee_cache.analysis_layer)
              active_analysis = st.session_state.get("current_analysis", {})
              method = active_analysis.get("method", "True Color")
-             
-             final_layer = img # Default
-             v_params = {"bands": ['B4', 'B3', 'B2'], "min": 0, "max": 3000} # Default RGB
-             
-             if method == "True Color":
-                 final_layer = img
-                 v_params = {"bands": ['B4', 'B3', 'B2'], "min": 0, "max": 3000}
-                 
-             elif method == "NDVI":
-                 final_layer = img.normalizedDifference(['B8', 'B4']).rename('NDVI')
-                 v_params = {"min": -0.2, "max": 0.8, "palette": ['red', 'yellow', 'green']}
-                 
-             elif method == "Iron Oxide":
-                 # Red/Blue (B4 / B2) approx
-                 final_layer = img.expression("b('B4') / b('B2')").rename('Iron_Oxide')
-                 v_params = {"min": 1, "max": 3, "palette": ['blue', 'yellow', 'red']}
-                 
-             elif method == "Ferrous Iron":
-                 # SWIR1 / NIR (B11 / B8) approx
-                 final_layer = img.expression("b('B11') / b('B8')").rename('Ferrous_Iron')
-                 v_params = {"min": 0.5, "max": 2, "palette": ['blue', 'cyan', 'yellow', 'red']}
-
-             elif method == "Clay Minerals":
-                 # SWIR1 / SWIR2 (B11 / B12) approx
-                 final_layer = img.expression("b('B11') / b('B12')").rename('Clay_Minerals')
-                 v_params = {"min": 1, "max": 3, "palette": ['gray', 'yellow', 'orange']}
-                 
-             elif method == "Gossan Zone":
-                 # Example: Combination of Iron Oxide and Clay Minerals
-                 iron_oxide = img.expression("b('B4') / b('B2')")
-                 clay_minerals = img.expression("b('B11') / b('B12')")
-                 final_layer = iron_oxide.add(clay_minerals).rename('Gossan_Index')
-                 v_params = {"min": 2, "max": 6, "palette": ['blue', 'green', 'yellow', 'red']}
-
-             elif method == "SAVI":
-                 # SAVI = ((NIR - RED) / (NIR + RED + L)) * (1 + L) where L=0.5
-                 L = ee.Number(0.5)
-                 final_layer = img.expression(
-                     '((NIR - RED) / (NIR + RED + L)) * (1 + L)', {
-                         'NIR': img.select('B8'),
-                         'RED': img.select('B4'),
-                         'L': L
-                     }).rename('SAVI')
-                 v_params = {"min": -0.2, "max": 0.8, "palette": ['brown', 'yellow', 'green']}
-
-             elif method == "Moisture Index":
-                 # NDMI = (NIR - SWIR1) / (NIR + SWIR1)
-                 final_layer = img.normalizedDifference(['B8', 'B11']).rename('NDMI')
-                 v_params = {"min": -1, "max": 1, "palette": ['brown', 'white', 'blue']}
-                 
-             elif "AI" in method:
-                 # Example: Load a public classification dataset
-                 # Note: This will load the *latest* WorldCover image, not necessarily tied to the selected S2 scene date/location
+
+             # Map tokens are cached per (scene, method, vis params), so switching
+             # back to an analysis already viewed needs no Earth Engine round trip.
+             layers = get_layer_cache(ee)
+             layer = None
+             try:
+                 layer = layers.layer(selected_scene_meta['id'], method, roi)
+             except Exception as e:
+                 st.warning(f"Could not load {method} layer: {e}")
+                 if method != "True Color":
+                     try:
+                         layer = layers.layer(selected_scene_meta['id'], "True Color")
+                         layer = dict(layer, name="True Color (Fallback)")
+                     except Exception as e:
+                         st.warning(f"Could not load the True Color fallback either; skipping the scene layer: {e}")
+
+             # Add to Map
+             if layer is not None:
+                 folium.TileLayer(tiles=layer['url'], attr="Google Earth Engine", name=layer['name'],
+                                  overlay=True, control=True).add_to(m)
                  try:
-                     final_layer = ee.ImageCollection("ESA/WorldCover/v100").filterBounds(roi).first()
-                     v_params = {"bands": ["Map"]}
-                     method = "ESA WorldCover" # Update layer name for clarity
+                     lon, lat = layers.center(selected_scene_meta['id'])
+                     m.set_center(lon, lat, 12)
                  except Exception as e:
-                     st.warning(f"Could not load AI model data: {e}")
-                     final_layer = img # Fallback to original image
-                     v_params = {"bands": ['B4', 'B3', 'B2'], "min": 0, "max": 3000}
-                     method = "True Color (Fallback)"
-             
-             # Add to Map
-             m.addLayer(final_layer, v_params, method)
-             m.centerObject(img, 12)
+                     st.warning(f"Could not center the map on the scene: {e}")
+
+        elif local_server is not None and selected_scene_meta:
+             active_analysis = st.session_state.get("current_analysis", {})
+             method = active_analysis.get("method", "True Color")
+             backend = local_server.backend
+             if method not in backend.methods():
+                 st.warning(f"{method} needs Earth Engine; showing True Color.")
+                 method = "True Color"
+
+             # Tiles are rendered on demand (and cached on disk) up to the
+             # raster's native zoom; Leaflet upscales beyond it.
+             west, south, east, north = backend.lonlat_bounds
+             folium.TileLayer(tiles=local_server.url_template(method), attr="Local Sentinel-2 stack",
+                              name=f"{method} (offline)", overlay=True, control=True,
+                              max_native_zoom=backend.native_zoom(), max_zoom=20,
+                              bounds=[[south, west], [north, east]]).add_to(m)
+             m.fit_bounds([[south, west], [north, east]])
 
         # 3. Field Markers
+        # Only the viewport the map last reported is sent, clustered on a grid
+        # (ground_truth.py), so the payload does not grow with the number of
+        # submissions. The layer goes in as a dynamic feature group: panning
+        # updates it without re-rendering the map.
+        ground_truth = None
         if 'field_service' in st.session_state and show_gt:
-            # We can use folium logic on the geemap object
-             for sub in st.session_state.field_service.submissions:
-                 folium.Marker([sub['lat'], sub['lon']], popup=sub['desc'], icon=folium.Icon(color="green")).add_to(m)
+             view = st.session_state.get("prospector_map") or {}
+             zoom = view.get("zoom") or 12
+             corners = view.get("bounds") or {}
+             if corners.get("_southWest") and corners.get("_northEast"):
+                 bounds = (corners["_southWest"]["lat"], corners["_southWest"]["lng"],
+                           corners["_northEast"]["lat"], corners["_northEast"]["lng"])
+             else:
+                 bounds = viewport_bounds(default_center[0], default_center[1], zoom)
+
+             ground_truth = folium.FeatureGroup(name="Ground Truth")
+             for feature in st.session_state.field_service.viewport(bounds, zoom)["features"]:
+                 lon, lat = feature["geometry"]["coordinates"]
+                 props = feature["properties"]
+                 if props.get("cluster"):
+                     folium.Marker([lat, lon], tooltip=f"{props['count']} field points (zoom in)",
+                                   icon=folium.DivIcon(html=f"<div class='gt-cluster'>{props['count']}</div>",
+                                                       icon_size=(34, 34), icon_anchor=(17, 17))).add_to(ground_truth)
+                 else:
+                     folium.Marker([lat, lon], popup=props.get('desc'), icon=folium.Icon(color="green")).add_to(ground_truth)
 
         # RENDER MAP
-        m.to_streamlit(height=850)
+        st_folium(m, height=850, use_container_width=True, key="prospector_map",
+                  feature_group_to_add=ground_truth, returned_objects=["bounds", "zoom"])
 
         # --- FLOATING ACTION BUTTON ---
         with st.expander("📝 Log Field Observation", expanded=False):
@@ -0,0 +1,179 @@
+"""
+Local evaluator for Earth Engine style band-math expressions.
+
+Parses the same syntax the prospector passes to `img.expression(...)` in
+app.py -- `b('B4') / b('B2')`, or named variables bound through a dict as in
+`'((NIR - RED) / (NIR + RED + L)) * (1 + L)'` -- and compiles it into an
+index-graph node that BandMath evaluates as one fused, chunked pass over
+local band arrays.
+"""
+import ast
+import functools
+import numpy as np
+
+from index_graph import IndexGraph, LEAVES, OPERATIONS, band, const, node_bands
+from band_math import BandMath, DEFAULT_DTYPE
+
+BINARY_OPS = {
+    ast.Add: 'add',
+    ast.Sub: 'subtract',
+    ast.Mult: 'multiply',
+    ast.Div: 'divide',
+    ast.Pow: 'power',
+}
+
+COMPARE_OPS = {
+    ast.Gt: 'gt',
+    ast.GtE: 'gte',
+    ast.Lt: 'lt',
+    ast.LtE: 'lte',
+    ast.Eq: 'eq',
+    ast.NotEq: 'neq',
+}
+
+# Functions available inside expressions, with their argument count.
+FUNCTIONS = {
+    'abs': 1, 'sqrt': 1, 'exp': 1, 'log': 1, 'log10': 1,
+    'min': 2, 'max': 2,
+}
+
+# The analysis menu of the prospector page, as local expressions.
+PROSPECTOR_EXPRESSIONS = {
+    'NDVI': ("(b('B8') - b('B4')) / (b('B8') + b('B4'))", None),
+    'Iron Oxide': ("b('B4') / b('B2')", None),
+    'Ferrous Iron': ("b('B11') / b('B8')", None),
+    'Clay Minerals': ("b('B11') / b('B12')", None),
+    'Gossan Zone': ("b('B4') / b('B2') + b('B11') / b('B12')", None),
+    'SAVI': ('((NIR - RED) / (NIR + RED + L)) * (1 + L)', {'NIR': 'B8', 'RED': 'B4', 'L': 0.5}),
+    'Moisture Index': ("(b('B8') - b('B11')) / (b('B8') + b('B11'))", None),
+}
+
+
+def _compile(tree):
+    if isinstance(tree, ast.Expression):
+        return _compile(tree.body)
+
+    if isinstance(tree, ast.Constant) and isinstance(tree.value, (int, float)) and not isinstance(tree.value, bool):
+        return const(tree.value)
+
+    if isinstance(tree, ast.Name):
+        return ('var', tree.id)
+
+    if isinstance(tree, ast.BinOp) and type(tree.op) in BINARY_OPS:
+        return (BINARY_OPS[type(tree.op)], _compile(tree.left), _compile(tree.right))
+
+    if isinstance(tree, ast.UnaryOp) and isinstance(tree.op, (ast.USub, ast.UAdd)):
+        operand = _compile(tree.operand)
+        return ('negative', operand) if isinstance(tree.op, ast.USub) else operand
+
+    if isinstance(tree, ast.Compare) and len(tree.ops) == 1 and type(tree.ops[0]) in COMPARE_OPS:
+        return (COMPARE_OPS[type(tree.ops[0])], _compile(tree.left), _compile(tree.comparators[0]))
+
+    if isinstance(tree, ast.Call) and isinstance(tree.func, ast.Name) and not tree.keywords:
+        name = tree.func.id
+        if name == 'b' and len(tree.args) == 1 and isinstance(tree.args[0], ast.Constant):
+            selector = tree.args[0].value
+            if isinstance(selector, str):
+                return band(selector)
+            if isinstance(selector, int):
+                return ('band_index', selector)
+        if FUNCTIONS.get(name) == len(tree.args):
+            return (name,) + tuple(_compile(arg) for arg in tree.args)
+
+    raise ValueError(f"Unsupported expression syntax: {ast.dump(tree)}")
+
+
+@functools.lru_cache(maxsize=256)
+def compile_expression(text):
+    """
+    Parses an expression into an unbound node tree. Compiled trees are cached
+    by expression text.
+
+    Variables are left as ('var', name) leaves and `b(<index>)` as
+    ('band_index', index); bind() resolves both.
+    """
+    try:
+        tree = ast.parse(text.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"Could not parse expression {text!r}: {e}") from e
+    return _compile(tree)
+
+
+def bind(node, variables=None, band_order=None):
+    """
+    Substitutes variables and folds constant sub-expressions.
+
+    Args:
+        node (tuple): Output of compile_expression().
+        variables (dict): Name -> band name (str), number, or array. Arrays are
+            read as extra bands under the variable's name.
+        band_order (sequence): Band names by position, for `b(<index>)`.
+
+    Returns:
+        tuple: (bound node, dict of extra arrays to add to the bands)
+    """
+    variables = variables or {}
+    extra = {}
+
+    def resolve(n):
+        kind = n[0]
+        if kind == 'var':
+            if n[1] not in variables:
+                raise ValueError(f"Expression variable {n[1]!r} is not defined.")
+            value = variables[n[1]]
+            if isinstance(value, str):
+                return band(value)
+            if isinstance(value, np.ndarray):
+                extra[n[1]] = value
+                return band(n[1])
+            return const(value)
+        if kind == 'band_index':
+            if band_order is None or not 0 <= n[1] < len(band_order):
+                raise ValueError(f"b({n[1]}) needs a band_order with at least {n[1] + 1} bands.")
+            return band(band_order[n[1]])
+        if kind in LEAVES:
+            return n
+
+        args = tuple(resolve(arg) for arg in n[1:])
+        if all(arg[0] == 'const' for arg in args):
+            if kind == 'divide':
+                value = args[0][1] / args[1][1] if args[1][1] != 0 else 0.0
+            else:
+                value = OPERATIONS[kind](*[arg[1] for arg in args])
+            return const(value)
+        return (kind,) + args
+
+    bound = resolve(node)
+    if bound[0] in LEAVES:
+        # A bare band or number still needs one operation to land in the output buffer.
+        bound = ('multiply', bound, const(1))
+    return bound, extra
+
+
+def evaluate_expression(text, bands, variables=None, dtype=DEFAULT_DTYPE, out=None, band_order=None):
+    """
+    Evaluates an Earth Engine style expression over local band arrays.
+
+    Division follows Sentinel2Indices: x/0 and other non-finite results are 0
+    (Earth Engine masks them instead), and arithmetic runs in `dtype` rather
+    than Earth Engine's integer-preserving rules.
+
+    Args:
+        text (str): Expression, e.g. "b('B4') / b('B2')".
+        bands (dict): Band name -> array.
+        variables (dict): Named variables, as for Earth Engine's expression map.
+        dtype: Output dtype policy (float32 by default).
+        out (ndarray): Optional preallocated output.
+        band_order (sequence): Band names by position, for `b(<index>)`.
+
+    Returns:
+        ndarray: The evaluated expression.
+    """
+    node, extra = bind(compile_expression(text), variables, band_order)
+    if extra:
+        bands = dict(bands, **extra)
+    missing = node_bands(node) - set(bands)
+    if missing:
+        raise KeyError(f"Expression needs bands that are not loaded: {', '.join(sorted(missing))}")
+    math = BandMath(IndexGraph({'result': node}), dtype=dtype)
+    return math.evaluate(bands, ['result'], {'result': out} if out is not None else None)['result']
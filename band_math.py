@@ -0,0 +1,144 @@
+import numpy as np
+from index_graph import IndexGraph, node_bands
+
+DEFAULT_DTYPE = 'float32'
+
+# Rows are processed in chunks of about this many pixels, so the cast bands,
+# intermediates and zero-denominator masks of a chunk stay in cache instead of
+# becoming full-size temporaries.
+CHUNK_PIXELS = 1 << 16
+
+
+def safe_divide(numerator, denominator, out=None, mask=None):
+    """
+    numerator / denominator with non-finite results (x/0, 0/0, NaN nodata)
+    set to 0. With `out` the quotient is written in place; `mask` is a
+    boolean scratch buffer of the result's shape that, when given, replaces
+    the one temporary (the non-finite mask) this needs.
+    """
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        result = np.divide(numerator, denominator, out=out)
+    if mask is None or mask.shape != result.shape:
+        mask = np.isfinite(result)
+    else:
+        np.isfinite(result, out=mask)
+    np.logical_not(mask, out=mask)
+    np.copyto(result, 0, where=mask)
+    return result
+
+
+class BandMath:
+    """
+    Evaluates index expressions chunk by chunk in a fixed output dtype,
+    writing results straight into (optionally caller-supplied) output buffers.
+
+    The only full-size arrays are the outputs; band casts, intermediates and
+    the nodata handling of each divide live in small per-chunk scratch buffers
+    that are reused from chunk to chunk.
+    """
+
+    def __init__(self, graph=None, dtype=DEFAULT_DTYPE, chunk_pixels=CHUNK_PIXELS):
+        """
+        Args:
+            graph (IndexGraph): Expressions to evaluate (default: the Sentinel-2 indices).
+            dtype: Output dtype policy; bands are cast to it before any arithmetic.
+            chunk_pixels (int): Approximate pixels per chunk.
+        """
+        self.graph = graph or IndexGraph()
+        self.dtype = np.dtype(dtype)
+        if self.dtype.kind != 'f':
+            raise ValueError(f"Output dtype must be a floating point type, got {self.dtype}.")
+        self.chunk_pixels = chunk_pixels
+
+    def allocate(self, shape, names, out=None):
+        """
+        Output buffer for each name. Caller buffers in `out` are used as given;
+        names without one get a new array (shared between aliases of the same
+        expression).
+        """
+        out = dict(out or {})
+        targets = {}
+        for name, buf in out.items():
+            if buf.shape != tuple(shape):
+                raise ValueError(f"Output buffer for {name} has shape {buf.shape}, expected {tuple(shape)}.")
+            if name in self.graph.outputs:
+                targets.setdefault(self.graph.outputs[name], buf)
+        for name in names:
+            if name not in out:
+                node = self.graph.outputs[name]
+                if node not in targets:
+                    targets[node] = np.empty(shape, dtype=self.dtype)
+                out[name] = targets[node]
+        return {name: out[name] for name in names}
+
+    def evaluate(self, bands, names, out=None):
+        """
+        Evaluates the named expressions over full bands.
+
+        Returns:
+            dict: Name -> output array (the caller's buffer where one was given).
+        """
+        if not bands:
+            raise ValueError("No bands given to take the output shape from.")
+        names = [n for n in names if node_bands(self.graph.outputs[n]) <= set(bands)]
+        shape = next(iter(bands.values())).shape
+        out = self.allocate(shape, names, out)
+        self.evaluate_rows(bands, names, out, slice(0, shape[0]))
+        return out
+
+    def evaluate_rows(self, bands, names, out, rows):
+        """Fills out[name][rows] for every name, one chunk of rows at a time."""
+        needed = set()
+        for name in names:
+            needed |= node_bands(self.graph.outputs[name])
+        # Constant-only expressions use no band; any band gives the shape and
+        # the constant is broadcast into it.
+        if needed:
+            sample = bands[next(iter(needed))]
+        elif bands:
+            sample = next(iter(bands.values()))
+        else:
+            raise ValueError("No bands given to take the output shape from.")
+        row_pixels = int(np.prod(sample.shape[1:], dtype=np.int64)) or 1
+        step = max(1, self.chunk_pixels // row_pixels)
+        chunk_shape = (step,) + sample.shape[1:]
+
+        # Output nodes write straight into the first output buffer that holds them.
+        primary = {}
+        for name in names:
+            primary.setdefault(self.graph.outputs[name], name)
+
+        casts = {}
+        scratch = {}
+        invalid = np.empty(chunk_shape, dtype=bool)
+        for start in range(rows.start, rows.stop, step):
+            stop = min(start + step, rows.stop)
+            n = stop - start
+
+            def divide(numerator, denominator, out=None):
+                return safe_divide(numerator, denominator, out=out, mask=invalid[:n])
+
+            chunk = {}
+            for b in needed:
+                src = bands[b][start:stop]
+                if src.dtype == self.dtype:
+                    chunk[b] = src
+                else:
+                    if b not in casts:
+                        casts[b] = np.empty(chunk_shape, dtype=self.dtype)
+                    chunk[b] = casts[b][:n]
+                    np.copyto(chunk[b], src, casting='unsafe')
+
+            def buffer(node):
+                if node in primary:
+                    target = out[primary[node]][start:stop]
+                    if target.dtype == self.dtype:
+                        return target
+                if node not in scratch:
+                    scratch[node] = np.empty(chunk_shape, dtype=self.dtype)
+                return scratch[node][:n]
+
+            for name, value in self.graph.iter_evaluate(chunk, names, divide, buffers=buffer):
+                target = out[name][start:stop]
+                if not np.may_share_memory(target, value):
+                    np.copyto(target, value, casting='unsafe')
@@ -0,0 +1,280 @@
+"""
+Benchmark harness for the Sentinel-2 index pipeline.
+
+Times every calculate_* method, calculate_all, compute and detect_lineaments
+on seeded synthetic scenes (synthetic_scene.SyntheticScene) across raster
+sizes and input dtypes, and records throughput and memory per case:
+
+- mpix_per_s: megapixels per second of the best repeat.
+- peak_rss_mb / rss_growth_mb: process RSS high-water mark during the case,
+  sampled from /proc, and its growth over the RSS before the case started.
+- peak_traced_mb: peak of NumPy/Python allocations traced by tracemalloc.
+- page_faults: minor page faults of one run. Every fresh full-size temporary
+  faults in all of its pages, so this tracks allocation churn.
+
+Results are written as JSON; compare() flags cases that got slower or used
+more memory than a stored baseline by more than a threshold.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import threading
+import tracemalloc
+import statistics
+import numpy as np
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+from mineral_indices import Sentinel2Indices
+from synthetic_scene import SyntheticScene
+
+DEFAULT_SIZES = (512, 1024, 2048)
+DEFAULT_DTYPES = ('int16', 'float32', 'float64')
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.10
+RSS_SAMPLE_SECONDS = 0.002
+
+# Metrics compared against a baseline, and whether higher is better.
+COMPARED_METRICS = {
+    'mpix_per_s': True,
+    'rss_growth_mb': False,
+    'peak_traced_mb': False,
+}
+# Memory deltas smaller than this are noise, not regressions.
+MEMORY_NOISE_MB = 1.0
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+def _page_faults():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_minflt if HAS_RESOURCE else 0
+
+
+class RSSMonitor:
+    """Samples the process RSS on a background thread and keeps the peak."""
+
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.start_bytes = 0
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start_bytes = self.peak_bytes = _rss_bytes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, _rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, _rss_bytes())
+
+
+def benchmark_cases():
+    """Case name -> function(calc) running it, for every method under test."""
+    cases = {}
+    for method in Sentinel2Indices.INDEX_METHODS.values():
+        if method.startswith('calculate_'):
+            cases[method] = lambda calc, m=method: getattr(calc, m)()
+    cases['calculate_all'] = lambda calc: calc.calculate_all()
+    cases['compute'] = lambda calc: calc.compute()
+    cases['detect_lineaments'] = lambda calc: calc.detect_lineaments()
+    return cases
+
+
+def make_bands(size, dtype, seed=0):
+    """Seeded size x size scene cast to `dtype` (reflectance x 10000 for integers)."""
+    scene = SyntheticScene(size, size, seed=seed, tile_size=min(1024, size))
+    bands = scene.read()
+    if np.dtype(dtype).kind == 'f':
+        return {b: (v / 10000.0).astype(dtype) for b, v in bands.items()}
+    return {b: v.astype(dtype) for b, v in bands.items()}
+
+
+def measure(fn, calc, pixels, repeat=DEFAULT_REPEAT):
+    """
+    Runs one case `repeat` times for timing, then once each under the RSS
+    monitor and under tracemalloc.
+
+    Returns:
+        dict: Timing and memory metrics of the case.
+    """
+    fn(calc)  # warm-up: imports, lazy initialisation, first-touch of the inputs
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(calc)
+        times.append(time.perf_counter() - start)
+        del result
+
+    faults_before = _page_faults()
+    with RSSMonitor() as rss:
+        result = fn(calc)
+    faults = _page_faults() - faults_before
+    del result
+
+    tracemalloc.start()
+    result = fn(calc)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    best = min(times)
+    return {
+        'seconds_best': best,
+        'seconds_median': statistics.median(times),
+        'mpix_per_s': pixels / 1e6 / best if best > 0 else float('inf'),
+        'peak_rss_mb': rss.peak_bytes / 2 ** 20,
+        'rss_growth_mb': (rss.peak_bytes - rss.start_bytes) / 2 ** 20,
+        'peak_traced_mb': traced_peak / 2 ** 20,
+        'page_faults': faults,
+    }
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, dtypes=DEFAULT_DTYPES, cases=None, repeat=DEFAULT_REPEAT,
+                   seed=0, verbose=True):
+    """
+    Benchmarks every case on every (size, dtype) scene.
+
+    Args:
+        sizes (sequence): Square scene edges in pixels.
+        dtypes (sequence): Input band dtypes.
+        cases (sequence): Case names to run (default: all of benchmark_cases()).
+        repeat (int): Timed repeats per case; the best one sets mpix_per_s.
+        seed (int): Synthetic scene seed.
+
+    Returns:
+        dict: {'meta': {...}, 'results': [...]}, ready for json.dump.
+    """
+    available = benchmark_cases()
+    selected = list(cases or available)
+    unknown = [c for c in selected if c not in available]
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases: {', '.join(unknown)}")
+
+    results = []
+    for size in sizes:
+        for dtype in dtypes:
+            calc = Sentinel2Indices(make_bands(size, dtype, seed))
+            for case in selected:
+                row = {'case': case, 'size': size, 'dtype': str(np.dtype(dtype)), 'megapixels': size * size / 1e6}
+                row.update(measure(available[case], calc, size * size, repeat))
+                results.append(row)
+                if verbose:
+                    print(f"{case:24s} {size:6d} {row['dtype']:8s} {row['mpix_per_s']:9.1f} MP/s "
+                          f"{row['rss_growth_mb']:8.1f} MB rss {row['peak_traced_mb']:8.1f} MB traced "
+                          f"{row['page_faults']:8d} faults")
+            del calc
+
+    return {'meta': environment(repeat, seed), 'results': results}
+
+
+def environment(repeat=DEFAULT_REPEAT, seed=0):
+    """Where and how the numbers were taken."""
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'seed': seed,
+    }
+
+
+def _key(row):
+    return (row['case'], row['size'], row['dtype'])
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compares a run against a baseline run.
+
+    A case regresses when its throughput drops, or its memory grows, by more
+    than `threshold` (a fraction) relative to the baseline.
+
+    Returns:
+        list: One dict per regression with case, metric, baseline, current and change.
+    """
+    previous = {_key(row): row for row in baseline['results']}
+    regressions = []
+    for row in current['results']:
+        base = previous.get(_key(row))
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = base.get(metric), row.get(metric)
+            if old is None or new is None:
+                continue
+            if higher_is_better:
+                change = (new - old) / old if old else 0.0
+                regressed = change < -threshold
+            else:
+                change = (new - old) / old if old > MEMORY_NOISE_MB else 0.0
+                regressed = change > threshold and new - old > MEMORY_NOISE_MB
+            if regressed:
+                regressions.append({
+                    'case': row['case'], 'size': row['size'], 'dtype': row['dtype'],
+                    'metric': metric, 'baseline': old, 'current': new, 'change': change,
+                })
+    return regressions
+
+
+def save(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the Sentinel-2 index pipeline.")
+    parser.add_argument("--sizes", type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument("--dtypes", nargs='+', default=list(DEFAULT_DTYPES))
+    parser.add_argument("--cases", nargs='+', help="Subset of cases (default: all)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json", help="JSON file for this run")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed relative slowdown / memory growth (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.dtypes, args.cases, args.repeat, args.seed)
+    save(report, args.output)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        regressions = compare(report, load(args.baseline), args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['case']} {r['size']} {r['dtype']}: {r['metric']} "
+                  f"{r['baseline']:.2f} -> {r['current']:.2f} ({r['change']:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
@@ -0,0 +1,342 @@
+"""
+Distance-to-structure raster: the Euclidean distance, in metres, from every
+pixel to the nearest lineament pixel of Sentinel2Indices.detect_lineaments()
+(or of the lineament GeoTIFF written by TiledIndexEngine). The output is on
+the scene's grid, so it plugs into the model feature stack as the
+'fault_distance' aux raster of ProspectivityMapper.
+
+The transform is exact and separable (Felzenszwalb-Huttenlocher):
+
+1. Column pass: every pixel's vertical distance to the nearest feature in its
+   column, from a top-down and a bottom-up scan over row strips that carry the
+   last feature row across strip seams. Column blocks run in parallel.
+2. Row pass: for each row, the lower envelope of the parabolas
+   (x - x')^2 + g(x')^2, built with one vectorised sweep over the columns for
+   all rows of a strip at once. Row strips run in parallel.
+
+Pass 1 sees whole columns and pass 2 whole rows, so there are no seams to
+fix up. The intermediate column distances go to a temporary memory-mapped
+file, and memory stays bounded by the strip budget.
+"""
+import os
+import math
+import shutil
+import tempfile
+from functools import partial
+import numpy as np
+
+try:
+    import rasterio
+    from rasterio.windows import Window
+    HAS_RASTERIO = True
+except ImportError:
+    HAS_RASTERIO = False
+
+from parallel_tiles import TileExecutor, row_strips
+from tiled_indices import DEFAULT_BAND_ORDER, STRUCTURE_INDEX, TiledIndexEngine, read_window, _close_datasets
+
+NODATA = -1.0
+
+# Bytes per pixel of a column-pass strip: the edge read, the float64 nearest
+# feature rows and their distances.
+COLUMN_PASS_BYTES_PER_PIXEL = 24
+
+# Bytes per pixel of a row-pass strip: the squared column distances and the
+# envelope boundaries (float64), envelope vertices (int32) and the output.
+ROW_PASS_BYTES_PER_PIXEL = 24
+
+# Mean Earth radius based metres per degree, for geographic grids.
+METRES_PER_DEGREE = 111_195.0
+
+
+def pixel_size_metres(transform, crs=None, height=None):
+    """
+    (x, y) pixel size in metres of a north-up grid. Geographic grids are
+    converted at the latitude of the raster's centre row.
+    """
+    sx, sy = abs(transform.a), abs(transform.e)
+    if crs is not None and getattr(crs, 'is_geographic', False):
+        row = (height or 0) / 2.0
+        latitude = transform.f + transform.e * row
+        return sx * METRES_PER_DEGREE * math.cos(math.radians(latitude)), sy * METRES_PER_DEGREE
+    return sx, sy
+
+
+def _column_pass(read, g, shape, sy, strips, cols):
+    """
+    Vertical distance (metres) to the nearest feature in each column of
+    `cols`, written into g. Features are the non-zero pixels of read().
+    """
+    width = cols.stop - cols.start
+    last = np.full(width, -np.inf)
+    for rows in strips:
+        r = np.arange(rows.start, rows.stop, dtype=np.float64)[:, np.newaxis]
+        nearest = np.where(read(rows, cols) > 0, r, -np.inf)
+        nearest[0] = np.maximum(nearest[0], last)
+        np.maximum.accumulate(nearest, axis=0, out=nearest)
+        last = nearest[-1].copy()
+        g[rows, cols] = (r - nearest) * sy
+
+    following = np.full(width, np.inf)
+    for rows in reversed(strips):
+        r = np.arange(rows.start, rows.stop, dtype=np.float64)[:, np.newaxis]
+        above = g[rows, cols]
+        nearest = np.where(above == 0, r, np.inf)
+        nearest[-1] = np.minimum(nearest[-1], following)
+        nearest = np.minimum.accumulate(nearest[::-1], axis=0)[::-1]
+        following = nearest[0].copy()
+        g[rows, cols] = np.minimum(above, (nearest - r) * sy)
+
+
+def envelope_distances(g, sx):
+    """
+    Row pass: exact distance to the nearest feature given each pixel's
+    vertical distance g (inf where the column has no feature).
+
+    Args:
+        g (ndarray): (rows, width) vertical distances in metres.
+        sx (float): Pixel width in metres.
+
+    Returns:
+        ndarray: float64 (rows, width) distances, inf for rows that see no feature.
+    """
+    f = np.asarray(g, dtype=np.float64) ** 2
+    n, width = f.shape
+    x = np.arange(width) * sx
+    # Parabola q of a row is x^2 - 2 x x_q + (x_q^2 + f_q); h holds x_q^2 + f_q.
+    h = f + x * x
+
+    v = np.zeros((n, width), dtype=np.int32)
+    z = np.empty((n, width + 1))
+    z[:, 0] = -np.inf
+    z[:, 1] = np.inf
+    k = np.full(n, -1, dtype=np.int64)
+
+    for q in range(width):
+        rows = np.flatnonzero(np.isfinite(f[:, q]))
+        if rows.size == 0:
+            continue
+        s = np.full(rows.size, -np.inf)
+        pending = np.flatnonzero(k[rows] >= 0)
+        # Drop envelope parabolas that the new one hides, all rows at once.
+        while pending.size:
+            r = rows[pending]
+            top = k[r]
+            vk = v[r, top]
+            s[pending] = (h[r, q] - h[r, vk]) / (2.0 * (x[q] - x[vk]))
+            hidden = s[pending] <= z[r, top]
+            if not hidden.any():
+                break
+            k[r[hidden]] -= 1
+            pending = pending[hidden]
+        top = k[rows] + 1
+        k[rows] = top
+        v[rows, top] = q
+        z[rows, top] = np.where(top == 0, -np.inf, s)
+        z[rows, top + 1] = np.inf
+
+    out = np.empty((n, width))
+    everything = np.arange(n)
+    k = np.zeros(n, dtype=np.int64)
+    for q in range(width):
+        behind = np.flatnonzero(z[everything, k + 1] < x[q])
+        while behind.size:
+            k[behind] += 1
+            behind = behind[z[behind, k[behind] + 1] < x[q]]
+        vk = v[everything, k]
+        out[:, q] = (x[q] - x[vk]) ** 2 + f[everything, vk]
+    np.sqrt(out, out=out)
+    return out
+
+
+def _row_pass(g_path, shape, sx, rows):
+    """Distances of one row strip. Module-level so it can run on a process pool."""
+    g = np.memmap(g_path, dtype=np.float32, mode='r', shape=shape)
+    distances = envelope_distances(g[rows], sx)
+    distances[~np.isfinite(distances)] = NODATA
+    return rows, distances.astype(np.float32)
+
+
+class DistanceTransform:
+    """
+    Tiled exact Euclidean distance transform of a binary raster accessed
+    through a `read(rows, cols)` callable, like LineamentDetector.
+    """
+
+    def __init__(self, pixel_size=(1.0, 1.0), tile_budget_mb=256, workers=1, kind='process'):
+        """
+        Args:
+            pixel_size (tuple): (x, y) pixel size in metres.
+            tile_budget_mb (float): Memory the strips in flight may use together.
+            workers (int): Strips processed in parallel (None = all cores).
+            kind (str): Pool for the row pass, whose column sweep holds the GIL:
+                'process' (default) or 'thread'. The column pass uses threads.
+        """
+        self.sx, self.sy = float(pixel_size[0]), float(pixel_size[1])
+        self.tile_budget_mb = tile_budget_mb
+        self.executor = TileExecutor(workers, kind)
+        self.column_executor = TileExecutor(workers, 'thread')
+
+    def _strip_rows(self, width, bytes_per_pixel):
+        in_flight = self.executor.max_pending if self.executor.workers > 1 else 1
+        pixels = self.tile_budget_mb * 1024 * 1024 / in_flight / bytes_per_pixel
+        return max(1, int(pixels // max(1, width)))
+
+    def run(self, read, shape, write):
+        """
+        Runs the transform and hands every finished strip to
+        `write(rows, cols, distances)`, top to bottom.
+
+        Returns:
+            bool: False if the raster has no feature pixels (nothing is written).
+        """
+        height, width = shape
+        workdir = tempfile.mkdtemp(prefix='fault_distance_')
+        try:
+            g_path = os.path.join(workdir, 'column_distance.f32')
+            g = np.memmap(g_path, dtype=np.float32, mode='w+', shape=shape)
+
+            # Pass 1: whole columns, in blocks of columns, read down row strips.
+            n_blocks = max(1, min(self.column_executor.workers * 4, width // 64))
+            blocks = row_strips(width, n_blocks)
+            strip_rows = self._strip_rows(blocks[0].stop - blocks[0].start, COLUMN_PASS_BYTES_PER_PIXEL)
+            strips = [slice(r, min(r + strip_rows, height)) for r in range(0, height, strip_rows)]
+            self.column_executor.run(partial(_column_pass, read, g, shape, self.sy, strips), blocks)
+            if not np.isfinite(g[0]).any():
+                return False
+            g.flush()
+
+            # Pass 2: whole rows, in strips of rows.
+            strip_rows = self._strip_rows(width, ROW_PASS_BYTES_PER_PIXEL)
+            strips = [slice(r, min(r + strip_rows, height)) for r in range(0, height, strip_rows)]
+            # Smaller strips keep every worker busy.
+            if len(strips) < 4 * self.executor.workers:
+                strips = row_strips(height, 4 * self.executor.workers)
+            full_width = slice(0, width)
+            for rows, distances in self.executor.imap(partial(_row_pass, g_path, shape, self.sx), strips):
+                write(rows, full_width, distances)
+            del g
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return True
+
+    def run_array(self, features):
+        """Distance transform of an in-memory binary array, as float32 metres."""
+        distances = np.full(features.shape, NODATA, dtype=np.float32)
+
+        def write(rows, cols, tile):
+            distances[rows, cols] = tile
+
+        self.run(lambda rows, cols: features[rows, cols], features.shape, write)
+        return distances
+
+
+def distance_to_lineaments(edges, pixel_size=(20.0, 20.0), workers=1):
+    """
+    Distance in metres from every pixel to the nearest lineament pixel.
+
+    Args:
+        edges (ndarray): Output of Sentinel2Indices.detect_lineaments() (non-zero = lineament).
+        pixel_size (tuple): (x, y) pixel size in metres (Sentinel-2 SWIR: 20 m).
+        workers (int): Parallel workers (None = all cores).
+
+    Returns:
+        ndarray: float32 distances; NODATA everywhere if there are no lineaments.
+    """
+    return DistanceTransform(pixel_size, workers=workers, kind='thread').run_array(edges)
+
+
+class FaultDistanceRaster:
+    """
+    Writes a georeferenced distance-to-structure GeoTIFF from a lineament
+    raster (non-zero pixels are structures).
+    """
+
+    def __init__(self, lineaments_path, tile_budget_mb=256, workers=1, kind='process'):
+        """
+        Args:
+            lineaments_path (str): Single-band lineament GeoTIFF, e.g. the
+                geological_structures_lineaments.tif of TiledIndexEngine.
+            tile_budget_mb (float): Memory the strips in flight may use together.
+            workers (int): Parallel workers (None = all cores).
+            kind (str): 'process' or 'thread' pool for the row pass.
+        """
+        if not HAS_RASTERIO:
+            raise ImportError("rasterio is required for distance rasters.")
+        self.path = lineaments_path
+        self.tile_budget_mb = tile_budget_mb
+        self.workers = workers
+        self.kind = kind
+
+    def run(self, output_path):
+        """
+        Returns:
+            str: output_path, or None if the raster has no lineaments.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with rasterio.open(self.path) as src:
+            shape = (src.height, src.width)
+            pixel_size = pixel_size_metres(src.transform, src.crs, src.height)
+            profile = src.profile.copy()
+        profile.update(
+            driver='GTiff', count=1, dtype='float32', nodata=NODATA,
+            tiled=True, blockxsize=256, blockysize=256,
+            compress='deflate', predictor=3, BIGTIFF='IF_SAFER',
+        )
+        profile.pop('photometric', None)
+
+        transform = DistanceTransform(pixel_size, self.tile_budget_mb, self.workers, self.kind)
+        read = partial(read_window, self.path, 1, None)
+        cache_mb = max(16, int(self.tile_budget_mb // 4))
+        try:
+            with rasterio.Env(GDAL_CACHEMAX=cache_mb), rasterio.open(output_path, 'w', **profile) as dst:
+                dst.set_band_description(1, 'fault_distance_m')
+
+                def write(rows, cols, distances):
+                    dst.write(distances, 1, window=Window.from_slices(rows, cols))
+
+                found = transform.run(read, shape, write)
+        finally:
+            _close_datasets()
+        if not found:
+            print(f"Warning: No lineaments in {self.path}; {output_path} holds only nodata.")
+            return None
+        return output_path
+
+
+def scene_fault_distance(scene_path, output_path, band_order=DEFAULT_BAND_ORDER, tile_budget_mb=256, workers=1):
+    """
+    Detects lineaments in a Sentinel-2 scene (tiled Canny on B11) and writes
+    the distance-to-structure raster for it.
+
+    Returns:
+        str: output_path, or None if no lineaments were found.
+    """
+    directory = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(directory, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix='lineaments_', dir=directory)
+    try:
+        engine = TiledIndexEngine(scene_path, band_order, tile_budget_mb, indices=[STRUCTURE_INDEX], workers=workers)
+        lineaments = engine.run(workdir)[STRUCTURE_INDEX]
+        return FaultDistanceRaster(lineaments, tile_budget_mb, workers).run(output_path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Distance-to-structure raster from detected lineaments.")
+    parser.add_argument("raster", help="Multi-band Sentinel-2 GeoTIFF, or a lineament GeoTIFF with --lineaments")
+    parser.add_argument("output", help="Distance GeoTIFF to write (metres)")
+    parser.add_argument("--lineaments", action="store_true", help="The input is already a lineament raster")
+    parser.add_argument("--tile-budget-mb", type=float, default=256)
+    parser.add_argument("--workers", type=int, default=1, help="0 = all cores")
+    args = parser.parse_args()
+
+    if args.lineaments:
+        result = FaultDistanceRaster(args.raster, args.tile_budget_mb, args.workers or None).run(args.output)
+    else:
+        result = scene_fault_distance(args.raster, args.output, tile_budget_mb=args.tile_budget_mb,
+                                      workers=args.workers or None)
+    print(result)
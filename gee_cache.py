@@ -0,0 +1,365 @@
+"""
+Process-wide caches for the Earth Engine round trips of the prospector page:
+scene searches (SceneSearch) and analysis layer map tokens (LayerCache).
+
+Streamlit reruns app.py on every widget interaction and every session runs
+it separately, but imported modules live for the whole server process, so a
+cache held here is shared by all reruns and all users.
+
+TTLCache serves an entry as fresh for `ttl` seconds, then for `stale_ttl`
+seconds more as stale while one background refresh replaces it, and only
+after that blocks on a new load. Concurrent loads of the same key are
+collapsed into one (single flight). The `ee` module is passed in, so the
+caches run against mock_services.FakeEarthEngine as well as the real API.
+"""
+import time
+import datetime
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+SCENE_COLLECTION = 'COPERNICUS/S2_SR_HARMONIZED'
+
+# Scene lists change when a new acquisition is ingested, a few times a week.
+SCENE_TTL = 15 * 60
+SCENE_STALE_TTL = 6 * 60 * 60
+
+# Map IDs from getMapId() expire after some hours; tokens are renewed well
+# before that, and a stale one is only served while its renewal is running.
+MAP_TOKEN_TTL = 2 * 60 * 60
+MAP_TOKEN_STALE_TTL = 60 * 60
+
+# A scene's footprint never changes.
+SCENE_CENTER_TTL = 24 * 60 * 60
+
+# Background refreshes running at once, per cache.
+REFRESH_WORKERS = 2
+
+TRUE_COLOR_VIS = {"bands": ['B4', 'B3', 'B2'], "min": 0, "max": 3000}
+
+# Visualisation parameters of the prospector analyses, shared with the
+# offline backend (local_tiles.py) so both render a method the same way.
+ANALYSIS_VIS = {
+    "True Color": TRUE_COLOR_VIS,
+    "NDVI": {"min": -0.2, "max": 0.8, "palette": ['red', 'yellow', 'green']},
+    "Iron Oxide": {"min": 1, "max": 3, "palette": ['blue', 'yellow', 'red']},
+    "Ferrous Iron": {"min": 0.5, "max": 2, "palette": ['blue', 'cyan', 'yellow', 'red']},
+    "Clay Minerals": {"min": 1, "max": 3, "palette": ['gray', 'yellow', 'orange']},
+    "Gossan Zone": {"min": 2, "max": 6, "palette": ['blue', 'green', 'yellow', 'red']},
+    "SAVI": {"min": -0.2, "max": 0.8, "palette": ['brown', 'yellow', 'green']},
+    "Moisture Index": {"min": -1, "max": 1, "palette": ['brown', 'white', 'blue']},
+}
+
+
+class TTLCache:
+    """
+    Thread-safe TTL cache with stale-while-revalidate and single-flight loads.
+    """
+
+    def __init__(self, ttl, stale_ttl=0.0, max_entries=256, clock=time.monotonic, refresh_workers=REFRESH_WORKERS):
+        """
+        Args:
+            ttl (float): Seconds an entry is served as fresh.
+            stale_ttl (float): Seconds after that it is still served while a
+                background refresh runs. 0 disables stale-while-revalidate.
+            max_entries (int): Least recently used entries beyond this are dropped.
+            clock (callable): Time source in seconds (injectable for testing).
+            refresh_workers (int): Background refresh threads.
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.refresh_workers = refresh_workers
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'loads': 0, 'errors': 0, 'joined': 0}
+
+    def get(self, key, load):
+        """
+        Returns the value for `key`, calling `load()` (at most once at a time
+        per key) when it is missing or expired.
+        """
+        with self._lock:
+            now = self.clock()
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, loaded_at = entry
+                age = now - loaded_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self.stats['stale_hits'] += 1
+                    if key not in self._inflight:
+                        future = self._inflight[key] = Future()
+                        self._refresh_pool().submit(self._load, key, load, future)
+                    return value
+
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self.stats['misses'] += 1
+            else:
+                self.stats['joined'] += 1
+
+        if owner:
+            self._load(key, load, future)
+        return future.result()
+
+    def _load(self, key, load, future):
+        try:
+            value = load()
+        except BaseException as e:
+            with self._lock:
+                self.stats['errors'] += 1
+                del self._inflight[key]
+            future.set_exception(e)
+            return
+        with self._lock:
+            self.stats['loads'] += 1
+            self._entries[key] = (value, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            del self._inflight[key]
+        future.set_result(value)
+
+    def _refresh_pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.refresh_workers, thread_name_prefix='ttl-refresh')
+        return self._executor
+
+    def prefetch(self, key, load):
+        """Starts a background load of `key` unless it is fresh or already loading."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[1] < self.ttl:
+                return False
+            if key in self._inflight:
+                return False
+            future = self._inflight[key] = Future()
+            self._refresh_pool().submit(self._load, key, load, future)
+            return True
+
+    def peek(self, key):
+        """The cached value for `key` (fresh or not), or None; never loads."""
+        with self._lock:
+            entry = self._entries.get(key)
+        return None if entry is None else entry[0]
+
+    def wait(self, key, timeout=None):
+        """Blocks until a load of `key` in progress (if any) has finished."""
+        with self._lock:
+            future = self._inflight.get(key)
+        if future is not None:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+
+    def invalidate(self, key=None):
+        """Drops one entry, or all of them."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+def _scene_record(feature):
+    """The scene card fields app.py shows for one ImageCollection feature."""
+    props = feature['properties']
+    return {
+        "date": datetime.datetime.fromtimestamp(props['system:time_start'] / 1000).strftime('%d %b %Y'),
+        "cloud": f"{props['CLOUDY_PIXEL_PERCENTAGE']:.1f}%",
+        "sensor": "Sentinel-2 L2A",
+        "id": feature['id'],
+        "ee_obj": feature,
+    }
+
+
+class SceneSearch:
+    """
+    Cached Sentinel-2 scene searches: the most recent scenes over a point,
+    within a date window and under a cloud threshold.
+    """
+
+    def __init__(self, ee, cache=None, collection=SCENE_COLLECTION):
+        """
+        Args:
+            ee: The Earth Engine module (or a stand-in with the same API).
+            cache (TTLCache): Result cache (default: SCENE_TTL / SCENE_STALE_TTL).
+            collection (str): Image collection to search.
+        """
+        self.ee = ee
+        self.cache = cache or TTLCache(SCENE_TTL, SCENE_STALE_TTL)
+        self.collection = collection
+
+    @staticmethod
+    def key(lon, lat, start, end, max_cloud, limit):
+        # ~1 m of rounding, so the same map centre always gives the same key.
+        return (round(float(lon), 5), round(float(lat), 5), start.isoformat(), end.isoformat(),
+                float(max_cloud), int(limit))
+
+    def window(self, days, today=None):
+        """
+        Day-aligned (start, end) of the last `days` days. The window only
+        moves at midnight, so reruns within a day share one cache key.
+        """
+        today = today or datetime.date.today()
+        return today - datetime.timedelta(days=days), today + datetime.timedelta(days=1)
+
+    def query(self, lon, lat, start, end, max_cloud, limit):
+        """Runs the search against Earth Engine (one getInfo round trip)."""
+        ee = self.ee
+        roi = ee.Geometry.Point([lon, lat])
+        collection = (ee.ImageCollection(self.collection)
+                      .filterBounds(roi)
+                      .filterDate(start.isoformat(), end.isoformat())
+                      .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', max_cloud))
+                      .sort('system:time_start', False)
+                      .limit(limit))
+        return [_scene_record(f) for f in collection.getInfo()['features']]
+
+    def search(self, lon, lat, days=30, max_cloud=20, limit=5, today=None):
+        """
+        Scenes over (lon, lat), newest first, from the cache when possible.
+
+        Returns:
+            list: Scene dicts with date, cloud, sensor, id and ee_obj.
+        """
+        start, end = self.window(days, today)
+        key = self.key(lon, lat, start, end, max_cloud, limit)
+        return self.cache.get(key, lambda: self.query(lon, lat, start, end, max_cloud, limit))
+
+
+def analysis_layer(ee, image_id, method, roi=None):
+    """
+    The processed image, visualisation parameters and layer name of one
+    prospector analysis of a Sentinel-2 scene.
+
+    Returns:
+        tuple: (ee.Image, vis_params dict, layer name)
+    """
+    img = ee.Image(image_id)
+    vis = ANALYSIS_VIS.get(method)
+    if method == "NDVI":
+        return img.normalizedDifference(['B8', 'B4']).rename('NDVI'), dict(vis), method
+    if method == "Iron Oxide":
+        # Red/Blue (B4 / B2) approx
+        return img.expression("b('B4') / b('B2')").rename('Iron_Oxide'), dict(vis), method
+    if method == "Ferrous Iron":
+        # SWIR1 / NIR (B11 / B8) approx
+        return img.expression("b('B11') / b('B8')").rename('Ferrous_Iron'), dict(vis), method
+    if method == "Clay Minerals":
+        # SWIR1 / SWIR2 (B11 / B12) approx
+        return img.expression("b('B11') / b('B12')").rename('Clay_Minerals'), dict(vis), method
+    if method == "Gossan Zone":
+        # Combination of Iron Oxide and Clay Minerals
+        iron_oxide = img.expression("b('B4') / b('B2')")
+        clay_minerals = img.expression("b('B11') / b('B12')")
+        return iron_oxide.add(clay_minerals).rename('Gossan_Index'), dict(vis), method
+    if method == "SAVI":
+        # SAVI = ((NIR - RED) / (NIR + RED + L)) * (1 + L) where L=0.5
+        savi = img.expression(
+            '((NIR - RED) / (NIR + RED + L)) * (1 + L)', {
+                'NIR': img.select('B8'),
+                'RED': img.select('B4'),
+                'L': ee.Number(0.5)
+            }).rename('SAVI')
+        return savi, dict(vis), method
+    if method == "Moisture Index":
+        # NDMI = (NIR - SWIR1) / (NIR + SWIR1)
+        return img.normalizedDifference(['B8', 'B11']).rename('NDMI'), dict(vis), method
+    if "AI" in method and roi is not None:
+        # Note: the *latest* WorldCover image, not tied to the selected S2 scene date/location
+        return ee.ImageCollection("ESA/WorldCover/v100").filterBounds(roi).first(), {"bands": ["Map"]}, "ESA WorldCover"
+    # True Color, and the analyses without an Earth Engine implementation yet.
+    return img, dict(TRUE_COLOR_VIS), method
+
+
+class LayerCache:
+    """
+    Cached map tokens (tile URL templates) of analysis layers, keyed by
+    (scene id, method, vis params). Switching back to an analysis already
+    viewed reuses its token instead of asking Earth Engine for a new map ID.
+    """
+
+    def __init__(self, ee, cache=None, centers=None):
+        """
+        Args:
+            ee: The Earth Engine module (or a stand-in with the same API).
+            cache (TTLCache): Token cache (default: MAP_TOKEN_TTL / MAP_TOKEN_STALE_TTL).
+            centers (TTLCache): Scene centre cache (default: SCENE_CENTER_TTL).
+        """
+        self.ee = ee
+        self.cache = cache or TTLCache(MAP_TOKEN_TTL, MAP_TOKEN_STALE_TTL)
+        self.centers = centers or TTLCache(SCENE_CENTER_TTL)
+
+    @staticmethod
+    def key(scene_id, method, vis_params):
+        # The roi of the WorldCover layer is not part of the key: the prospector
+        # page always passes the same point.
+        return scene_id, method, tuple(sorted((k, repr(v)) for k, v in vis_params.items()))
+
+    def _request(self, scene_id, method, roi):
+        image, vis_params, name = analysis_layer(self.ee, scene_id, method, roi)
+        map_id = image.getMapId(vis_params)
+        return {"url": map_id['tile_fetcher'].url_format, "name": name, "vis_params": vis_params,
+                "scene_id": scene_id, "method": method}
+
+    def _key_for(self, scene_id, method, roi):
+        # vis params and name are plain Python; building the image makes no round trip.
+        _, vis_params, _ = analysis_layer(self.ee, scene_id, method, roi)
+        return self.key(scene_id, method, vis_params)
+
+    def layer(self, scene_id, method, roi=None):
+        """
+        Returns:
+            dict: url (XYZ template), name, vis_params, scene_id and method.
+        """
+        return self.cache.get(self._key_for(scene_id, method, roi), lambda: self._request(scene_id, method, roi))
+
+    def prefetch(self, scene_id, method, roi=None):
+        """Requests the layer's map token in the background (no-op if cached or loading)."""
+        return self.cache.prefetch(self._key_for(scene_id, method, roi),
+                                   lambda: self._request(scene_id, method, roi))
+
+    def center(self, scene_id):
+        """(lon, lat) of the scene footprint's centroid."""
+        def load():
+            lon, lat = self.ee.Image(scene_id).geometry().centroid(1).coordinates().getInfo()
+            return lon, lat
+        return self.centers.get(scene_id, load)
+
+
+_scene_searches = {}
+_scene_searches_lock = threading.Lock()
+
+
+def get_scene_search(ee):
+    """Process-wide SceneSearch for an `ee` module, shared by all sessions."""
+    with _scene_searches_lock:
+        search = _scene_searches.get(id(ee))
+        if search is None or search.ee is not ee:
+            search = _scene_searches[id(ee)] = SceneSearch(ee)
+        return search
+
+
+_layer_caches = {}
+_layer_caches_lock = threading.Lock()
+
+
+def get_layer_cache(ee):
+    """Process-wide LayerCache for an `ee` module, shared by all sessions."""
+    with _layer_caches_lock:
+        layers = _layer_caches.get(id(ee))
+        if layers is None or layers.ee is not ee:
+            layers = _layer_caches[id(ee)] = LayerCache(ee)
+        return layers
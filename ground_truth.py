@@ -0,0 +1,172 @@
+"""
+Clustered, viewport-limited ground-truth point layer for the prospector map.
+
+Field submissions are indexed on a grid per zoom level: at zoom z the Web
+Mercator world is cut into cells of CLUSTER_RADIUS screen pixels, and every
+occupied cell becomes one feature -- the submission itself when it is alone,
+else a cluster with its count and centroid. Each level is a sorted array of
+cell keys, built on first use, so a viewport query is a handful of
+searchsorted calls (one per cell row on screen).
+
+A query returns only the cells inside the (padded) viewport, which at a
+given zoom is a fixed number of screen pixels, so the payload is bounded by
+the screen size and MAX_FEATURES whatever the number of points.
+"""
+import math
+import numpy as np
+
+TILE_SIZE = 256
+# Cell edge in screen pixels (Leaflet.markercluster uses 80).
+CLUSTER_RADIUS = 60
+MAX_ZOOM = 20
+# Viewport padding, as a fraction of its width/height on every side, so
+# short pans show points before the next query comes back.
+VIEWPORT_PADDING = 0.25
+MAX_FEATURES = 2000
+MAX_LATITUDE = 85.05112878
+
+# Screen size assumed before the map has reported its viewport.
+DEFAULT_VIEWPORT = (1200, 850)
+
+
+def project(lat, lon):
+    """Web Mercator coordinates normalised to [0, 1] (x east, y south)."""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    x = (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0
+    s = np.sin(np.radians(lat))
+    y = 0.5 - np.log((1 + s) / (1 - s)) / (4 * np.pi)
+    return np.clip(x, 0.0, 1.0), np.clip(y, 0.0, 1.0)
+
+
+def unproject(x, y):
+    """(lat, lon) of normalised Web Mercator coordinates."""
+    lon = np.asarray(x) * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(y)))))
+    return lat, lon
+
+
+def viewport_bounds(lat, lon, zoom, size=DEFAULT_VIEWPORT):
+    """(south, west, north, east) of a `size` pixel map centred on (lat, lon)."""
+    x, y = project(lat, lon)
+    world = TILE_SIZE * 2 ** zoom
+    half_w, half_h = size[0] / 2 / world, size[1] / 2 / world
+    south, west = unproject(x - half_w, y + half_h)
+    north, east = unproject(x + half_w, y - half_h)
+    return float(south), float(west), float(north), float(east)
+
+
+class GroundTruthIndex:
+    """
+    Grid-clustered spatial index over field submissions.
+    """
+
+    def __init__(self, records, radius=CLUSTER_RADIUS, max_features=MAX_FEATURES):
+        """
+        Args:
+            records (list): Submission dicts with at least 'lat' and 'lon'
+                (as FieldDataService.submissions).
+            radius (int): Cluster cell edge in screen pixels.
+            max_features (int): Cap on the features one query returns; wider
+                viewports are answered from a coarser level.
+        """
+        self.records = list(records)
+        self.radius = radius
+        self.max_features = max_features
+        self.x, self.y = project([r['lat'] for r in self.records], [r['lon'] for r in self.records])
+        self._levels = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def cells_per_axis(self, zoom):
+        return max(1, int(math.ceil(TILE_SIZE * 2 ** zoom / self.radius)))
+
+    def level(self, zoom):
+        """
+        Occupied cells at `zoom`, sorted by key (row-major).
+
+        Returns:
+            dict: keys, count, x, y (centroids) and first (a member's record index).
+        """
+        if zoom not in self._levels:
+            n = self.cells_per_axis(zoom)
+            cx = np.minimum((self.x * n).astype(np.int64), n - 1)
+            cy = np.minimum((self.y * n).astype(np.int64), n - 1)
+            keys = cy * n + cx
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.array([], dtype=np.int64)
+            count = np.diff(np.r_[starts, len(keys)])
+            self._levels[zoom] = {
+                "keys": keys[starts],
+                "count": count,
+                "x": np.add.reduceat(self.x[order], starts) / count if len(keys) else np.array([]),
+                "y": np.add.reduceat(self.y[order], starts) / count if len(keys) else np.array([]),
+                "first": order[starts],
+            }
+        return self._levels[zoom]
+
+    def _cell_range(self, bounds, zoom, padding):
+        south, west, north, east = bounds
+        x0, y1 = project(south, west)
+        x1, y0 = project(north, east)
+        pad_x, pad_y = (x1 - x0) * padding, (y1 - y0) * padding
+        n = self.cells_per_axis(zoom)
+        cx0 = max(0, int((x0 - pad_x) * n))
+        cx1 = min(n - 1, int((x1 + pad_x) * n))
+        cy0 = max(0, int((y0 - pad_y) * n))
+        cy1 = min(n - 1, int((y1 + pad_y) * n))
+        return n, cx0, cx1, cy0, cy1
+
+    def query(self, bounds, zoom, padding=VIEWPORT_PADDING):
+        """
+        Cells of the level for `zoom` that fall inside the viewport.
+
+        Args:
+            bounds (tuple): (south, west, north, east) in degrees.
+            zoom (float): Map zoom.
+            padding (float): Extra margin around the viewport (fraction of its size).
+
+        Returns:
+            tuple: (zoom of the level used, indices into level(zoom) arrays)
+        """
+        zoom = int(min(max(round(zoom), 0), MAX_ZOOM))
+        while True:
+            n, cx0, cx1, cy0, cy1 = self._cell_range(bounds, zoom, padding)
+            if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) <= self.max_features or zoom == 0:
+                break
+            # A viewport wider than the screen (or a bogus one): answer coarser.
+            zoom -= 1
+
+        level = self.level(zoom)
+        rows = np.arange(cy0, cy1 + 1, dtype=np.int64) * n
+        lo = np.searchsorted(level["keys"], rows + cx0, side='left')
+        hi = np.searchsorted(level["keys"], rows + cx1, side='right')
+        selected = [np.arange(a, b) for a, b in zip(lo, hi) if b > a]
+        cells = np.concatenate(selected) if selected else np.array([], dtype=np.int64)
+        return zoom, cells[:self.max_features]
+
+    def features(self, bounds, zoom, padding=VIEWPORT_PADDING):
+        """
+        GeoJSON features of the viewport: single submissions as they are,
+        clusters with 'cluster', 'count' and the zoom that splits them.
+
+        Returns:
+            dict: A GeoJSON FeatureCollection.
+        """
+        level_zoom, cells = self.query(bounds, zoom, padding)
+        level = self.level(level_zoom)
+        lat, lon = unproject(level["x"][cells], level["y"][cells])
+        features = []
+        for i, cell in enumerate(cells):
+            count = int(level["count"][cell])
+            if count == 1:
+                record = self.records[level["first"][cell]]
+                properties = {k: v for k, v in record.items() if isinstance(v, (str, int, float, bool, type(None)))}
+                coordinates = [record['lon'], record['lat']]
+            else:
+                properties = {"cluster": True, "count": count, "expansion_zoom": min(level_zoom + 2, MAX_ZOOM)}
+                coordinates = [float(lon[i]), float(lat[i])]
+            features.append({"type": "Feature", "geometry": {"type": "Point", "coordinates": coordinates},
+                             "properties": properties})
+        return {"type": "FeatureCollection", "features": features}
@@ -0,0 +1,150 @@
+"""
+Persistent, content-addressed cache of computed index rasters.
+
+Entries are keyed by a fingerprint of the input scene (a hash of the band
+data, or a source file's path, size and mtime), the index name and its
+parameters. They are stored as .npy files and handed back memory-mapped, so
+re-opening a scene that was already processed costs a few page faults instead
+of a recompute. The least recently used entries are evicted once the cache
+grows past its size cap.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'mineral_indices')
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Bands are hashed in slices of this many bytes to bound the working set.
+HASH_BLOCK_BYTES = 16 * 1024 ** 2
+
+
+def band_fingerprint(bands):
+    """Hash of band names, shapes, dtypes and pixel data."""
+    digest = hashlib.blake2b(digest_size=20)
+    for name in sorted(bands):
+        data = np.ascontiguousarray(bands[name])
+        digest.update(f'{name}:{data.dtype.str}:{data.shape};'.encode())
+        raw = data.reshape(-1).view(np.uint8)
+        for start in range(0, raw.size, HASH_BLOCK_BYTES):
+            digest.update(raw[start:start + HASH_BLOCK_BYTES])
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    """Cheap fingerprint of a source raster: absolute path, size and mtime."""
+    stat = os.stat(path)
+    return hashlib.blake2b(
+        f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'.encode(), digest_size=20,
+    ).hexdigest()
+
+
+def entry_key(scene, name, params=None):
+    """Cache key of one index of one scene."""
+    payload = json.dumps([scene, name, params or {}], sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+
+class IndexCache:
+    """
+    On-disk LRU cache of index arrays.
+
+    Recency is tracked through file mtimes (touched on every hit), so several
+    processes -- e.g. Streamlit sessions -- can share one cache directory.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Args:
+            root (str): Cache directory (created if missing).
+            max_bytes (int): Size cap; least recently used entries are evicted above it.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + '.npy')
+
+    def get(self, key):
+        """Memory-mapped (read-only) array for `key`, or None."""
+        path = self._path(key)
+        try:
+            array = np.load(path, mmap_mode='r')
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return array
+
+    def put(self, key, array):
+        """Stores `array` under `key` and returns it memory-mapped from the cache."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial entry.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict(keep=path)
+        return np.load(path, mmap_mode='r')
+
+    def get_or_compute(self, key, compute):
+        """Cached array for `key`, computing and storing it with compute() on a miss."""
+        array = self.get(key)
+        if array is None:
+            array = self.put(key, compute())
+        return array
+
+    def entries(self):
+        """(mtime, size, path) of every entry, oldest first."""
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.npy'):
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    found.append((stat.st_mtime_ns, stat.st_size, path))
+        return sorted(found)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """Removes least recently used entries until the cache fits its cap."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                # Open memmaps of the entry stay valid after the unlink on POSIX.
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
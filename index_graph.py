@@ -0,0 +1,213 @@
+"""
+Lazy dependency graph for the per-pixel Sentinel-2 indices.
+
+Every index is declared as an expression tree of band reads, ratios, sums and
+differences. Nodes are plain tuples, so identical sub-expressions (B11/B8A in
+Ferric Oxide and MSI, the NDII terms reused by NDMI, ...) hash to the same key
+and are evaluated once per request. Intermediates are released as soon as
+their last consumer has run.
+"""
+import numpy as np
+
+
+# Leaf node kinds: a band read and a scalar constant.
+LEAVES = ('band', 'const')
+
+# Array operation for each non-leaf node kind. Every entry accepts out=.
+OPERATIONS = {
+    'add': np.add,
+    'subtract': np.subtract,
+    'multiply': np.multiply,
+    'power': np.power,
+    'negative': np.negative,
+    'abs': np.abs,
+    'sqrt': np.sqrt,
+    'exp': np.exp,
+    'log': np.log,
+    'log10': np.log10,
+    'min': np.minimum,
+    'max': np.maximum,
+    'gt': np.greater,
+    'gte': np.greater_equal,
+    'lt': np.less,
+    'lte': np.less_equal,
+    'eq': np.equal,
+    'neq': np.not_equal,
+}
+
+
+def band(name):
+    return ('band', name)
+
+
+def const(value):
+    return ('const', float(value))
+
+
+def ratio(numerator, denominator):
+    return ('divide', numerator, denominator)
+
+
+def add(a, b):
+    # Addition is commutative (bit-for-bit in IEEE arithmetic), so order the
+    # operands to let B8A + B5 and B5 + B8A share one node.
+    return ('add',) + tuple(sorted((a, b), key=repr))
+
+
+def subtract(a, b):
+    return ('subtract', a, b)
+
+
+def normalized_difference(a, b):
+    return ratio(subtract(a, b), add(a, b))
+
+
+B2, B3, B4, B5, B6 = band('B2'), band('B3'), band('B4'), band('B5'), band('B6')
+B8, B8A, B11, B12 = band('B8'), band('B8A'), band('B11'), band('B12')
+
+# Same formulas as the calculate_* methods of Sentinel2Indices.
+INDEX_GRAPH = {
+    'Iron Oxide (Red/Blue)': ratio(B4, B2),
+    'Ferric Oxide (SWIR1/NIR)': ratio(B11, B8A),
+    'Ferrous Iron': add(ratio(B12, B8), ratio(B3, B4)),
+    'Clay Minerals': ratio(B11, B12),
+    'reNDVI (Vegetation Health)': normalized_difference(B8A, B5),
+    'MSI (Moisture Stress)': ratio(B11, B8A),
+    'NDII (Canopy Water)': normalized_difference(B8A, B11),
+    'WRI (Flooded Pit Detection)': ratio(add(B5, B6), add(B11, B12)),
+    'NDMI (Ground Moisture)': normalized_difference(B8A, B11),
+}
+
+
+def node_bands(node):
+    """Set of band names a node reads."""
+    if node[0] == 'band':
+        return {node[1]}
+    if node[0] == 'const':
+        return set()
+    found = set()
+    for arg in node[1:]:
+        found |= node_bands(arg)
+    return found
+
+
+def count_passes(node):
+    """Array operations needed to evaluate a node with no sharing at all."""
+    if node[0] in LEAVES:
+        return 0
+    return 1 + sum(count_passes(arg) for arg in node[1:])
+
+
+class IndexGraph:
+    """
+    Evaluates a set of named index expressions with shared-intermediate
+    memoization.
+    """
+
+    def __init__(self, outputs=None):
+        """
+        Args:
+            outputs (dict): Index name -> expression node (default: INDEX_GRAPH).
+        """
+        self.outputs = INDEX_GRAPH if outputs is None else outputs
+
+    def plan(self, names):
+        """
+        Orders the unique operation nodes behind `names` so that every node
+        comes after its inputs.
+
+        Returns:
+            tuple: (ordered nodes, consumer count per node)
+        """
+        order = []
+        consumers = {}
+        seen = set()
+
+        def visit(node):
+            if node in seen:
+                return
+            seen.add(node)
+            if node[0] in LEAVES:
+                return
+            for arg in node[1:]:
+                consumers[arg] = consumers.get(arg, 0) + 1
+                visit(arg)
+            order.append(node)
+
+        for name in names:
+            visit(self.outputs[name])
+        return order, consumers
+
+    def iter_evaluate(self, bands, names, divide, stats=None, buffers=None):
+        """
+        Evaluates the named indices lazily, yielding (name, array) as soon as
+        each result is ready so callers can write it out and drop it.
+
+        Indices whose bands are missing are skipped. Aliases of the same
+        expression (e.g. NDII and NDMI) are yielded as the same array object.
+
+        Args:
+            bands (dict): Band name -> array.
+            names (list): Index names to evaluate.
+            divide (callable): Safe division used for ratio nodes.
+            stats (dict): Optional dict filled with pass counts once evaluation finishes.
+            buffers (callable): Optional node -> array (or None) giving the
+                buffer each operation writes into; `divide` must then accept out=.
+        """
+        available = [n for n in names if node_bands(self.outputs[n]) <= set(bands)]
+        order, consumers = self.plan(available)
+
+        wanted = {}
+        for name in available:
+            wanted.setdefault(self.outputs[name], []).append(name)
+
+        ops = dict(OPERATIONS, divide=divide)
+        memo = {}
+        live = peak_live = 0
+
+        def fetch(node):
+            if node[0] == 'band':
+                return bands[node[1]]
+            if node[0] == 'const':
+                return node[1]
+            return memo[node]
+
+        def release(node):
+            nonlocal live
+            consumers[node] -= 1
+            if consumers[node] == 0 and node in memo:
+                del memo[node]
+                live -= 1
+
+        for node in order:
+            args = [fetch(arg) for arg in node[1:]]
+            target = buffers(node) if buffers is not None else None
+            if target is None:
+                memo[node] = ops[node[0]](*args)
+            else:
+                memo[node] = ops[node[0]](*args, out=target)
+            live += 1
+            peak_live = max(peak_live, live)
+            for arg in node[1:]:
+                if arg[0] not in LEAVES:
+                    release(arg)
+
+            for name in wanted.get(node, ()):
+                yield name, memo[node]
+            if node in wanted and consumers.get(node, 0) == 0:
+                del memo[node]
+                live -= 1
+
+        if stats is not None:
+            naive = sum(count_passes(self.outputs[n]) for n in available)
+            stats.update({
+                'naive_passes': naive,
+                'passes': len(order),
+                'passes_saved': naive - len(order),
+                'peak_live_arrays': peak_live,
+                'skipped': [n for n in names if n not in available],
+            })
+
+    def evaluate(self, bands, names, divide, stats=None):
+        """Evaluates the named indices and returns them as a dict."""
+        return dict(self.iter_evaluate(bands, names, divide, stats))
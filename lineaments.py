@@ -0,0 +1,377 @@
+"""
+Tiled Canny lineament detection on SWIR1.
+
+The 2-98% contrast stretch comes from a streaming histogram instead of a
+full copy and sort of the valid pixels, and Canny runs tile by tile with a
+sigma-sized halo. Hysteresis thresholding links edges across the whole
+scene, so edge components are joined across tile seams with a union-find
+over the tile borders. The result matches a single Canny pass over the whole
+raster.
+"""
+import numpy as np
+
+from parallel_tiles import TileExecutor, row_strips
+
+try:
+    from scipy import ndimage as ndi
+    from skimage import exposure, feature
+    from skimage.util import dtype_limits
+    HAS_SKIMAGE = True
+except ImportError:
+    HAS_SKIMAGE = False
+
+try:
+    # Lets one Gaussian/Sobel pass produce both hysteresis masks. These are
+    # private (scikit-image is pinned in requirements.txt), so they are only
+    # used after matching feature.canny on a test tile; see canny_masks().
+    from skimage.feature._canny import _preprocess, _nonmaximum_suppression_bilinear
+    HAS_CANNY_INTERNALS = True
+except ImportError:
+    HAS_CANNY_INTERNALS = False
+
+CANNY_SIGMA = 2.0
+CANNY_LOW = 0.1
+CANNY_HIGH = 0.3
+STRETCH_PERCENTILES = (2, 98)
+HISTOGRAM_BINS = 4096
+STRIP_PIXELS = 1 << 20
+
+EIGHT_CONNECTED = np.ones((3, 3), dtype=bool)
+
+
+def halo_for_sigma(sigma):
+    """Pixels of context a tile needs: Gaussian radius plus Sobel, NMS and mask erosion."""
+    return int(4.0 * sigma + 0.5) + 3
+
+
+def streaming_percentiles(chunks, percentiles):
+    """
+    Linear-interpolated percentiles (as np.percentile) over values delivered
+    in chunks, without holding all values at once.
+
+    Integer data is counted exactly with one histogram bin per value. Float
+    data is binned into HISTOGRAM_BINS bins, then only the values in the bins
+    holding the wanted ranks are collected and sorted.
+
+    Args:
+        chunks (callable): Returns a fresh iterator of 1-D value arrays; it is
+            called once per pass (two passes for integers, three for floats).
+        percentiles (sequence): Percentiles in [0, 100].
+
+    Returns:
+        list: One value per percentile, or None if there are no values.
+    """
+    n = 0
+    lo = hi = None
+    integer = True
+    for values in chunks():
+        if values.size == 0:
+            continue
+        n += values.size
+        integer = integer and values.dtype.kind in 'iub'
+        cmin, cmax = values.min(), values.max()
+        lo = cmin if lo is None else min(lo, cmin)
+        hi = cmax if hi is None else max(hi, cmax)
+    if n == 0:
+        return None
+
+    ranks = []
+    for q in percentiles:
+        virtual = (n - 1) * (q / 100.0)
+        below = int(np.floor(virtual))
+        ranks.append((below, min(below + 1, n - 1), virtual - below))
+    wanted = sorted({r for below, above, _ in ranks for r in (below, above)})
+
+    if integer and int(hi) - int(lo) < (1 << 24):
+        counts = np.zeros(int(hi) - int(lo) + 1, dtype=np.int64)
+        for values in chunks():
+            if values.size:
+                counts += np.bincount((values.astype(np.int64) - int(lo)), minlength=counts.size)
+        cumulative = np.cumsum(counts)
+        order_stats = {r: float(int(lo) + np.searchsorted(cumulative, r, side='right')) for r in wanted}
+    else:
+        edges = None
+        counts = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+        for values in chunks():
+            if values.size:
+                hist, edges = np.histogram(values, bins=HISTOGRAM_BINS, range=(float(lo), float(hi)))
+                counts += hist
+        if edges is None:
+            edges = np.histogram_bin_edges([], bins=HISTOGRAM_BINS, range=(float(lo), float(hi)))
+        cumulative = np.cumsum(counts)
+        bins = sorted({int(np.searchsorted(cumulative, r, side='right')) for r in wanted})
+
+        collected = {b: [] for b in bins}
+        for values in chunks():
+            for b in bins:
+                upper = values <= edges[b + 1] if b == HISTOGRAM_BINS - 1 else values < edges[b + 1]
+                collected[b].append(values[(values >= edges[b]) & upper])
+        order_stats = {}
+        for r in wanted:
+            b = int(np.searchsorted(cumulative, r, side='right'))
+            before = cumulative[b - 1] if b > 0 else 0
+            in_bin = np.sort(np.concatenate(collected[b]))
+            order_stats[r] = float(in_bin[r - before])
+
+    return [order_stats[below] + (order_stats[above] - order_stats[below]) * gamma
+            for below, above, gamma in ranks]
+
+
+def _internal_canny_masks(image, sigma, low_threshold, high_threshold):
+    """canny_masks() from one Gaussian/Sobel pass, through skimage internals."""
+    dtype_max = dtype_limits(image, clip_negative=False)[1]
+    low_threshold = low_threshold / dtype_max
+    high_threshold = high_threshold / dtype_max
+    smoothed, eroded_mask = _preprocess(image, None, sigma, 'constant', 0.0)
+    jsobel = ndi.sobel(smoothed, axis=1)
+    isobel = ndi.sobel(smoothed, axis=0)
+    magnitude = isobel * isobel
+    magnitude += jsobel * jsobel
+    np.sqrt(magnitude, out=magnitude)
+    low_masked = _nonmaximum_suppression_bilinear(isobel, jsobel, magnitude, eroded_mask, low_threshold)
+    low_mask = low_masked > 0
+    return low_mask, low_mask & (low_masked >= high_threshold)
+
+
+def _public_canny_masks(image, sigma, low_threshold, high_threshold):
+    """canny_masks() through the public feature.canny (two passes)."""
+    # With equal thresholds every component is kept, so canny() returns the raw masks.
+    low_mask = feature.canny(image, sigma=sigma, low_threshold=low_threshold, high_threshold=low_threshold)
+    high_mask = feature.canny(image, sigma=sigma, low_threshold=high_threshold, high_threshold=high_threshold)
+    return low_mask, high_mask
+
+
+_internals_checked = None
+
+
+def _canny_internals_usable():
+    """
+    True if the private Canny helpers import and reproduce the public
+    canny() masks on a small test tile (checked once per process).
+    """
+    global _internals_checked
+    if _internals_checked is None:
+        usable = False
+        if HAS_CANNY_INTERNALS:
+            yy, xx = np.mgrid[:64, :64]
+            image = ((np.hypot(yy - 30, xx - 34) < 18) * 0.7 + (xx > 44) * 0.3
+                     + np.random.default_rng(0).normal(0, 0.05, (64, 64)))
+            try:
+                internal = _internal_canny_masks(image, CANNY_SIGMA, CANNY_LOW, CANNY_HIGH)
+                public = _public_canny_masks(image, CANNY_SIGMA, CANNY_LOW, CANNY_HIGH)
+                usable = all(np.array_equal(a, b) for a, b in zip(internal, public)) and public[1].any()
+            except Exception:
+                usable = False
+            if not usable:
+                print("Warning: scikit-image's Canny internals do not match feature.canny; using feature.canny.")
+        _internals_checked = usable
+    return _internals_checked
+
+
+def canny_masks(image, sigma=CANNY_SIGMA, low_threshold=CANNY_LOW, high_threshold=CANNY_HIGH):
+    """
+    The two hysteresis inputs of skimage's Canny: non-maximum-suppressed
+    edge pixels above the low threshold, and those also above the high one.
+    """
+    if _canny_internals_usable():
+        try:
+            return _internal_canny_masks(image, sigma, low_threshold, high_threshold)
+        except Exception as e:
+            print(f"Warning: Canny internals failed ({e}); using feature.canny.")
+    return _public_canny_masks(image, sigma, low_threshold, high_threshold)
+
+
+def tile_grid(height, width, tile_size):
+    """Row-major grid of (row slice, col slice) tiles."""
+    return [
+        [(slice(r, min(r + tile_size, height)), slice(c, min(c + tile_size, width)))
+         for c in range(0, width, tile_size)]
+        for r in range(0, height, tile_size)
+    ]
+
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = np.arange(size)
+
+    def find(self, x):
+        parent = self.parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def _seam_pairs(a, b):
+    """Label pairs touching across a straight seam (8-connectivity)."""
+    pairs = [np.stack([a, b], axis=1)]
+    if a.size > 1:
+        pairs.append(np.stack([a[:-1], b[1:]], axis=1))
+        pairs.append(np.stack([a[1:], b[:-1]], axis=1))
+    pairs = np.concatenate(pairs)
+    pairs = pairs[(pairs[:, 0] > 0) & (pairs[:, 1] > 0)]
+    return np.unique(pairs, axis=0) if len(pairs) else pairs
+
+
+class LineamentDetector:
+    """
+    Canny lineament detection over a raster read tile by tile.
+
+    The raster is accessed through a `read(rows, cols)` callable, so the same
+    detector runs over in-memory arrays and over GeoTIFF windows.
+    """
+
+    def __init__(self, sigma=CANNY_SIGMA, low_threshold=CANNY_LOW, high_threshold=CANNY_HIGH,
+                 tile_size=1024, workers=1):
+        """
+        Args:
+            sigma (float): Canny Gaussian sigma.
+            low_threshold (float): Hysteresis low threshold (on the stretched image).
+            high_threshold (float): Hysteresis high threshold.
+            tile_size (int): Tile edge length in pixels, before the halo.
+            workers (int): Tiles processed in parallel (None = all cores).
+        """
+        if not HAS_SKIMAGE:
+            raise ImportError("scikit-image is required for lineament detection.")
+        self.sigma = sigma
+        self.low_threshold = low_threshold
+        self.high_threshold = high_threshold
+        self.tile_size = tile_size
+        self.halo = halo_for_sigma(sigma)
+        self.executor = TileExecutor(workers, kind='thread')
+
+    def stretch(self, read, shape):
+        """2-98% range of the valid (> 0) pixels, or None if there are none."""
+        height, width = shape
+        strips = row_strips(height, max(1, height * width // STRIP_PIXELS))
+
+        def chunks():
+            for rows in strips:
+                data = read(rows, slice(0, width))
+                yield data[data > 0]
+
+        return streaming_percentiles(chunks, STRETCH_PERCENTILES)
+
+    def _tile_masks(self, read, shape, tile, in_range):
+        rows, cols = tile
+        height, width = shape
+        r0, r1 = max(0, rows.start - self.halo), min(height, rows.stop + self.halo)
+        c0, c1 = max(0, cols.start - self.halo), min(width, cols.stop + self.halo)
+        crop = read(slice(r0, r1), slice(c0, c1))
+        rescaled = exposure.rescale_intensity(crop, in_range=in_range)
+        low, high = canny_masks(rescaled, self.sigma, self.low_threshold, self.high_threshold)
+
+        inner = (slice(rows.start - r0, rows.stop - r0), slice(cols.start - c0, cols.stop - c0))
+        low, high = low[inner], high[inner]
+        background = crop[inner] == 0
+        return low, high, background
+
+    def _label_tile(self, read, shape, tile, in_range):
+        low, high, background = self._tile_masks(read, shape, tile, in_range)
+        labels, count = ndi.label(low, EIGHT_CONNECTED)
+        good = np.zeros(count + 1, dtype=bool)
+        good[np.unique(labels[high])] = True
+        good[0] = False
+        borders = (labels[0].copy(), labels[-1].copy(), labels[:, 0].copy(), labels[:, -1].copy())
+        # Only the packed low mask is kept; labels are recomputed (deterministically) in pass two.
+        return np.packbits(low), np.packbits(background), count, good, borders
+
+    def detect(self, read, shape, write):
+        """
+        Runs the detector and hands every finished tile to `write(rows, cols, edges)`.
+
+        Args:
+            read (callable): (rows, cols) slices -> 2-D array of SWIR1.
+            shape (tuple): (height, width) of the raster.
+            write (callable): Receives each tile's float32 edge raster, in tile order.
+
+        Returns:
+            bool: False if the raster has no valid pixels (nothing is written).
+        """
+        in_range = self.stretch(read, shape)
+        if in_range is None:
+            return False
+        in_range = tuple(in_range)
+
+        grid = tile_grid(shape[0], shape[1], self.tile_size)
+        tiles = [tile for row in grid for tile in row]
+
+        # Pass 1: per-tile Canny and local edge components.
+        results = list(self.executor.imap(lambda t: self._label_tile(read, shape, t, in_range), tiles))
+
+        offsets = np.cumsum([0] + [r[2] + 1 for r in results])
+        union = _UnionFind(int(offsets[-1]))
+        good = np.concatenate([r[3] for r in results])
+
+        n_cols = len(grid[0])
+
+        def border(index, side):
+            return results[index][4][side]
+
+        for i, row in enumerate(grid):
+            for j in range(len(row)):
+                index = i * n_cols + j
+                neighbours = []
+                if j + 1 < n_cols:
+                    neighbours.append((index + 1, _seam_pairs(border(index, 3), border(index + 1, 2))))
+                if i + 1 < len(grid):
+                    below = index + n_cols
+                    neighbours.append((below, _seam_pairs(border(index, 1), border(below, 0))))
+                    # Diagonal contacts at tile corners.
+                    if j + 1 < n_cols:
+                        a, b = border(index, 1)[-1], border(below + 1, 0)[0]
+                        if a and b:
+                            neighbours.append((below + 1, np.array([[a, b]])))
+                    if j > 0:
+                        a, b = border(index, 1)[0], border(below - 1, 0)[-1]
+                        if a and b:
+                            neighbours.append((below - 1, np.array([[a, b]])))
+                for other, pairs in neighbours:
+                    for a, b in pairs:
+                        union.union(offsets[index] + a, offsets[other] + b)
+
+        # Pointer jumping resolves every label to its root in a few vectorised steps.
+        roots = union.parent
+        while True:
+            jumped = roots[roots]
+            if np.array_equal(jumped, roots):
+                break
+            roots = jumped
+        root_good = np.zeros(len(good), dtype=bool)
+        np.logical_or.at(root_good, roots, good)
+        final_good = root_good[roots]
+
+        # Pass 2: relabel each tile and keep the components linked to a strong edge.
+        def finish(index):
+            rows, cols = tiles[index]
+            tile_shape = (rows.stop - rows.start, cols.stop - cols.start)
+            packed_low, packed_background = results[index][0], results[index][1]
+            low = np.unpackbits(packed_low, count=tile_shape[0] * tile_shape[1]).reshape(tile_shape).astype(bool)
+            background = np.unpackbits(packed_background, count=low.size).reshape(tile_shape).astype(bool)
+            labels, _ = ndi.label(low, EIGHT_CONNECTED)
+            edges = final_good[offsets[index] + labels] & (labels > 0)
+            edges = edges.astype('float32')
+            edges[background] = 0
+            return rows, cols, edges
+
+        for rows, cols, edges in self.executor.imap(finish, range(len(tiles))):
+            write(rows, cols, edges)
+        return True
+
+    def detect_array(self, swir1):
+        """Runs the detector over an in-memory SWIR1 array and returns the float32 edge raster."""
+        edges = np.zeros(swir1.shape, dtype='float32')
+
+        def write(rows, cols, tile):
+            edges[rows, cols] = tile
+
+        if not self.detect(lambda rows, cols: swir1[rows, cols], swir1.shape, write):
+            return np.zeros_like(swir1)
+        return edges
@@ -0,0 +1,513 @@
+"""
+Offline backend of the prospector page: the analysis menu of app.py,
+computed with Sentinel2Indices from a local Sentinel-2 stack and served as
+XYZ map tiles.
+
+Tiles are rendered on demand, one 256x256 Web Mercator tile at a time. Each
+render reads only the source window under the tile, decimated to about the
+tile's resolution and taken from the matching overview once the raster has
+been converted to a COG (raster_overviews.py). It evaluates the method's
+band expression on that small grid, warps it onto the tile and colours it
+with the same visualisation parameters as the Earth Engine layer. Rendered
+tiles are kept in a disk cache keyed by the raster's fingerprint, so a tile
+is computed once per raster version, and the browser never holds more than
+the tiles in view.
+
+Usage:
+    server = get_tile_server()
+    url = server.url_template("Iron Oxide")   # .../{z}/{x}/{y}.png for folium
+"""
+import os
+import re
+import math
+import json
+import zlib
+import struct
+import hashlib
+import argparse
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+
+try:
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.errors import WindowError
+    from rasterio.transform import Affine, from_bounds as transform_from_bounds
+    from rasterio.warp import reproject, transform_bounds
+    from rasterio.windows import Window, from_bounds as window_from_bounds
+    from rasterio.windows import transform as window_transform
+    HAS_RASTERIO = True
+except ImportError:
+    HAS_RASTERIO = False
+
+from mineral_indices import Sentinel2Indices
+from band_expressions import PROSPECTOR_EXPRESSIONS, compile_expression, bind
+from index_graph import node_bands
+from index_cache import file_fingerprint
+from tiled_indices import DEFAULT_BAND_ORDER
+from gee_cache import ANALYSIS_VIS
+from raster_overviews import pick_overview, open_at, preferred_source
+
+LOCAL_RASTER = os.path.join("data", "Clipped_Zvishavane_District_20m.tif")
+TILE_CACHE_DIR = os.path.join("mineral_prediction", "cache", "tiles")
+
+TILE_SIZE = 256
+WEB_MERCATOR = 'EPSG:3857'
+# Half the width of the Web Mercator square, in metres.
+MERCATOR_EXTENT = 20037508.342789244
+
+# The prospector menu the local backend covers, in app.py's order.
+LOCAL_METHODS = ("True Color",) + tuple(PROSPECTOR_EXPRESSIONS)
+TRUE_COLOR_BANDS = ('B4', 'B3', 'B2')
+
+# Where the tile server listens, and the address browsers reach it under
+# when that differs (e.g. behind a reverse proxy on a hosted deployment).
+TILE_HOST = os.environ.get("LOCAL_TILE_HOST", "127.0.0.1")
+TILE_PORT = int(os.environ.get("LOCAL_TILE_PORT", "0"))
+TILE_PUBLIC_URL = os.environ.get("LOCAL_TILE_URL")
+
+# Palette colour names used in ANALYSIS_VIS (CSS values); hex strings work too.
+CSS_COLORS = {
+    'black': '000000', 'white': 'ffffff', 'red': 'ff0000', 'green': '008000', 'blue': '0000ff',
+    'yellow': 'ffff00', 'cyan': '00ffff', 'magenta': 'ff00ff', 'orange': 'ffa500', 'gray': '808080',
+    'grey': '808080', 'brown': 'a52a2a', 'purple': '800080', 'darkgreen': '006400',
+}
+
+
+def method_slug(method):
+    """'Iron Oxide' -> 'iron_oxide' (the method's part of the tile URL)."""
+    return re.sub(r'[^a-z0-9]+', '_', method.lower()).strip('_')
+
+
+def tile_bounds(z, x, y):
+    """(left, bottom, right, top) of an XYZ tile in Web Mercator metres."""
+    size = 2 * MERCATOR_EXTENT / 2 ** z
+    left = -MERCATOR_EXTENT + x * size
+    top = MERCATOR_EXTENT - y * size
+    return left, top - size, left + size, top
+
+
+def _rgb(color):
+    value = CSS_COLORS.get(color.lower(), color).lstrip('#')
+    if len(value) == 3:
+        value = ''.join(c * 2 for c in value)
+    return [int(value[i:i + 2], 16) for i in (0, 2, 4)]
+
+
+def colorize(values, vis):
+    """
+    RGBA tile from a (bands, h, w) float array and Earth Engine style vis
+    params: one band through `palette`, or three bands as RGB, stretched
+    from `min` to `max`. NaN pixels are transparent.
+    """
+    lo, hi = float(vis.get("min", 0)), float(vis.get("max", 1))
+    valid = np.all(np.isfinite(values), axis=0)
+    scaled = np.clip((np.nan_to_num(values) - lo) / ((hi - lo) or 1.0), 0.0, 1.0)
+    rgba = np.zeros(values.shape[1:] + (4,), dtype=np.uint8)
+    if "palette" in vis and len(values) == 1:
+        colors = np.array([_rgb(c) for c in vis["palette"]], dtype=np.float64)
+        stops = np.linspace(0.0, 1.0, len(colors))
+        for channel in range(3):
+            rgba[..., channel] = np.round(np.interp(scaled[0], stops, colors[:, channel]))
+    else:
+        for channel in range(3):
+            rgba[..., channel] = np.round(255 * scaled[min(channel, len(values) - 1)])
+    rgba[..., 3] = np.where(valid, 255, 0)
+    return rgba
+
+
+def encode_png(rgba):
+    """PNG bytes of an (h, w, 4) uint8 array (stdlib only)."""
+    height, width = rgba.shape[:2]
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, -1)
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) + chunk(b'IEND', b''))
+
+
+BLANK_TILE = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+
+class LocalRasterBackend:
+    """
+    Renders prospector analysis tiles from a local multi-band Sentinel-2 stack.
+    """
+
+    def __init__(self, path=LOCAL_RASTER, band_order=DEFAULT_BAND_ORDER, vis=None):
+        """
+        Args:
+            path (str): Band-stacked GeoTIFF.
+            band_order (tuple): Sentinel-2 band name of each raster band.
+            vis (dict): Method -> vis params (default: gee_cache.ANALYSIS_VIS).
+        """
+        if not HAS_RASTERIO:
+            raise ImportError("rasterio is required for the local backend.")
+        self.path = path
+        self.band_order = tuple(band_order)
+        self.vis = vis or ANALYSIS_VIS
+        self._handles = {}
+        self._lock = threading.Lock()
+        with rasterio.open(path) as src:
+            self.crs = src.crs
+            self.transform = src.transform
+            self.width, self.height = src.width, src.height
+            self.nodata = src.nodata
+            self.count = src.count
+            self.res = max(abs(src.res[0]), abs(src.res[1]))
+            self.bounds = tuple(src.bounds)
+            self.overviews = src.overviews(1)
+        self.fingerprint = file_fingerprint(path)
+        self.mercator_bounds = transform_bounds(self.crs, WEB_MERCATOR, *self.bounds)
+        self.lonlat_bounds = transform_bounds(self.crs, 'EPSG:4326', *self.bounds)
+
+    @property
+    def center(self):
+        """(lat, lon) of the raster centre."""
+        west, south, east, north = self.lonlat_bounds
+        return (south + north) / 2, (west + east) / 2
+
+    def native_zoom(self):
+        """Zoom level whose tile pixels are about the size of the raster's pixels."""
+        lat = math.radians(self.center[0])
+        metres_per_tile_pixel = 2 * MERCATOR_EXTENT * math.cos(lat) / TILE_SIZE
+        return max(0, int(math.ceil(math.log2(metres_per_tile_pixel / self.res))))
+
+    def methods(self):
+        return [m for m in LOCAL_METHODS if m in self.vis]
+
+    def required_bands(self, method):
+        if method == "True Color":
+            return TRUE_COLOR_BANDS
+        text, variables = PROSPECTOR_EXPRESSIONS[method]
+        node, _ = bind(compile_expression(text), variables)
+        return tuple(b for b in self.band_order if b in node_bands(node))
+
+    def _acquire(self, level):
+        # A small pool of read handles per overview level: GDAL handles are
+        # not thread-safe, and the server's request threads are short-lived.
+        with self._lock:
+            pool = self._handles.setdefault(level, [])
+            if pool:
+                return pool.pop()
+        return open_at(self.path, level)
+
+    def _release(self, level, src):
+        with self._lock:
+            self._handles.setdefault(level, []).append(src)
+
+    def close(self):
+        with self._lock:
+            handles, self._handles = self._handles, {}
+        for pool in handles.values():
+            for src in pool:
+                src.close()
+
+    def _read(self, bands, bounds, tile_res):
+        """
+        Bands over `bounds` (raster CRS), decimated to about `tile_res`.
+
+        The read comes from the coarsest overview that still resolves
+        `tile_res` (see raster_overviews), so zoomed-out tiles of a COG read
+        a small fraction of the pixels under them.
+
+        Returns:
+            tuple: (dict of band -> float32 array, transform of the read grid)
+                or (None, None) when the bounds miss the raster.
+        """
+        level = pick_overview(self.overviews, tile_res / self.res)
+        src = self._acquire(level)
+        try:
+            full = Window(0, 0, src.width, src.height)
+            window = window_from_bounds(*bounds, transform=src.transform)
+            col0, row0 = math.floor(window.col_off), math.floor(window.row_off)
+            col1 = math.ceil(window.col_off + window.width)
+            row1 = math.ceil(window.row_off + window.height)
+            try:
+                window = Window(col0, row0, col1 - col0, row1 - row0).intersection(full)
+            except WindowError:
+                return None, None
+            if window.width <= 0 or window.height <= 0:
+                return None, None
+
+            scale = min(1.0, max(abs(src.res[0]), abs(src.res[1])) / tile_res)
+            out_h = max(1, int(math.ceil(window.height * scale)))
+            out_w = max(1, int(math.ceil(window.width * scale)))
+            indexes = [self.band_order.index(b) + 1 for b in bands]
+            data = src.read(indexes, window=window, out_shape=(len(indexes), out_h, out_w),
+                            resampling=Resampling.average if scale < 1 else Resampling.nearest,
+                            out_dtype='float32')
+            grid = window_transform(window, src.transform) * Affine.scale(window.width / out_w, window.height / out_h)
+        finally:
+            self._release(level, src)
+        if self.nodata is not None:
+            data[data == self.nodata] = 0
+        return dict(zip(bands, data)), grid
+
+    def values(self, method, bands):
+        """(k, h, w) float32 values of `method`; NaN where every band is 0 (nodata)."""
+        background = np.all([bands[b] == 0 for b in bands], axis=0)
+        if method == "True Color":
+            values = np.stack([bands[b] for b in TRUE_COLOR_BANDS])
+        else:
+            text, variables = PROSPECTOR_EXPRESSIONS[method]
+            values = Sentinel2Indices(bands).expression(text, variables, dtype='float32')[None]
+        values[:, background] = np.nan
+        return values
+
+    def render(self, method, z, x, y):
+        """
+        PNG bytes of one XYZ tile of `method`, or None when the tile does not
+        touch the raster.
+        """
+        if method not in self.vis:
+            raise ValueError(f"No local implementation of {method!r}.")
+        bounds = tile_bounds(z, x, y)
+        west, south, east, north = self.mercator_bounds
+        if bounds[0] >= east or bounds[2] <= west or bounds[1] >= north or bounds[3] <= south:
+            return None
+
+        src_bounds = transform_bounds(WEB_MERCATOR, self.crs, *bounds)
+        tile_res = (src_bounds[2] - src_bounds[0]) / TILE_SIZE
+        bands, grid = self._read(self.required_bands(method), src_bounds, tile_res)
+        if bands is None:
+            return None
+        values = self.values(method, bands)
+
+        tile = np.full((len(values), TILE_SIZE, TILE_SIZE), np.nan, dtype=np.float32)
+        reproject(values, tile, src_transform=grid, src_crs=self.crs, src_nodata=np.nan,
+                  dst_transform=transform_from_bounds(*bounds, TILE_SIZE, TILE_SIZE),
+                  dst_crs=WEB_MERCATOR, dst_nodata=np.nan, resampling=Resampling.nearest)
+        return encode_png(colorize(tile, self.vis[method]))
+
+
+class TileCache:
+    """
+    Rendered tiles on disk: <root>/<raster fingerprint>/<method>/<vis hash>/z/x/y.png.
+
+    A changed raster or vis params get a fresh directory, so entries never
+    need invalidating; clear() removes old ones.
+    """
+
+    def __init__(self, root=TILE_CACHE_DIR):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def vis_hash(vis):
+        return hashlib.blake2b(json.dumps(vis, sort_keys=True).encode(), digest_size=6).hexdigest()
+
+    def path(self, scene, method, vis, z, x, y):
+        return os.path.join(self.root, scene, method_slug(method), self.vis_hash(vis),
+                            str(z), str(x), f"{y}.png")
+
+    def get(self, path, count=True):
+        """Tile bytes, or None; count=False leaves the hit/miss counters alone."""
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            if count:
+                self.misses += 1
+            return None
+        if count:
+            self.hits += 1
+        return data
+
+    def put(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial tile.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def clear(self):
+        for dirpath, _, filenames in os.walk(self.root, topdown=False):
+            for filename in filenames:
+                os.remove(os.path.join(dirpath, filename))
+            if dirpath != self.root:
+                os.rmdir(dirpath)
+
+
+class TileServer:
+    """
+    XYZ tile server for a LocalRasterBackend on a background thread.
+
+    Serves /tiles/<method slug>/<z>/<x>/<y>.png; tiles outside the raster
+    are blank. Concurrent requests for the same tile render it once.
+    """
+
+    def __init__(self, backend, cache=None, host=TILE_HOST, port=TILE_PORT, public_url=TILE_PUBLIC_URL):
+        """
+        Args:
+            backend (LocalRasterBackend): Tile renderer.
+            cache (TileCache): Disk cache of rendered tiles (None disables it).
+            host (str): Interface to listen on.
+            port (int): Port (0 picks a free one).
+            public_url (str): Base URL browsers use for the server, if it is
+                not http://host:port (e.g. behind a reverse proxy).
+        """
+        self.backend = backend
+        self.cache = cache
+        self.host = host
+        self.port = port
+        self.public_url = public_url
+        self.slugs = {method_slug(m): m for m in backend.methods()}
+        self._tile_locks = {}
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    def tile(self, method, z, x, y):
+        """PNG bytes of one tile, from the disk cache when possible."""
+        vis = self.backend.vis[method]
+        path = None
+        if self.cache is not None:
+            path = self.cache.path(self.backend.fingerprint, method, vis, z, x, y)
+            data = self.cache.get(path)
+            if data is not None:
+                return data
+
+        key = (method, z, x, y)
+        with self._lock:
+            lock = self._tile_locks.setdefault(key, threading.Lock())
+        with lock:
+            # Another request may have rendered the tile while this one waited;
+            # the miss was already counted above.
+            data = self.cache.get(path, count=False) if path is not None else None
+            if data is None:
+                data = self.backend.render(method, z, x, y)
+                if data is None:
+                    data = BLANK_TILE
+                elif path is not None:
+                    self.cache.put(path, data)
+        with self._lock:
+            self._tile_locks.pop(key, None)
+        return data
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                match = re.fullmatch(r'/tiles/([a-z0-9_]+)/(\d+)/(\d+)/(\d+)\.png', self.path.split('?')[0])
+                if match is None or match.group(1) not in server.slugs:
+                    self.send_error(404)
+                    return
+                method = server.slugs[match.group(1)]
+                z, x, y = (int(v) for v in match.group(2, 3, 4))
+                try:
+                    data = server.tile(method, z, x, y)
+                except Exception as e:
+                    print(f"Warning: Tile {method} {z}/{x}/{y} failed: {e}")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(data)))
+                self.send_header('Cache-Control', 'public, max-age=86400')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Starts serving on a daemon thread (once); returns self."""
+        with self._lock:
+            if self._httpd is None:
+                self._httpd = ThreadingHTTPServer((self.host, self.port), self._handler())
+                self._httpd.daemon_threads = True
+                self.port = self._httpd.server_address[1]
+                threading.Thread(target=self._httpd.serve_forever, name='tile-server', daemon=True).start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            httpd, self._httpd = self._httpd, None
+        if httpd is not None:
+            httpd.shutdown()
+            httpd.server_close()
+        self.backend.close()
+
+    @property
+    def base_url(self):
+        return (self.public_url or f"http://{self.host}:{self.port}").rstrip('/')
+
+    def url_template(self, method):
+        """XYZ URL template of a method's layer, for folium.TileLayer."""
+        return f"{self.base_url}/tiles/{method_slug(method)}/{{z}}/{{x}}/{{y}}.png"
+
+
+def local_scene(server):
+    """Scene card of a server's raster, in the shape of gee_cache scene records."""
+    return {
+        "date": "Offline stack",
+        "cloud": "n/a",
+        "sensor": "Sentinel-2 (local)",
+        "id": "local:" + os.path.basename(server.backend.path),
+        "ee_obj": None,
+    }
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def get_tile_server(path=LOCAL_RASTER, cache_dir=TILE_CACHE_DIR):
+    """
+    Process-wide, started TileServer for a raster, shared by all Streamlit
+    sessions; its COG (raster_overviews.py) is used when one has been made.
+    Servers are keyed by the requested path: when a new COG appears or the
+    served file changes, the old server is stopped and replaced.
+    Returns None when the raster or rasterio is unavailable.
+    """
+    key = os.path.abspath(path)
+    source = preferred_source(path)
+    if not HAS_RASTERIO or not os.path.exists(source):
+        return None
+    with _servers_lock:
+        server = _servers.get(key)
+        if (server is None or server.backend.path != source
+                or server.backend.fingerprint != file_fingerprint(source)):
+            if server is not None:
+                server.stop()
+            server = _servers[key] = TileServer(LocalRasterBackend(source), TileCache(cache_dir)).start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve prospector analysis layers of a local raster as XYZ tiles.")
+    parser.add_argument("--raster", default=LOCAL_RASTER, help="Band-stacked Sentinel-2 GeoTIFF")
+    parser.add_argument("--host", default=TILE_HOST)
+    parser.add_argument("--port", type=int, default=TILE_PORT or 8765)
+    parser.add_argument("--cache-dir", default=TILE_CACHE_DIR)
+    args = parser.parse_args()
+
+    server = TileServer(LocalRasterBackend(args.raster), TileCache(args.cache_dir), args.host, args.port).start()
+    for method in server.backend.methods():
+        print(f"{method}: {server.url_template(method)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
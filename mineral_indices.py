@@ -1,5 +1,8 @@
 import numpy as np
-import random
+from index_graph import IndexGraph, INDEX_GRAPH
+from band_math import BandMath, safe_divide, DEFAULT_DTYPE
+from lineaments import LineamentDetector, HAS_SKIMAGE as SKIMAGE_AVAILABLE, CANNY_SIGMA, CANNY_LOW, CANNY_HIGH
+from index_cache import band_fingerprint, file_fingerprint, entry_key
 
 class Sentinel2Indices:
     """
@@ -16,46 +19,84 @@ class Sentinel2Indices:
     - B11: SWIR 1
     - B12: SWIR 2
     """
-    
-    def __init__(self, bands):
+
+    # Output name -> method, in the order calculate_all() reports them.
+    INDEX_METHODS = {
+        'Iron Oxide (Red/Blue)': 'calculate_iron_oxide',
+        'Ferric Oxide (SWIR1/NIR)': 'calculate_ferric_oxide',
+        'Ferrous Iron': 'calculate_ferrous_iron',
+        'Clay Minerals': 'calculate_clay_minerals',
+        'reNDVI (Vegetation Health)': 'calculate_reNDVI',
+        'MSI (Moisture Stress)': 'calculate_MSI',
+        'NDII (Canopy Water)': 'calculate_NDII',
+        'WRI (Flooded Pit Detection)': 'calculate_WRI',
+        'NDMI (Ground Moisture)': 'calculate_NDMI',
+        'Geological Structures (Lineaments)': 'detect_lineaments',
+    }
+
+    # Bands each index reads.
+    REQUIRED_BANDS = {
+        'Iron Oxide (Red/Blue)': ('B4', 'B2'),
+        'Ferric Oxide (SWIR1/NIR)': ('B11', 'B8A'),
+        'Ferrous Iron': ('B12', 'B8', 'B3', 'B4'),
+        'Clay Minerals': ('B11', 'B12'),
+        'reNDVI (Vegetation Health)': ('B8A', 'B5'),
+        'MSI (Moisture Stress)': ('B11', 'B8A'),
+        'NDII (Canopy Water)': ('B8A', 'B11'),
+        'WRI (Flooded Pit Detection)': ('B5', 'B6', 'B11', 'B12'),
+        'NDMI (Ground Moisture)': ('B8A', 'B11'),
+        'Geological Structures (Lineaments)': ('B11',),
+    }
+
+    # Indices that look at neighbouring pixels, so a tile cannot be computed on its own.
+    NEIGHBOURHOOD_INDICES = ('Geological Structures (Lineaments)',)
+
+    def __init__(self, bands, cache=None, source=None, window=None):
         """
         Initialize with a dictionary of bands.
         
         Args:
             bands (dict): Dictionary where keys are band names (e.g., 'B2', 'B4', 'B11')
                           and values are numpy arrays representing the band data.
+            cache (IndexCache): Optional on-disk cache consulted by compute().
+            source (str): Raster the bands were read from; when given, cache
+                          entries are keyed on its path and mtime (plus the
+                          window and the band names and shapes) instead of a
+                          hash of the band data.
+            window: The window of `source` the bands cover (a rasterio Window
+                    or ((row_start, row_stop), (col_start, col_stop))). Without
+                    it the bands must cover the whole raster; otherwise the
+                    band data is hashed.
         """
         self.bands = bands
-        
-    try:
-        from skimage import feature, exposure
-        HAS_SKIMAGE = True
-    except ImportError:
-        HAS_SKIMAGE = False
-
-    def _generate_blobs(self, shape, num_blobs=10):
-        """Generates realistic-looking geological blobs using random walks/smoothing."""
-        h, w = shape
-        grid = np.zeros((h, w))
-        for _ in range(num_blobs):
-            # Random center
-            cy, cx = random.randint(0, h), random.randint(0, w)
-            # Create a gaussian-like blob
-            y, x = np.ogrid[-cy:h-cy, -cx:w-cx]
-            mask = x*x + y*y <= random.randint(50, 200)**2 # Random radius squared
-            grid[mask] += np.random.uniform(0.1, 0.4) 
-        
-        # Clip to valid reflectance range
-        return np.clip(grid, 0, 1.0)
+        self.graph = IndexGraph()
+        # Pass counts of the last calculate() call (see IndexGraph.iter_evaluate).
+        self.graph_stats = {}
+        self.cache = cache
+        self.source = source
+        self.window = window
+        self._fingerprint = None
+
+    HAS_SKIMAGE = SKIMAGE_AVAILABLE
+
+    def _generate_blobs(self, shape, num_blobs=10, seed=None):
+        """
+        Generates realistic-looking geological blobs (see synthetic_scene.blob_field).
 
-    def _safe_divide(self, numerator, denominator):
+        Args:
+            shape (tuple): (height, width).
+            num_blobs (int): Number of blobs.
+            seed: Seed for a reproducible field (None = fresh entropy).
+        """
+        from synthetic_scene import blob_field
+        return blob_field(shape, num_blobs, seed)
+
+    def _safe_divide(self, numerator, denominator, out=None):
         """
         Helper to safely divide arrays, handling division by zero.
+        With `out` the quotient is written into the given buffer.
         """
-        with np.errstate(divide='ignore', invalid='ignore'):
-            result = np.divide(numerator, denominator)
-            result[~np.isfinite(result)] = 0  # data cleaning
-        return result
+        return safe_divide(numerator, denominator, out=out)
 
     def calculate_iron_oxide(self):
         """
@@ -143,10 +184,18 @@ class Sentinel2Indices:
         return None
 
     # --- STRUCTURE INDICES ---
-    def detect_lineaments(self):
+    def detect_lineaments(self, tile_size=1024, workers=1):
         """
         Geological Structures (Lineanments/Faults) on SWIR1 (B11).
         Uses Canny Edge Detection.
+
+        The 2-98% stretch comes from a streaming histogram and Canny runs on
+        haloed tiles (see lineaments.LineamentDetector); the edges match a
+        single pass over the whole band.
+
+        Args:
+            tile_size (int): Tile edge length in pixels.
+            workers (int): Tiles processed in parallel (None = all cores).
         """
         if 'B11' not in self.bands:
             return None
@@ -154,47 +203,245 @@ class Sentinel2Indices:
         if not self.HAS_SKIMAGE:
             print("Warning: scikit-image not installed. Cannot run edge detection.")
             return np.zeros_like(self.bands['B11'])
-            
-        swir1 = self.bands['B11']
-        
-        # Normalize (0 to 1) ignoring background (0)
-        valid_pixels = swir1[swir1 > 0]
-        if valid_pixels.size == 0:
-             return np.zeros_like(swir1)
 
-        p2, p98 = np.percentile(valid_pixels, (2, 98))
-        img_rescale = exposure.rescale_intensity(swir1, in_range=(p2, p98))
-        
-        # Canny Edge Detection
-        edges = feature.canny(img_rescale, sigma=2.0, low_threshold=0.1, high_threshold=0.3)
-        edges_raster = edges.astype('float32')
-        
-        # Mask background
-        edges_raster[swir1 == 0] = 0
-        
-        return edges_raster
+        detector = LineamentDetector(tile_size=tile_size, workers=workers)
+        return detector.detect_array(self.bands['B11'])
 
-    def calculate_all(self):
+    def calculate_all(self, workers=1):
         """
         Calculates all available indices.
+
+        Args:
+            workers (int): Threads used for the per-pixel indices (None = all cores).
         """
-        indices = {}
-        # Mineral
-        indices['Iron Oxide (Red/Blue)'] = self.calculate_iron_oxide()
-        indices['Ferric Oxide (SWIR1/NIR)'] = self.calculate_ferric_oxide()
-        indices['Ferrous Iron'] = self.calculate_ferrous_iron()
-        indices['Clay Minerals'] = self.calculate_clay_minerals()
-        
-        # Vegetation
-        indices['reNDVI (Vegetation Health)'] = self.calculate_reNDVI()
-        indices['MSI (Moisture Stress)'] = self.calculate_MSI()
-        indices['NDII (Canopy Water)'] = self.calculate_NDII()
-        
-        # Water
-        indices['WRI (Flooded Pit Detection)'] = self.calculate_WRI()
-        indices['NDMI (Ground Moisture)'] = self.calculate_NDMI()
-        
-        # Structure
-        indices['Geological Structures (Lineaments)'] = self.detect_lineaments()
-        
-        return {k: v for k, v in indices.items() if v is not None}
+        return self.calculate(list(self.INDEX_METHODS), workers=workers)
+
+    def calculate(self, names, workers=1):
+        """
+        Calculates the named indices (keys of INDEX_METHODS).
+        Indices whose bands are missing are left out of the result.
+
+        Per-pixel indices are evaluated together through the index graph, so
+        shared ratios, sums and differences are computed once per call.
+        Indices with the same formula (MSI and Ferric Oxide, NDII and NDMI)
+        share one result array.
+
+        With workers != 1 the per-pixel indices are computed on row strips by a
+        thread pool; results are identical to the serial path.
+        """
+        if workers != 1:
+            return self._calculate_parallel(names, workers)
+
+        results = {}
+        for name, value in self.iter_calculate(names):
+            results[name] = value
+        return {name: results[name] for name in names if name in results}
+
+    def compute(self, names=None, dtype=DEFAULT_DTYPE, out=None, workers=1):
+        """
+        Compute mode: evaluates indices in a fixed output dtype, chunk by chunk,
+        straight into output buffers.
+
+        Bands are cast to `dtype` per chunk and the zero-denominator/nodata
+        cleanup happens inside each chunk's divide, so the only full-size
+        arrays are the outputs. With float32 this roughly halves memory and
+        bandwidth compared with calculate().
+
+        Args:
+            names (list): Index names (default: every index in INDEX_METHODS).
+            dtype: Output dtype policy (float32 by default).
+            out (dict): Index name -> preallocated array to write into.
+            workers (int): Row strips computed in parallel (None = all cores).
+
+        Returns:
+            dict: Index name -> array (the caller's buffer where one was given).
+            With a cache, other results are read-only memory-mapped arrays.
+        """
+        if names is None:
+            names = list(self.INDEX_METHODS)
+        if self.cache is not None:
+            return self._compute_cached(names, dtype, out, workers)
+        available = set(self.bands)
+        pixelwise = [n for n in names if n in INDEX_GRAPH and set(self.REQUIRED_BANDS[n]) <= available]
+        skipped = [n for n in names if n in INDEX_GRAPH and n not in pixelwise]
+        if skipped:
+            print(f"Warning: Missing bands for {', '.join(skipped)}.")
+
+        results = {}
+        if pixelwise:
+            math = BandMath(self.graph, dtype=dtype)
+            shape = next(iter(self.bands.values())).shape
+            pixel_out = {n: buf for n, buf in (out or {}).items() if n in pixelwise}
+            results = math.allocate(shape, pixelwise, pixel_out)
+            if workers == 1:
+                math.evaluate_rows(self.bands, pixelwise, results, slice(0, shape[0]))
+            else:
+                from parallel_tiles import TileExecutor, row_strips
+                executor = TileExecutor(workers, kind='thread')
+                executor.run(
+                    lambda rows: math.evaluate_rows(self.bands, pixelwise, results, rows),
+                    row_strips(shape[0], executor.workers * 4),
+                )
+
+        for name in names:
+            if name not in INDEX_GRAPH:
+                value = self._calculate_neighbourhood(name, workers)
+                if value is None:
+                    continue
+                if out and name in out:
+                    np.copyto(out[name], value, casting='unsafe')
+                    value = out[name]
+                results[name] = value.astype(dtype, copy=False)
+        return {name: results[name] for name in names if name in results}
+
+    def scene_fingerprint(self):
+        """Cache identity of the input scene (computed once per instance)."""
+        if self._fingerprint is None:
+            window = self._source_window()
+            if window is not None:
+                layout = [(name, np.asarray(data).dtype.str, np.shape(data)) for name, data in sorted(self.bands.items())]
+                self._fingerprint = entry_key(file_fingerprint(self.source), 'window', {'window': window, 'bands': layout})
+            else:
+                self._fingerprint = band_fingerprint(self.bands)
+        return self._fingerprint
+
+    def _source_window(self):
+        """
+        ((row_start, row_stop), (col_start, col_stop)) of `source` the bands
+        cover, or None when the source cannot identify them (no source, or no
+        window and bands that are not the whole raster).
+        """
+        if self.source is None or not self.bands:
+            return None
+        if self.window is not None:
+            if hasattr(self.window, 'toranges'):
+                return [list(r) for r in self.window.toranges()]
+            return [list(r) for r in self.window]
+        try:
+            import rasterio
+            with rasterio.open(self.source) as src:
+                size = (src.height, src.width)
+        except Exception:
+            return None
+        shapes = {np.shape(data) for data in self.bands.values()}
+        if shapes != {size}:
+            return None
+        return [[0, size[0]], [0, size[1]]]
+
+    def _cache_key(self, name, dtype):
+        params = {'dtype': np.dtype(dtype).str}
+        if name in INDEX_GRAPH:
+            # Keyed on the expression, so indices with the same formula share an entry.
+            name = repr(INDEX_GRAPH[name])
+        else:
+            params.update(sigma=CANNY_SIGMA, low=CANNY_LOW, high=CANNY_HIGH)
+        return entry_key(self.scene_fingerprint(), name, params)
+
+    def _compute_cached(self, names, dtype, out, workers):
+        results = {}
+        missing = []
+        for name in names:
+            value = self.cache.get(self._cache_key(name, dtype))
+            if value is None:
+                missing.append(name)
+            else:
+                results[name] = value
+
+        if missing:
+            cache, self.cache = self.cache, None
+            try:
+                computed = self.compute(missing, dtype=dtype, workers=workers)
+            finally:
+                self.cache = cache
+            stored = {}
+            for name, value in computed.items():
+                key = self._cache_key(name, dtype)
+                if key not in stored:
+                    stored[key] = self.cache.put(key, value)
+                results[name] = stored[key]
+
+        for name, buf in (out or {}).items():
+            if name in results:
+                np.copyto(buf, results[name], casting='unsafe')
+                results[name] = buf
+        return {name: results[name] for name in names if name in results}
+
+    def expression(self, text, variables=None, dtype=DEFAULT_DTYPE, out=None):
+        """
+        Evaluates an Earth Engine style expression on the loaded bands, e.g.
+        "b('B4') / b('B2')" or "(NIR - RED) / (NIR + RED)" with
+        variables={'NIR': 'B8', 'RED': 'B4'}. See band_expressions.
+        """
+        from band_expressions import evaluate_expression
+        return evaluate_expression(text, self.bands, variables, dtype=dtype, out=out)
+
+    def _calculate_parallel(self, names, workers):
+        from parallel_tiles import TileExecutor, row_strips
+
+        available = set(self.bands)
+        pixelwise = [n for n in names if n in INDEX_GRAPH and set(self.REQUIRED_BANDS[n]) <= available]
+        skipped = [n for n in names if n in INDEX_GRAPH and n not in pixelwise]
+        if skipped:
+            print(f"Warning: Missing bands for {', '.join(skipped)}.")
+
+        results = {}
+        if pixelwise:
+            executor = TileExecutor(workers, kind='thread')
+            height = next(iter(self.bands.values())).shape[0]
+            # A few strips per worker keeps the pool busy when strips finish unevenly.
+            strips = row_strips(height, executor.workers * 4)
+
+            def compute(rows):
+                part = Sentinel2Indices({k: v[rows] for k, v in self.bands.items()})
+                return part.calculate(pixelwise), part.graph_stats
+
+            # The first strip runs inline to learn the output dtypes; the rest
+            # write straight into the shared, preallocated outputs.
+            first, self.graph_stats = compute(strips[0])
+            for name, value in first.items():
+                alias = next((n for n in results if INDEX_GRAPH[n] == INDEX_GRAPH[name]), None)
+                if alias is not None:
+                    results[name] = results[alias]
+                else:
+                    results[name] = np.empty((height,) + value.shape[1:], dtype=value.dtype)
+                    results[name][strips[0]] = value
+
+            def fill(rows):
+                part, _ = compute(rows)
+                written = set()
+                for name, value in part.items():
+                    if id(results[name]) not in written:
+                        results[name][rows] = value
+                        written.add(id(results[name]))
+
+            executor.run(fill, strips[1:])
+
+        for name in names:
+            if name not in INDEX_GRAPH:
+                value = self._calculate_neighbourhood(name, workers)
+                if value is not None:
+                    results[name] = value
+        return {name: results[name] for name in names if name in results}
+
+    def _calculate_neighbourhood(self, name, workers):
+        if name == 'Geological Structures (Lineaments)':
+            return self.detect_lineaments(workers=workers)
+        return getattr(self, self.INDEX_METHODS[name])()
+
+    def iter_calculate(self, names):
+        """
+        Like calculate(), but yields (name, array) as each index becomes ready
+        so callers can write results out without holding all of them.
+        """
+        pixelwise = [n for n in names if n in INDEX_GRAPH]
+        self.graph_stats = {}
+        for name, value in self.graph.iter_evaluate(self.bands, pixelwise, self._safe_divide, self.graph_stats):
+            yield name, value
+        if self.graph_stats.get('skipped'):
+            print(f"Warning: Missing bands for {', '.join(self.graph_stats['skipped'])}.")
+
+        for name in names:
+            if name not in INDEX_GRAPH:
+                value = getattr(self, self.INDEX_METHODS[name])()
+                if value is not None:
+                    yield name, value
@@ -1,5 +1,8 @@
 import random
 import datetime
+import threading
+import time
+from ground_truth import GroundTruthIndex
 
 class AkelloService:
     """
@@ -265,6 +268,7 @@ class FieldDataService:
             {'id': 2, 'lat': -20.30, 'lon': 30.08, 'desc': 'Possible Lithium indications (Lepidolite)', 'image': 'https://upload.wikimedia.org/wikipedia/commons/thumb/b/b3/Lepidolite-2005.jpg/320px-Lepidolite-2005.jpg', 'user': 'Sarah'},
             {'id': 3, 'lat': -20.34, 'lon': 30.02, 'desc': 'Artisanal workings - Shaft 1', 'image': None, 'user': 'Admin'}
         ]
+        self._index = None
     
     def add_submission(self, lat, lon, desc, image_data=None, user='Anonymous'):
         '''Save a new field submission.'''
@@ -280,3 +284,208 @@ class FieldDataService:
             "user": user
         })
         return True
+
+    def index(self):
+        """Spatial index of the submissions, rebuilt when submissions were added."""
+        if self._index is None or len(self._index) != len(self.submissions):
+            self._index = GroundTruthIndex(self.submissions)
+        return self._index
+
+    def viewport(self, bounds, zoom):
+        """
+        Clustered submissions inside a map viewport, as GeoJSON (see
+        ground_truth.GroundTruthIndex.features).
+
+        Args:
+            bounds (tuple): (south, west, north, east) in degrees.
+            zoom (float): Map zoom.
+        """
+        return self.index().features(bounds, zoom)
+
+class FakeEarthEngine:
+    '''
+    Offline stand-in for the `ee` module, covering the calls the prospector
+    page makes (scene search, map layers and scene centres). Pass it wherever code takes an
+    `ee` module to exercise caching without network access; `latency` adds a
+    delay per round trip and the counters record how many were made.
+    '''
+    COLLECTION = 'COPERNICUS/S2_SR_HARMONIZED'
+
+    def __init__(self, n_scenes=8, latency=0.0, seed=7):
+        self.latency = latency
+        self.search_calls = 0
+        self.map_id_calls = 0
+        self.info_calls = 0
+        self.fail = False
+        self._lock = threading.Lock()
+        rng = random.Random(seed)
+        now = datetime.datetime.now()
+        self.scenes = []
+        for i in range(n_scenes):
+            when = now - datetime.timedelta(days=3 + 5 * i)
+            self.scenes.append({
+                'type': 'Image',
+                'id': f"{self.COLLECTION}/{when:%Y%m%dT%H%M%S}_T36KUA",
+                'properties': {
+                    'system:time_start': int(when.timestamp() * 1000),
+                    'CLOUDY_PIXEL_PERCENTAGE': round(rng.uniform(0, 40), 2),
+                },
+            })
+        self.Geometry = _FakeGeometry
+        self.Filter = _FakeFilter
+
+    def _round_trip(self, counter):
+        if self.fail:
+            raise RuntimeError("Earth Engine unavailable (fake)")
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def Initialize(self, *args, **kwargs):
+        return None
+
+    def ImageCollection(self, name):
+        return _FakeCollection(self, name)
+
+    def Image(self, image_id):
+        return _FakeImage(self, image_id)
+
+    def Number(self, value):
+        return value
+
+
+class _FakeGeometry:
+    def __init__(self, kind, coordinates):
+        self.kind = kind
+        self.coordinates = coordinates
+
+    @classmethod
+    def Point(cls, coordinates):
+        return cls('Point', list(coordinates))
+
+    def centroid(self, max_error=None):
+        return self
+
+
+class _FakeFootprint:
+    # Every fake scene covers the same tile, around Zvishavane.
+    CENTER = [30.07, -20.33]
+
+    def __init__(self, ee):
+        self._ee = ee
+
+    def centroid(self, max_error=None):
+        return self
+
+    def coordinates(self):
+        return self
+
+    def getInfo(self):
+        self._ee._round_trip('info_calls')
+        return list(self.CENTER)
+
+
+class _FakeFilter:
+    def __init__(self, name, op, value):
+        self.name, self.op, self.value = name, op, value
+
+    @classmethod
+    def lt(cls, name, value):
+        return cls(name, 'lt', value)
+
+
+class _FakeCollection:
+    def __init__(self, ee, name, start=None, end=None, filters=(), ascending=True, limit=None):
+        self._ee = ee
+        self.name = name
+        self._start, self._end = start, end
+        self._filters = tuple(filters)
+        self._ascending = ascending
+        self._limit = limit
+
+    def _with(self, **changes):
+        state = dict(start=self._start, end=self._end, filters=self._filters, ascending=self._ascending,
+                     limit=self._limit)
+        state.update(changes)
+        return _FakeCollection(self._ee, self.name, **state)
+
+    def filterBounds(self, geometry):
+        return self._with()
+
+    def filterDate(self, start, end):
+        return self._with(start=_millis(start), end=_millis(end))
+
+    def filter(self, condition):
+        return self._with(filters=self._filters + (condition,))
+
+    def sort(self, prop, ascending=True):
+        return self._with(ascending=ascending)
+
+    def limit(self, n):
+        return self._with(limit=n)
+
+    def first(self):
+        return _FakeImage(self._ee, self.name + '/first')
+
+    def getInfo(self):
+        self._ee._round_trip('search_calls')
+        features = list(self._ee.scenes)
+        if self._start is not None:
+            features = [f for f in features if self._start <= f['properties']['system:time_start'] < self._end]
+        for condition in self._filters:
+            features = [f for f in features if f['properties'][condition.name] < condition.value]
+        features.sort(key=lambda f: f['properties']['system:time_start'], reverse=not self._ascending)
+        if self._limit is not None:
+            features = features[:self._limit]
+        return {'type': 'ImageCollection', 'features': features}
+
+
+class _FakeImage:
+    def __init__(self, ee, image_id, ops=()):
+        self._ee = ee
+        self.image_id = image_id
+        self.ops = tuple(ops)
+
+    def _op(self, *op):
+        return _FakeImage(self._ee, self.image_id, self.ops + (op,))
+
+    def normalizedDifference(self, bands):
+        return self._op('normalizedDifference', tuple(bands))
+
+    def expression(self, text, mapping=None):
+        return self._op('expression', text)
+
+    def select(self, band):
+        return self._op('select', band)
+
+    def rename(self, name):
+        return self._op('rename', name)
+
+    def add(self, other):
+        return self._op('add', getattr(other, 'ops', other))
+
+    def geometry(self):
+        return _FakeFootprint(self._ee)
+
+    def getMapId(self, vis_params=None):
+        self._ee._round_trip('map_id_calls')
+        token = f"fake{self._ee.map_id_calls:06d}"
+        return {
+            'mapid': f"projects/earthengine-legacy/maps/{token}",
+            'token': token,
+            'tile_fetcher': _FakeTileFetcher(f"https://earthengine.googleapis.com/v1/maps/{token}/tiles/{{z}}/{{x}}/{{y}}"),
+        }
+
+
+class _FakeTileFetcher:
+    def __init__(self, url_format):
+        self.url_format = url_format
+
+
+def _millis(value):
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp() * 1000)
+    if isinstance(value, datetime.date):
+        return int(datetime.datetime.combine(value, datetime.time()).timestamp() * 1000)
+    return int(datetime.datetime.fromisoformat(str(value)).timestamp() * 1000)
@@ -0,0 +1,68 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+def default_workers():
+    """Number of cores available to this process."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def row_strips(height, n_strips):
+    """Splits `height` rows into at most n_strips contiguous slices, top to bottom."""
+    n_strips = max(1, min(n_strips, height))
+    step = -(-height // n_strips)
+    return [slice(start, min(start + step, height)) for start in range(0, height, step)]
+
+
+class TileExecutor:
+    """
+    Runs a function over raster tiles on a pool of workers.
+
+    Tiles are submitted in the order given (callers pass them in spatial,
+    row-major order) and results come back in that same order. At most
+    `max_pending` tiles are in flight, so memory stays bounded no matter how
+    many tiles a scene has.
+
+    Use kind='thread' for NumPy-heavy work (ufuncs release the GIL) and
+    kind='process' when the per-tile function holds the GIL; process workers
+    need a picklable, module-level function.
+    """
+
+    def __init__(self, workers=None, kind='thread', max_pending=None):
+        """
+        Args:
+            workers (int): Pool size (default: all available cores). 1 runs inline.
+            kind (str): 'thread' or 'process'.
+            max_pending (int): Tiles in flight at once (default: 2 per worker).
+        """
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.workers = max(1, workers or default_workers())
+        self.kind = kind
+        self.max_pending = max_pending or 2 * self.workers
+
+    def imap(self, fn, tiles):
+        """Applies fn to every tile and yields the results in tile order."""
+        if self.workers == 1:
+            for tile in tiles:
+                yield fn(tile)
+            return
+
+        pool_cls = ThreadPoolExecutor if self.kind == 'thread' else ProcessPoolExecutor
+        with pool_cls(max_workers=self.workers) as pool:
+            pending = deque()
+            for tile in tiles:
+                pending.append(pool.submit(fn, tile))
+                if len(pending) >= self.max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def run(self, fn, tiles):
+        """Applies fn to every tile for its side effects (e.g. writing into a shared array)."""
+        for _ in self.imap(fn, tiles):
+            pass
@@ -0,0 +1,325 @@
+"""
+Raster-scale mineral prospectivity: runs the trained MineralPredictor over a
+Sentinel-2 scene tile by tile and writes a georeferenced probability GeoTIFF
+(the local counterpart of the "Mineral Potential Heatmap" option in app.py).
+
+Each tile's feature stack is built from the same band math as
+Sentinel2Indices (via band_expressions), rescaled to the ranges of the
+training features, and classified in large predict_proba batches. Workers
+read, build and classify tiles; the calling thread writes them in order, so
+memory is bounded by the tile budget however large the scene is.
+"""
+import os
+from functools import partial
+import numpy as np
+import pandas as pd
+
+try:
+    import rasterio
+    HAS_RASTERIO = True
+except ImportError:
+    HAS_RASTERIO = False
+
+import joblib
+
+from band_expressions import compile_expression, bind
+from band_math import BandMath
+from index_graph import IndexGraph, node_bands
+from parallel_tiles import TileExecutor
+from tiled_indices import DEFAULT_BAND_ORDER, plan_windows, tile_pixels_for_budget, _open_dataset, _close_datasets
+
+# Training feature -> (expression, offset, scale, lower, upper): the feature
+# is clip(offset + scale * expression, lower, upper), which maps the index
+# onto the range the synthetic training data uses for that feature.
+DEFAULT_FEATURES = {
+    'clay_index': ("b('B11') / b('B12')", -1.0, 1.0, 0.0, 1.0),
+    'iron_oxide': ("b('B4') / b('B2')", -1.0 / 3, 1.0 / 3, 0.0, 1.0),
+    'ferrous_iron': ("b('B12') / b('B8') + b('B3') / b('B4')", -0.5, 0.5, 0.0, 1.0),
+    'ndvi': ("(b('B8') - b('B4')) / (b('B8') + b('B4'))", 0.0, 1.0, -1.0, 1.0),
+    'ndwi': ("(b('B3') - b('B8')) / (b('B3') + b('B8'))", 0.0, 1.0, -1.0, 1.0),
+    'soil_moisture': ("(b('B8A') - b('B11')) / (b('B8A') + b('B11'))", 35.0, 50.0, 10.0, 60.0),
+}
+
+# Features without a band expression: read from an aligned raster when one is
+# given (e.g. a DEM, the distance-to-fault raster of fault_distance.py),
+# otherwise held at a typical value for the district.
+DEFAULT_CONSTANTS = {
+    'elevation': 950.0,
+    'slope': 10.0,
+    'fault_distance': 2000.0,
+}
+
+# Rows per predict_proba call: large enough to amortise per-call overhead,
+# small enough that the forest's per-batch buffers stay modest.
+PREDICT_BATCH_ROWS = 1 << 18
+
+NODATA = -1.0
+
+# Tile-size float32 arrays per feature besides the bands: the feature column
+# and predict_proba's two-class output (float64).
+BYTES_PER_FEATURE = 4
+PROBA_BYTES = 16
+
+
+def load_model(model):
+    """
+    A fitted classifier from a MineralPredictor, an estimator, a joblib path,
+    or a compiled forest directory (MineralPredictor.export_compiled).
+    """
+    if isinstance(model, str) and os.path.isdir(model):
+        from src.compiled_forest import CompiledForest
+        model = CompiledForest.load(model)
+    elif isinstance(model, str):
+        model = joblib.load(model)
+    model = getattr(model, 'model', model)
+    if not hasattr(model, 'predict_proba'):
+        raise TypeError(f"{type(model).__name__} has no predict_proba.")
+    return model
+
+
+class FeatureStack:
+    """
+    Builds the model's feature matrix for a block of bands.
+    """
+
+    def __init__(self, feature_names, features=None, constants=None, aux=None):
+        """
+        Args:
+            feature_names (list): Features in the order the model was trained on.
+            features (dict): Expression features (default: DEFAULT_FEATURES).
+            constants (dict): Constant fallbacks (default: DEFAULT_CONSTANTS).
+            aux (dict): Feature name -> aligned single-band raster path.
+        """
+        self.feature_names = list(feature_names)
+        self.features = DEFAULT_FEATURES if features is None else features
+        self.constants = DEFAULT_CONSTANTS if constants is None else constants
+        self.aux = aux or {}
+
+        nodes = {}
+        for name in self.feature_names:
+            if name in self.aux:
+                continue
+            if name in self.features:
+                nodes[name], _ = bind(compile_expression(self.features[name][0]))
+            elif name not in self.constants:
+                raise ValueError(f"No expression, raster or constant for feature {name!r}.")
+        self.math = BandMath(IndexGraph(nodes), dtype='float32')
+        self.expression_names = list(nodes)
+        self.bands = set()
+        for node in nodes.values():
+            self.bands |= node_bands(node)
+
+    def build(self, bands, aux_values, valid):
+        """
+        Returns:
+            ndarray: float32 (valid pixels, features) matrix in model order.
+        """
+        values = self.math.evaluate(bands, self.expression_names) if self.expression_names else {}
+        matrix = np.empty((int(valid.sum()), len(self.feature_names)), dtype=np.float32)
+        for j, name in enumerate(self.feature_names):
+            if name in aux_values:
+                matrix[:, j] = aux_values[name][valid]
+            elif name in values:
+                _, offset, scale, lower, upper = self.features[name]
+                column = values[name][valid]
+                column *= scale
+                column += offset
+                np.clip(column, lower, upper, out=column)
+                matrix[:, j] = column
+            else:
+                matrix[:, j] = self.constants[name]
+        return matrix
+
+
+def read_features(path, band_order, stack, aux, window):
+    """
+    Feature matrix of one window's valid pixels.
+
+    Returns:
+        tuple: (float32 (valid pixels, features) matrix or None if no pixel
+        is valid, boolean valid mask of the window)
+    """
+    src = _open_dataset(path)
+    bands = {}
+    valid = np.ones((window.height, window.width), dtype=bool)
+    for i, b in enumerate(band_order):
+        if b not in stack.bands:
+            continue
+        data = src.read(i + 1, window=window, out_dtype='float32')
+        if src.nodata is not None:
+            valid &= data != src.nodata
+        bands[b] = data
+
+    aux_values = {}
+    for name, aux_path in aux.items():
+        aux_src = _open_dataset(aux_path)
+        data = aux_src.read(1, window=window, out_dtype='float32')
+        if aux_src.nodata is not None:
+            valid &= data != aux_src.nodata
+        aux_values[name] = data
+
+    if not valid.any():
+        return None, valid
+    return stack.build(bands, aux_values, valid), valid
+
+
+def predict_window(path, band_order, stack, model, aux, window, batch_rows=PREDICT_BATCH_ROWS):
+    """
+    Probability of mineral occurrence for one window. Module-level so it can
+    run on a process pool as well as a thread pool.
+
+    Returns:
+        tuple: (window, float32 array with NODATA where the input is nodata)
+    """
+    matrix, valid = read_features(path, band_order, stack, aux, window)
+    probability = np.full((window.height, window.width), NODATA, dtype=np.float32)
+    if matrix is None:
+        return window, probability
+
+    positive = list(model.classes_).index(1) if 1 in model.classes_ else len(model.classes_) - 1
+    scores = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), batch_rows):
+        batch = pd.DataFrame(matrix[start:start + batch_rows], columns=stack.feature_names, copy=False)
+        scores[start:start + batch_rows] = model.predict_proba(batch)[:, positive]
+    probability[valid] = scores
+    return window, probability
+
+
+class ProspectivityMapper:
+    """
+    Tiled prospectivity inference over a multi-band Sentinel-2 GeoTIFF.
+    """
+
+    def __init__(self, path, model, band_order=DEFAULT_BAND_ORDER, aux=None, features=None, constants=None,
+                 tile_budget_mb=256, workers=1, kind='thread', batch_rows=PREDICT_BATCH_ROWS):
+        """
+        Args:
+            path (str): Multi-band GeoTIFF holding the Sentinel-2 bands.
+            model: MineralPredictor, fitted classifier, path to its joblib file,
+                or a compiled forest directory.
+            band_order (sequence): Band name of each raster band, in file order.
+            aux (dict): Feature name -> single-band raster on the same grid
+                (e.g. {'elevation': 'dem.tif', 'fault_distance': 'faults.tif'}).
+            features (dict): Expression features (default: DEFAULT_FEATURES).
+            constants (dict): Constant features (default: DEFAULT_CONSTANTS).
+            tile_budget_mb (float): Memory all tiles in flight may use together.
+            workers (int): Tiles classified in parallel (None = all cores).
+            kind (str): 'thread' (tree prediction releases the GIL) or 'process'.
+            batch_rows (int): Pixels per predict_proba call.
+        """
+        if not HAS_RASTERIO:
+            raise ImportError("rasterio is required for tiled inference.")
+        self.path = path
+        self.model = load_model(model)
+        self.band_order = tuple(band_order)
+        self.aux = dict(aux or {})
+        self.tile_budget_mb = tile_budget_mb
+        self.batch_rows = batch_rows
+        self.executor = TileExecutor(workers, kind)
+
+        feature_names = getattr(self.model, 'feature_names_in_', None)
+        if feature_names is None:
+            raise ValueError("The model was not fitted on named features; cannot map bands to its inputs.")
+        self.stack = FeatureStack(feature_names, features, constants, self.aux)
+        missing = self.stack.bands - set(self.band_order)
+        if missing:
+            raise ValueError(f"Features need bands that are not in the raster: {', '.join(sorted(missing))}")
+
+        with rasterio.open(path) as src:
+            for name, aux_path in self.aux.items():
+                with rasterio.open(aux_path) as aux_src:
+                    if (aux_src.height, aux_src.width) != (src.height, src.width) or aux_src.transform != src.transform:
+                        raise ValueError(f"Raster for {name} ({aux_path}) is not on the grid of {path}.")
+
+    def windows(self, src):
+        """Tile layout under the configured budget."""
+        n_features = len(self.stack.feature_names)
+        # Expression outputs, the feature matrix and the class probabilities,
+        # in float32-sized units.
+        per_pixel_outputs = len(self.stack.expression_names) + (n_features * BYTES_PER_FEATURE + PROBA_BYTES) // 4 + 1
+        max_pixels = tile_pixels_for_budget(
+            self.tile_budget_mb, len(self.stack.bands) + len(self.aux), per_pixel_outputs,
+            tiles_in_flight=self.executor.max_pending if self.executor.workers > 1 else 1,
+        )
+        return plan_windows(src.height, src.width, max_pixels, src.block_shapes[0])
+
+    def labelled_batches(self, labels_path):
+        """
+        Yields (features DataFrame, labels) per tile for the pixels that are
+        valid in the scene and labelled in `labels_path`, for a streaming
+        holdout evaluation (MineralPredictor.evaluate_stream). One tile is
+        held in memory at a time.
+
+        Args:
+            labels_path (str): Single-band ground-truth raster on the scene's
+                grid (e.g. 0/1 occurrence mask); its nodata marks unlabelled pixels.
+        """
+        with rasterio.open(self.path) as src, rasterio.open(labels_path) as labels_src:
+            if (labels_src.height, labels_src.width) != (src.height, src.width) or labels_src.transform != src.transform:
+                raise ValueError(f"Labels raster {labels_path} is not on the grid of {self.path}.")
+            windows = self.windows(src)
+        try:
+            for window in windows:
+                labels_src = _open_dataset(labels_path)
+                labels = labels_src.read(1, window=window)
+                matrix, valid = read_features(self.path, self.band_order, self.stack, self.aux, window)
+                if matrix is None:
+                    continue
+                labelled = np.ones(len(matrix), dtype=bool) if labels_src.nodata is None \
+                    else labels[valid] != labels_src.nodata
+                if labelled.any():
+                    yield (pd.DataFrame(matrix[labelled], columns=self.stack.feature_names, copy=False),
+                           labels[valid][labelled])
+        finally:
+            _close_datasets()
+
+    def run(self, output_path):
+        """
+        Classifies the whole scene and writes the probability raster.
+
+        Returns:
+            str: output_path
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        cache_mb = max(16, int(self.tile_budget_mb // 4))
+        with rasterio.Env(GDAL_CACHEMAX=cache_mb):
+            with rasterio.open(self.path) as src:
+                profile = src.profile.copy()
+                windows = self.windows(src)
+            profile.update(
+                driver='GTiff', count=1, dtype='float32', nodata=NODATA,
+                tiled=True, blockxsize=256, blockysize=256,
+                compress='deflate', predictor=3, BIGTIFF='IF_SAFER',
+            )
+            profile.pop('photometric', None)
+
+            predict = partial(predict_window, self.path, self.band_order, self.stack, self.model,
+                              self.aux, batch_rows=self.batch_rows)
+            try:
+                with rasterio.open(output_path, 'w', **profile) as dst:
+                    dst.set_band_description(1, 'mineral_occurrence_probability')
+                    for window, probability in self.executor.imap(predict, windows):
+                        dst.write(probability, 1, window=window)
+            finally:
+                _close_datasets()
+        return output_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tiled mineral prospectivity inference.")
+    parser.add_argument("raster", help="Multi-band Sentinel-2 GeoTIFF")
+    parser.add_argument("model", help="Model file written by MineralPredictor.save(), or a directory "
+                                      "written by MineralPredictor.export_compiled()")
+    parser.add_argument("output", help="Probability GeoTIFF to write")
+    parser.add_argument("--aux", nargs='*', default=[], metavar="FEATURE=RASTER",
+                        help="Aligned rasters for non-spectral features, e.g. elevation=dem.tif")
+    parser.add_argument("--tile-budget-mb", type=float, default=256)
+    parser.add_argument("--workers", type=int, default=1, help="0 = all cores")
+    args = parser.parse_args()
+
+    aux = dict(item.split('=', 1) for item in args.aux)
+    mapper = ProspectivityMapper(args.raster, args.model, aux=aux, tile_budget_mb=args.tile_budget_mb,
+                                 workers=args.workers or None)
+    print(mapper.run(args.output))
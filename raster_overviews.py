@@ -0,0 +1,177 @@
+"""
+Cloud-optimized GeoTIFF ingest and overview selection for local rasters.
+
+The district stack ships as a strip-organised GeoTIFF, so a zoomed-out view
+has to read every pixel of it. convert_to_cog() rewrites a raster as an
+internally tiled, compressed COG with average-decimated overviews (2x, 4x,
+8x, ... until the image fits in about one block), and the readers (the
+tiled index engine, the local tile renderer and sample_points) open the
+coarsest overview that still resolves the requested pixel size. A view at
+8x the native pixel size reads the 8x overview: 1/64th of the pixels.
+
+Usage:
+    python raster_overviews.py data/Clipped_Zvishavane_District_20m.tif
+"""
+import os
+import tempfile
+import argparse
+import numpy as np
+
+try:
+    import rasterio
+    import rasterio.shutil
+    HAS_RASTERIO = True
+except ImportError:
+    HAS_RASTERIO = False
+
+COG_SUFFIX = '.cog.tif'
+COG_BLOCKSIZE = 512
+COG_COMPRESS = 'DEFLATE'
+OVERVIEW_RESAMPLING = 'AVERAGE'
+
+
+def cog_path(path):
+    """'data/scene.tif' -> 'data/scene.cog.tif'"""
+    if path.endswith(COG_SUFFIX):
+        return path
+    return os.path.splitext(path)[0] + COG_SUFFIX
+
+
+def preferred_source(path):
+    """
+    The COG converted from `path` when there is one at least as new as the
+    source (or the source is gone), else `path` itself.
+    """
+    cog = cog_path(path)
+    if cog != path and os.path.exists(cog):
+        if not os.path.exists(path) or os.path.getmtime(cog) >= os.path.getmtime(path):
+            return cog
+    return path
+
+
+def is_cog(path):
+    """True if the raster is internally tiled and has overviews."""
+    with rasterio.open(path) as src:
+        return bool(src.profile.get('tiled')) and bool(src.overviews(1))
+
+
+def convert_to_cog(path, output_path=None, blocksize=COG_BLOCKSIZE, compress=COG_COMPRESS,
+                   resampling=OVERVIEW_RESAMPLING, workers=None):
+    """
+    Writes `path` as a cloud-optimized GeoTIFF with decimated overviews.
+
+    GDAL's COG driver streams the conversion block by block, so memory does
+    not grow with the raster. Nodata, georeferencing and band descriptions
+    are kept; the output is written to a temporary file and moved into place.
+
+    Args:
+        path (str): Source raster.
+        output_path (str): Destination (default: cog_path(path)).
+        blocksize (int): Internal tile edge in pixels.
+        compress (str): TIFF compression (DEFLATE, ZSTD, LZW, ...).
+        resampling (str): Overview resampling (AVERAGE keeps index ratios unbiased).
+        workers (int): Compression threads (None = all cores).
+
+    Returns:
+        str: output_path
+    """
+    if not HAS_RASTERIO:
+        raise ImportError("rasterio is required for COG conversion.")
+    output_path = output_path or cog_path(path)
+    directory = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp.tif')
+    os.close(fd)
+    try:
+        rasterio.shutil.copy(
+            path, tmp, driver='COG',
+            BLOCKSIZE=blocksize, COMPRESS=compress, PREDICTOR='YES',
+            RESAMPLING=resampling, OVERVIEW_RESAMPLING=resampling, OVERVIEWS='IGNORE_EXISTING',
+            NUM_THREADS=str(workers) if workers else 'ALL_CPUS', BIGTIFF='IF_SAFER',
+        )
+        os.replace(tmp, output_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return output_path
+
+
+def pick_overview(factors, decimation):
+    """
+    Index of the coarsest overview whose factor does not exceed `decimation`
+    (the requested pixel size over the native one), or None for full resolution.
+
+    Args:
+        factors (list): Overview factors, ascending (dataset.overviews(band)).
+        decimation (float): Requested / native pixel size.
+    """
+    level = None
+    for i, factor in enumerate(factors):
+        # A little slack, as overview dimensions are rounded.
+        if factor <= decimation * 1.001:
+            level = i
+    return level
+
+
+def overview_level(path, resolution):
+    """
+    Overview level to open `path` at for pixels of `resolution` CRS units
+    (None = full resolution).
+    """
+    if resolution is None:
+        return None
+    with rasterio.open(path) as src:
+        native = max(abs(src.res[0]), abs(src.res[1]))
+        return pick_overview(src.overviews(1), resolution / native)
+
+
+def open_at(path, level=None):
+    """Opens the raster itself (level None) or one of its overviews."""
+    if level is None:
+        return rasterio.open(path)
+    return rasterio.open(path, overview_level=level)
+
+
+def sample_points(path, xs, ys, resolution=None, indexes=None):
+    """
+    Raster values at points, read from the coarsest overview that resolves
+    `resolution`.
+
+    Args:
+        path (str): Raster.
+        xs, ys (sequence): Point coordinates in the raster's CRS.
+        resolution (float): Pixel size the values should represent, in CRS
+            units (None = native pixels).
+        indexes (list): 1-based bands to read (default: all).
+
+    Returns:
+        ndarray: (n_points, n_bands) values; points off the raster get nodata (or 0).
+    """
+    with open_at(path, overview_level(path, resolution)) as src:
+        indexes = indexes or list(range(1, src.count + 1))
+        values = np.array(list(src.sample(zip(xs, ys), indexes=indexes)))
+    return values.reshape(len(xs), len(indexes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert local rasters to cloud-optimized GeoTIFFs with overviews.")
+    parser.add_argument("rasters", nargs="+", help="GeoTIFFs to convert")
+    parser.add_argument("--output-dir", help="Write the COGs here (default: next to each source as *.cog.tif)")
+    parser.add_argument("--blocksize", type=int, default=COG_BLOCKSIZE)
+    parser.add_argument("--compress", default=COG_COMPRESS)
+    parser.add_argument("--workers", type=int, default=0, help="0 = all cores")
+    args = parser.parse_args()
+
+    for path in args.rasters:
+        output = cog_path(path)
+        if args.output_dir:
+            output = os.path.join(args.output_dir, os.path.basename(output))
+        convert_to_cog(path, output, args.blocksize, args.compress, workers=args.workers or None)
+        with rasterio.open(output) as src:
+            print(f"{path} -> {output} (overviews {src.overviews(1)}, "
+                  f"{os.path.getsize(path) / 2**20:.1f} MB -> {os.path.getsize(output) / 2**20:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import os
+import json
+import numpy as np
+
+# Arrays of the flattened format, one .npy file each.
+ARRAYS = ("feature", "threshold", "children", "missing_left", "value", "roots")
+META_NAME = "forest.json"
+
+# Rows x trees walks held at once; small enough that the per-level
+# temporaries stay in cache.
+WALK_CELLS = 1 << 18
+
+
+class CompiledForest:
+    """
+    A random forest classifier flattened into contiguous NumPy arrays.
+
+    All nodes of all trees share one set of arrays: split feature, threshold,
+    (left, right) children and per-leaf class probabilities. Leaves point to
+    themselves, so predict_proba() can walk every tree one level per step
+    with plain fancy indexing until all rows reach their leaves. Probabilities
+    are accumulated tree by tree in the same order and precision as
+    scikit-learn, so results match RandomForestClassifier.predict_proba exactly.
+
+    Loading needs only NumPy; the arrays are memory-mapped.
+    """
+
+    def __init__(self, arrays, classes, feature_names=None, max_depth=None):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        # (n_nodes, 2): left and right child; both point back to the node at leaves.
+        self.children = arrays["children"]
+        self.missing_left = arrays["missing_left"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.classes_ = np.asarray(classes)
+        self.feature_names_in_ = None if feature_names is None else np.asarray(feature_names, dtype=object)
+        self.n_features_in_ = int(self.feature.max()) + 1 if len(self.feature) else 0
+        if feature_names is not None:
+            self.n_features_in_ = len(feature_names)
+        self._is_leaf = self.children[:, 0] == np.arange(len(self.children))
+        self.max_depth = max_depth if max_depth is not None else self._depth()
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Flattens a fitted RandomForestClassifier (or a MineralPredictor wrapping one)."""
+        model = getattr(model, "model", model)
+        if model.n_outputs_ != 1:
+            raise ValueError("Only single-output forests can be compiled.")
+
+        import sklearn
+        # scikit-learn < 1.4 stores class counts in tree_.value and normalises
+        # at predict time; later versions store the fractions directly.
+        normalize = tuple(int(p) for p in sklearn.__version__.split(".")[:2]) < (1, 4)
+
+        features, thresholds, lefts, rights, missing, values, roots = [], [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            nodes = np.arange(n)
+            leaf = tree.children_left < 0
+
+            roots.append(offset)
+            features.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(np.where(leaf, np.inf, tree.threshold))
+            lefts.append(np.where(leaf, nodes, tree.children_left) + offset)
+            rights.append(np.where(leaf, nodes, tree.children_right) + offset)
+            mgl = getattr(tree, "missing_go_to_left", None)
+            missing.append(np.zeros(n, dtype=bool) if mgl is None else np.asarray(mgl, dtype=bool))
+
+            proba = tree.value[:, 0, :model.n_classes_].astype(np.float64)
+            if normalize:
+                # Same normalisation as DecisionTreeClassifier.predict_proba.
+                normalizer = proba.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                proba = proba / normalizer
+            values.append(proba)
+
+            offset += n
+            max_depth = max(max_depth, tree.max_depth)
+
+        arrays = {
+            "feature": np.concatenate(features),
+            "threshold": np.concatenate(thresholds),
+            "children": np.stack([np.concatenate(lefts), np.concatenate(rights)], axis=1).astype(np.int64),
+            "missing_left": np.concatenate(missing),
+            "value": np.concatenate(values),
+            "roots": np.asarray(roots, dtype=np.int64),
+        }
+        names = getattr(model, "feature_names_in_", None)
+        return cls(arrays, model.classes_, None if names is None else list(names), max_depth)
+
+    def _depth(self):
+        depth = 0
+        idx = np.asarray(self.roots)
+        while not self._is_leaf[idx].all():
+            idx = np.unique(self.children[idx[~self._is_leaf[idx]]].ravel())
+            depth += 1
+        return depth
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def node_count(self):
+        return len(self.feature)
+
+    def _as_matrix(self, X):
+        if hasattr(X, "columns"):
+            if self.feature_names_in_ is not None and list(X.columns) != list(self.feature_names_in_):
+                X = X[list(self.feature_names_in_)]
+            X = X.to_numpy()
+        # Trees compare float32 inputs against float64 thresholds, as in scikit-learn.
+        return np.ascontiguousarray(X, dtype=np.float32)
+
+    def apply(self, X):
+        """Leaf index (into the flattened arrays) of every row in every tree."""
+        X = self._as_matrix(X)
+        n, n_trees = X.shape[0], self.n_trees
+        flat = X.ravel()
+        children = self.children.ravel()
+        has_missing = bool(self.missing_left.any()) and bool(np.isnan(flat).any())
+
+        # One entry per (tree, row) walk, tree-major so each tree's nodes are
+        # touched together. Finished walks sit on their (self-looping) leaf
+        # and are dropped in batches once enough of them have accumulated.
+        node = np.repeat(np.asarray(self.roots), n)
+        base = np.tile(np.arange(n, dtype=np.int64) * X.shape[1], n_trees)
+        walk = np.arange(n * n_trees, dtype=np.int64)
+        leaves = np.empty(n * n_trees, dtype=np.int64)
+        while walk.size:
+            x = flat[base + self.feature[node]]
+            go_right = ~(x <= self.threshold[node])
+            if has_missing:
+                nan = np.isnan(x)
+                go_right[nan] = ~self.missing_left[node[nan]]
+            node = children[2 * node + go_right]
+            done = self._is_leaf[node]
+            n_done = np.count_nonzero(done)
+            if n_done == walk.size or n_done * 4 > walk.size:
+                leaves[walk[done]] = node[done]
+                keep = ~done
+                node, base, walk = node[keep], base[keep], walk[keep]
+        return leaves.reshape(n_trees, n).T
+
+    def predict_proba(self, X):
+        X = self._as_matrix(X)
+        proba = np.zeros((len(X), len(self.classes_)), dtype=np.float64)
+        step = max(1, WALK_CELLS // max(1, self.n_trees))
+        for start in range(0, len(X), step):
+            leaves = self.apply(X[start:start + step])
+            out = proba[start:start + step]
+            # Accumulate in tree order, like the forest's sequential reduction.
+            for t in range(self.n_trees):
+                out += self.value[leaves[:, t]]
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def save(self, directory):
+        """Writes the arrays as .npy files plus a small JSON header."""
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+        meta = {
+            "classes": self.classes_.tolist(),
+            "feature_names": None if self.feature_names_in_ is None else list(self.feature_names_in_),
+            "max_depth": int(self.max_depth),
+            "n_trees": self.n_trees,
+        }
+        with open(os.path.join(directory, META_NAME), "w") as f:
+            json.dump(meta, f, indent=2)
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Loads a saved forest; with mmap=True the arrays are memory-mapped, not read."""
+        with open(os.path.join(directory, META_NAME)) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r" if mmap else None)
+            for name in ARRAYS
+        }
+        return cls(arrays, meta["classes"], meta["feature_names"], meta["max_depth"])
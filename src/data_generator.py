@@ -1,10 +1,80 @@
+import os
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
+from scipy import ndimage as ndi
+from scipy import stats
+from .data_store import PartitionedStore, write_partition
+
+FEATURES = ['clay_index', 'iron_oxide', 'ferrous_iron', 'ndvi', 'ndwi', 'soil_moisture',
+            'elevation', 'slope', 'fault_distance']
+TARGET = 'mineral_occurrence'
+
+# Rows per shard of generate_sharded(); each shard is one Parquet partition.
+SHARD_ROWS = 1_000_000
+
+# Spatial variant: square patches of PATCH_SIZE pixels of PIXEL_SIZE metres,
+# with features correlated over CORRELATION_LENGTH pixels.
+PATCH_SIZE = 256
+PIXEL_SIZE = 20.0
+CORRELATION_LENGTH = 16.0
+FAULTS_PER_PATCH = 3
+QUANTILE_POINTS = 4097
+
+
+def _features(rng, n_samples):
+    """Independent feature draws; rng is a RandomState or a Generator."""
+    return pd.DataFrame({
+        'clay_index': rng.beta(2, 5, n_samples),
+        'iron_oxide': rng.beta(2, 5, n_samples),
+        'ferrous_iron': rng.beta(2, 5, n_samples),
+        'ndvi': rng.uniform(-0.2, 0.8, n_samples),
+        'ndwi': rng.uniform(-0.5, 0.5, n_samples),
+        'soil_moisture': rng.uniform(10, 60, n_samples),
+        'elevation': rng.uniform(100, 3000, n_samples),
+        'slope': rng.gamma(2, 10, n_samples),
+        'fault_distance': rng.exponential(2000, n_samples),
+    })
+
+
+def _occurrence(df, rng):
+    """
+    Draws the target from the features (probabilistic). Higher probability if:
+    - High Iron Oxide/Clay (Alteration zones)
+    - Low NDVI (Vegetation stress)
+    - Close to faults
+    """
+    n_samples = len(df)
+    prob = np.zeros(n_samples)
+
+    # Base probability
+    prob += 0.1
+
+    # Mineral indices influence
+    prob += df['iron_oxide'] * 0.4
+    prob += df['clay_index'] * 0.3
+
+    # Structural influence (closer to faults is better)
+    prob += np.exp(-df['fault_distance'] / 1000) * 0.3
+
+    # Vegetation stress (lower NDVI might indicate mineralization)
+    prob += (1 - (df['ndvi'] + 1)/2) * 0.1
+
+    # Add some noise
+    prob += rng.normal(0, 0.05, n_samples)
+
+    # Sigmoid to clip to 0-1
+    prob = 1 / (1 + np.exp(-5 * (prob - 0.5)))
+
+    # Threshold for occurrence
+    return (prob > rng.uniform(0, 1, n_samples)).astype(int)
+
 
 def generate_synthetic_data(n_samples=1000, random_state=42):
     """
     Generates synthetic GIS/RS data for mineral occurrence prediction.
-    
+
     Features:
     - Clay Index (0-1)
     - Iron Oxide (0-1)
@@ -15,58 +85,163 @@ def generate_synthetic_data(n_samples=1000, random_state=42):
     - Elevation (0-5000m)
     - Slope (0-90 degrees)
     - Fault Distance (0-10000m)
-    
+
     Target:
     - Mineral Occurrence (0 or 1)
+
+    Uses its own RandomState (the same stream np.random.seed(random_state)
+    gives), so the global NumPy random state is left alone.
+    """
+    rng = np.random.RandomState(random_state)
+    df = _features(rng, n_samples)
+    df[TARGET] = _occurrence(df, rng)
+    return df
+
+
+@lru_cache(maxsize=None)
+def _quantile_table(name, *args):
+    """Inverse CDF of a scipy.stats distribution, tabulated for np.interp."""
+    u = np.linspace(0.0, 1.0, QUANTILE_POINTS)
+    return u, getattr(stats, name).ppf(np.clip(u, 1e-7, 1 - 1e-7), *args)
+
+
+def _ppf(u, name, *args):
+    # Tabulated: scipy's beta/gamma ppf would take most of a patch's time.
+    return np.interp(u, *_quantile_table(name, *args))
+
+
+def _smooth_uniform(rng, shape, correlation_length):
+    """Spatially correlated field with uniform(0, 1) marginals."""
+    field = ndi.gaussian_filter(rng.standard_normal(shape), correlation_length, mode='wrap')
+    field /= field.std() or 1.0
+    return stats.norm.cdf(field)
+
+
+def _patch_features(rng, patch_size, correlation_length, pixel_size):
     """
-    np.random.seed(random_state)
-    
-    data = {
-        'clay_index': np.random.beta(2, 5, n_samples),
-        'iron_oxide': np.random.beta(2, 5, n_samples),
-        'ferrous_iron': np.random.beta(2, 5, n_samples),
-        'ndvi': np.random.uniform(-0.2, 0.8, n_samples),
-        'ndwi': np.random.uniform(-0.5, 0.5, n_samples),
-        'soil_moisture': np.random.uniform(10, 60, n_samples),
-        'elevation': np.random.uniform(100, 3000, n_samples),
-        'slope': np.random.gamma(2, 10, n_samples),
-        'fault_distance': np.random.exponential(2000, n_samples)
+    One square patch of pixels as feature rows. The spectral, moisture,
+    elevation and slope features keep the marginal distributions of
+    generate_synthetic_data, but neighbouring pixels are correlated,
+    alteration indices co-vary and slope follows the terrain. Fault distance
+    is measured to FAULTS_PER_PATCH random straight faults.
+    """
+    shape = (patch_size, patch_size)
+    alteration = _smooth_uniform(rng, shape, correlation_length)
+    vegetation = _smooth_uniform(rng, shape, correlation_length)
+    wetness = _smooth_uniform(rng, shape, correlation_length)
+
+    def mixed(base, weight):
+        # Blend of a shared and an own field, back on uniform marginals.
+        own = ndi.gaussian_filter(rng.standard_normal(shape), correlation_length, mode='wrap')
+        z = weight * stats.norm.ppf(np.clip(base, 1e-9, 1 - 1e-9)) + (1 - weight) * own / (own.std() or 1.0)
+        return stats.norm.cdf(z / np.hypot(weight, 1 - weight))
+
+    terrain = ndi.gaussian_filter(rng.standard_normal(shape), 4 * correlation_length, mode='wrap')
+    terrain_u = stats.norm.cdf(terrain / (terrain.std() or 1.0))
+    elevation = 100 + 2900 * terrain_u
+    gy, gx = np.gradient(elevation, pixel_size)
+    slope = np.degrees(np.arctan(np.hypot(gx, gy)))
+    # Rank-map slope onto the gamma(2, 10) marginal of the independent data.
+    ranks = (np.argsort(np.argsort(slope, axis=None)) + 0.5) / slope.size
+    slope = 10 * _ppf(ranks, 'gamma', 2).reshape(shape)
+
+    faults = np.zeros(shape, dtype=bool)
+    for _ in range(FAULTS_PER_PATCH):
+        (r0, c0), angle = rng.uniform(0, patch_size, 2), rng.uniform(0, np.pi)
+        t = np.arange(-2 * patch_size, 2 * patch_size)
+        rr = np.round(r0 + t * np.sin(angle)).astype(int)
+        cc = np.round(c0 + t * np.cos(angle)).astype(int)
+        inside = (rr >= 0) & (rr < patch_size) & (cc >= 0) & (cc < patch_size)
+        faults[rr[inside], cc[inside]] = True
+    fault_distance = ndi.distance_transform_edt(~faults, sampling=pixel_size)
+
+    columns = {
+        'clay_index': _ppf(mixed(alteration, 0.8), 'beta', 2, 5),
+        'iron_oxide': _ppf(mixed(alteration, 0.8), 'beta', 2, 5),
+        'ferrous_iron': _ppf(mixed(alteration, 0.5), 'beta', 2, 5),
+        'ndvi': -0.2 + 1.0 * vegetation,
+        'ndwi': -0.5 + 1.0 * mixed(wetness, 0.7),
+        'soil_moisture': 10 + 50 * mixed(wetness, 0.7),
+        'elevation': elevation,
+        'slope': slope,
+        'fault_distance': fault_distance,
     }
-    
-    df = pd.DataFrame(data)
-    
-    # Generate target based on some logical rules (probabilistic)
-    # Higher probability if:
-    # - High Iron Oxide/Clay (Alteration zones)
-    # - Low NDVI (Vegetation stress)
-    # - Close to faults
-    
-    prob = np.zeros(n_samples)
-    
-    # Base probability
-    prob += 0.1
-    
-    # Mineral indices influence
-    prob += df['iron_oxide'] * 0.4
-    prob += df['clay_index'] * 0.3
-    
-    # Structural influence (closer to faults is better)
-    prob += np.exp(-df['fault_distance'] / 1000) * 0.3
-    
-    # Vegetation stress (lower NDVI might indicate mineralization)
-    prob += (1 - (df['ndvi'] + 1)/2) * 0.1
-    
-    # Add some noise
-    prob += np.random.normal(0, 0.05, n_samples)
-    
-    # Sigmoid to clip to 0-1
-    prob = 1 / (1 + np.exp(-5 * (prob - 0.5)))
-    
-    # Threshold for occurrence
-    df['mineral_occurrence'] = (prob > np.random.uniform(0, 1, n_samples)).astype(int)
-    
+    return pd.DataFrame({name: columns[name].ravel() for name in FEATURES})
+
+
+def synthetic_shard(index, n_samples, seed=42, spatial=False, patch_size=PATCH_SIZE,
+                    correlation_length=CORRELATION_LENGTH, pixel_size=PIXEL_SIZE):
+    """
+    Rows of one shard. The shard's random stream is derived from
+    SeedSequence(seed) and the shard index alone, so a shard is the same
+    whichever worker generates it and whatever the number of workers.
+
+    Args:
+        index (int): Shard number.
+        n_samples (int): Rows in the shard.
+        seed (int): Seed of the whole data set.
+        spatial (bool): Rows are the pixels of spatially correlated patches
+            (row-major, patch after patch) instead of independent draws.
+    """
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(index,)))
+    if spatial:
+        patches = []
+        remaining = n_samples
+        while remaining > 0:
+            patch = _patch_features(rng, patch_size, correlation_length, pixel_size)
+            patches.append(patch.iloc[:remaining])
+            remaining -= len(patch)
+        df = pd.concat(patches, ignore_index=True)
+    else:
+        df = _features(rng, n_samples)
+    df[TARGET] = _occurrence(df, rng)
     return df
 
+
+def _write_shard(task):
+    """Generates one shard and writes it as a partition; runs in a worker process."""
+    root, number, index, n_samples, seed, options = task
+    return write_partition(root, number, synthetic_shard(index, n_samples, seed, **options))
+
+
+def generate_sharded(n_samples, root, shard_rows=SHARD_ROWS, seed=42, workers=None, spatial=False, **options):
+    """
+    Generates a large synthetic training set in shards on a process pool.
+
+    Every shard is written by its worker straight to a Parquet partition of a
+    PartitionedStore, so no process holds more than one shard. The manifest
+    lists the shards in order once they are all written; the result depends
+    only on (n_samples, shard_rows, seed, spatial, options), not on `workers`.
+
+    Args:
+        n_samples (int): Total rows.
+        root (str): Directory of the PartitionedStore to append the shards to.
+        shard_rows (int): Rows per shard.
+        seed (int): Seed of the data set.
+        workers (int): Worker processes (default: all cores).
+        spatial (bool): Spatially correlated variant (see synthetic_shard).
+        **options: patch_size, correlation_length, pixel_size for the spatial variant.
+
+    Returns:
+        PartitionedStore: The store holding the shards.
+    """
+    store = PartitionedStore(root)
+    os.makedirs(root, exist_ok=True)
+    first = store.next_id()
+    options = dict(options, spatial=spatial)
+    tasks = []
+    for index, start in enumerate(range(0, n_samples, shard_rows)):
+        tasks.append((root, first + index, index, min(shard_rows, n_samples - start), seed, options))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        entries = [_write_shard(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            entries = list(pool.map(_write_shard, tasks))
+    store.add_partitions(entries, FEATURES + [TARGET])
+    return store
+
 if __name__ == "__main__":
     print("Generating synthetic data...")
     df = generate_synthetic_data(n_samples=100)
@@ -0,0 +1,211 @@
+import os
+import json
+import glob
+import tempfile
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.dataset as ds
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+MANIFEST_NAME = "_manifest.json"
+PARTITION_PATTERN = "part-{:06d}.parquet"
+
+
+def _column_stats(df):
+    """Per-column min/max/null counts of a batch, used to skip partitions on read."""
+    stats = {}
+    for column in df.columns:
+        series = df[column]
+        entry = {"nulls": int(series.isna().sum())}
+        if pd.api.types.is_numeric_dtype(series) and series.notna().any():
+            entry["min"] = float(series.min())
+            entry["max"] = float(series.max())
+        stats[column] = entry
+    return stats
+
+
+def _atomic_write_json(path, payload):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp, path)
+
+
+def write_partition(root, number, df):
+    """
+    Writes `df` as partition `number` of the store in `root` without touching
+    the manifest (see PartitionedStore.add_partitions). Module-level so that
+    worker processes can write partitions in parallel.
+
+    Returns:
+        dict: The partition's manifest entry.
+    """
+    filename = PARTITION_PATTERN.format(number)
+    path = os.path.join(root, filename)
+    tmp = path + ".tmp"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp)
+    os.replace(tmp, path)
+    return {"id": number, "file": filename, "rows": len(df), "stats": _column_stats(df)}
+
+
+class PartitionedStore:
+    """
+    Append-only, columnar training data store.
+
+    Each appended batch becomes its own Parquet partition, and a small JSON
+    manifest records every partition with its row count and column statistics.
+    Appending writes only the new batch, so an update step costs O(batch),
+    not O(history). Reads are column-pruned and can skip whole partitions
+    using the manifest statistics.
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root (str): Directory holding the partitions and the manifest.
+        """
+        if not HAS_PYARROW:
+            raise ImportError("pyarrow is required for the partitioned data store.")
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def manifest(self):
+        if not self.exists():
+            return {"partitions": [], "schema": None}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def partitions(self, filters=None):
+        """
+        Partition entries from the manifest, skipping those whose statistics
+        rule out every row of `filters`.
+
+        Args:
+            filters (list): (column, op, value) tuples, op in ==, <, <=, >, >=.
+        """
+        entries = self.manifest()["partitions"]
+        if not filters:
+            return entries
+        return [p for p in entries if all(self._may_match(p["stats"], f) for f in filters)]
+
+    @staticmethod
+    def _may_match(stats, condition):
+        column, op, value = condition
+        entry = stats.get(column, {})
+        if "min" not in entry:
+            return True
+        low, high = entry["min"], entry["max"]
+        if op == "==":
+            return low <= value <= high
+        if op == "<":
+            return low < value
+        if op == "<=":
+            return low <= value
+        if op == ">":
+            return high > value
+        if op == ">=":
+            return high >= value
+        raise ValueError(f"Unsupported filter operator: {op}")
+
+    def num_rows(self):
+        return sum(p["rows"] for p in self.manifest()["partitions"])
+
+    def append(self, df):
+        """
+        Writes `df` as a new partition and records it in the manifest.
+
+        Returns:
+            dict: The manifest entry of the new partition.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        manifest = self.manifest()
+        schema = list(df.columns)
+        if manifest["schema"] is not None and manifest["schema"] != schema:
+            raise ValueError(f"Batch columns {schema} do not match the store schema {manifest['schema']}.")
+
+        entry = write_partition(self.root, self.next_id(manifest), df)
+        manifest["schema"] = schema
+        manifest["partitions"].append(entry)
+        # The partition file is in place before the manifest names it, so a
+        # crash in between leaves an orphan file, never a dangling entry.
+        _atomic_write_json(self.manifest_path, manifest)
+        return entry
+
+    def next_id(self, manifest=None):
+        """Id the next partition will get."""
+        manifest = manifest or self.manifest()
+        return max([p["id"] for p in manifest["partitions"]], default=0) + 1
+
+    def add_partitions(self, entries, schema):
+        """
+        Records partitions already written with write_partition() in the
+        manifest, in the order given, with one manifest write.
+        """
+        manifest = self.manifest()
+        schema = list(schema)
+        if manifest["schema"] is not None and manifest["schema"] != schema:
+            raise ValueError(f"Batch columns {schema} do not match the store schema {manifest['schema']}.")
+        manifest["schema"] = schema
+        manifest["partitions"].extend(entries)
+        _atomic_write_json(self.manifest_path, manifest)
+
+    def dataset(self, filters=None):
+        """Lazy pyarrow Dataset over the (pruned) partitions."""
+        files = [os.path.join(self.root, p["file"]) for p in self.partitions(filters)]
+        return ds.dataset(files, format="parquet")
+
+    def scan(self, columns=None, filters=None, batch_size=65536):
+        """Yields the stored rows as DataFrames, batch by batch, reading only `columns`."""
+        if not self.exists() or not self.partitions(filters):
+            # Nothing to scan; an empty dataset has no schema to filter on.
+            return
+        expression = self._expression(filters)
+        for batch in self.dataset(filters).to_batches(columns=columns, filter=expression, batch_size=batch_size):
+            yield batch.to_pandas()
+
+    def read(self, columns=None, filters=None):
+        """Reads the stored rows (only `columns`, only rows matching `filters`) into a DataFrame."""
+        if not self.exists():
+            return pd.DataFrame(columns=columns or [])
+        if not self.partitions(filters):
+            # Every partition was pruned: an empty frame with the store's columns.
+            return pd.DataFrame(columns=columns or self.manifest()["schema"] or [])
+        table = self.dataset(filters).to_table(columns=columns, filter=self._expression(filters))
+        return table.to_pandas()
+
+    @staticmethod
+    def _expression(filters):
+        if not filters:
+            return None
+        ops = {
+            "==": lambda f, v: f == v, "<": lambda f, v: f < v, "<=": lambda f, v: f <= v,
+            ">": lambda f, v: f > v, ">=": lambda f, v: f >= v,
+        }
+        expression = None
+        for column, op, value in filters:
+            term = ops[op](ds.field(column), value)
+            expression = term if expression is None else expression & term
+        return expression
+
+    def read_partitions(self, ids, columns=None):
+        """Reads only the partitions with the given ids (e.g. the latest batch)."""
+        wanted = set(ids)
+        files = [os.path.join(self.root, p["file"]) for p in self.manifest()["partitions"] if p["id"] in wanted]
+        if not files:
+            return pd.DataFrame(columns=columns or [])
+        return ds.dataset(files, format="parquet").to_table(columns=columns).to_pandas()
+
+    def clear(self):
+        """Removes every partition and the manifest."""
+        for path in glob.glob(os.path.join(self.root, "part-*.parquet*")):
+            os.remove(path)
+        if self.exists():
+            os.remove(self.manifest_path)
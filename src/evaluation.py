@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+
+class StreamingEvaluation:
+    """
+    Classification metrics accumulated batch by batch.
+
+    Only the confusion matrix and per-bin calibration sums are kept, so
+    memory does not grow with the number of rows evaluated. The results
+    match MineralPredictor.evaluate (accuracy_score, classification_report,
+    confusion_matrix) on the concatenated batches.
+    """
+
+    def __init__(self, classes, n_bins=10, positive=None):
+        """
+        Args:
+            classes (sequence): The model's classes, in predict_proba column order.
+            n_bins (int): Equal-width probability bins for the calibration table.
+            positive: Class whose probability is calibrated (default: 1 if
+                present, else the last class).
+        """
+        self.classes = np.asarray(classes)
+        if positive is None:
+            positive = 1 if 1 in list(self.classes) else self.classes[-1]
+        self.positive = positive
+        self.positive_index = list(self.classes).index(positive)
+        self.n_bins = n_bins
+        # Labels outside the model's classes can still occur in y_true.
+        self.labels = np.unique(self.classes)
+        self.counts = np.zeros((len(self.labels), len(self.labels)), dtype=np.int64)
+        self.bin_count = np.zeros(n_bins, dtype=np.int64)
+        self.bin_proba = np.zeros(n_bins)
+        self.bin_positive = np.zeros(n_bins)
+        self.brier_sum = 0.0
+        self.n = 0
+
+    def _label_index(self, y):
+        unknown = np.setdiff1d(np.unique(y), self.labels)
+        if len(unknown):
+            labels = np.union1d(self.labels, unknown)
+            counts = np.zeros((len(labels), len(labels)), dtype=np.int64)
+            where = np.searchsorted(labels, self.labels)
+            counts[np.ix_(where, where)] = self.counts
+            self.labels, self.counts = labels, counts
+        return np.searchsorted(self.labels, y)
+
+    def update(self, y_true, proba):
+        """
+        Adds one batch.
+
+        Args:
+            y_true (array-like): True labels of the batch.
+            proba (ndarray): predict_proba output for the batch.
+        """
+        y_true = np.asarray(y_true)
+        proba = np.asarray(proba)
+        if len(y_true) == 0:
+            return self
+        y_pred = self.classes[np.argmax(proba, axis=1)]
+
+        true_idx = self._label_index(y_true)
+        pred_idx = self._label_index(y_pred)
+        k = len(self.labels)
+        self.counts += np.bincount(true_idx * k + pred_idx, minlength=k * k).reshape(k, k)
+
+        score = proba[:, self.positive_index]
+        is_positive = (y_true == self.positive).astype(np.float64)
+        bins = np.minimum((score * self.n_bins).astype(np.int64), self.n_bins - 1)
+        self.bin_count += np.bincount(bins, minlength=self.n_bins)
+        self.bin_proba += np.bincount(bins, weights=score, minlength=self.n_bins)
+        self.bin_positive += np.bincount(bins, weights=is_positive, minlength=self.n_bins)
+        self.brier_sum += float(np.sum((score - is_positive) ** 2))
+        self.n += len(y_true)
+        return self
+
+    def confusion_matrix(self):
+        """Confusion matrix over the labels seen in y_true or predicted, like sklearn's."""
+        seen = (self.counts.sum(axis=0) + self.counts.sum(axis=1)) > 0
+        return self.counts[np.ix_(seen, seen)], self.labels[seen]
+
+    def scores(self):
+        """
+        Returns:
+            DataFrame: precision, recall, f1-score and support per label.
+        """
+        cm, labels = self.confusion_matrix()
+        tp = np.diag(cm).astype(np.float64)
+        predicted = cm.sum(axis=0)
+        support = cm.sum(axis=1)
+        # Undefined ratios are 0, as with sklearn's default zero_division.
+        precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+        recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+        denominator = 2 * tp + (predicted - tp) + (support - tp)
+        f1 = np.divide(2 * tp, denominator, out=np.zeros_like(tp), where=denominator > 0)
+        return pd.DataFrame({"precision": precision, "recall": recall, "f1-score": f1, "support": support},
+                            index=labels)
+
+    def calibration(self):
+        """
+        Returns:
+            DataFrame: Per probability bin: rows, mean predicted probability and
+            observed frequency of the positive class.
+        """
+        edges = np.linspace(0.0, 1.0, self.n_bins + 1)
+        count = self.bin_count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_proba = np.where(count > 0, self.bin_proba / count, np.nan)
+            observed = np.where(count > 0, self.bin_positive / count, np.nan)
+        return pd.DataFrame({
+            "bin_lower": edges[:-1], "bin_upper": edges[1:], "count": count,
+            "mean_predicted": mean_proba, "observed_frequency": observed,
+        })
+
+    def report(self, digits=2):
+        """The text of sklearn's classification_report, built from the counts."""
+        scores = self.scores()
+        names = [str(label) for label in scores.index]
+        headers = ["precision", "recall", "f1-score", "support"]
+        width = max(max(len(name) for name in names), len("weighted avg"), digits)
+        report = ("{:>{width}s} " + " {:>9}" * len(headers)).format("", *headers, width=width) + "\n\n"
+        row_fmt = "{:>{width}s} " + " {:>9.{digits}f}" * 3 + " {:>9}\n"
+        for name, row in zip(names, scores.itertuples(index=False)):
+            report += row_fmt.format(name, row[0], row[1], row[2], int(row[3]), width=width, digits=digits)
+        report += "\n"
+
+        total = int(scores["support"].sum())
+        accuracy = self.accuracy()
+        report += ("{:>{width}s} " + " {:>9.{digits}}" * 2 + " {:>9.{digits}f}" + " {:>9}\n").format(
+            "accuracy", "", "", accuracy, total, width=width, digits=digits)
+        metrics = scores[["precision", "recall", "f1-score"]]
+        report += row_fmt.format("macro avg", *metrics.mean(axis=0), total, width=width, digits=digits)
+        weights = scores["support"].to_numpy(dtype=np.float64)
+        weighted = np.average(metrics.to_numpy(), axis=0, weights=weights) if weights.sum() else np.zeros(3)
+        report += row_fmt.format("weighted avg", *weighted, total, width=width, digits=digits)
+        return report
+
+    def accuracy(self):
+        cm, _ = self.confusion_matrix()
+        return float(np.trace(cm) / cm.sum()) if cm.sum() else 0.0
+
+    def result(self):
+        """
+        Returns:
+            dict: accuracy, report and confusion_matrix (as MineralPredictor.evaluate),
+            plus per-label scores, the calibration table and the Brier score.
+        """
+        if self.n == 0:
+            raise ValueError("No rows were evaluated.")
+        cm, labels = self.confusion_matrix()
+        return {
+            "accuracy": self.accuracy(),
+            "report": self.report(),
+            "confusion_matrix": cm,
+            "labels": labels,
+            "scores": self.scores(),
+            "calibration": self.calibration(),
+            "brier_score": self.brier_sum / self.n,
+            "n_rows": self.n,
+        }
@@ -1,20 +1,95 @@
 import joblib
+import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 import os
+from .compiled_forest import CompiledForest
+from .evaluation import StreamingEvaluation
+
+# Default tree budget of an incrementally updated forest.
+MAX_TREES = 300
 
 class MineralPredictor:
-    def __init__(self, n_estimators=100, random_state=42):
-        self.model = RandomForestClassifier(n_estimators=n_estimators, random_state=random_state)
+    def __init__(self, n_estimators=100, random_state=42, **params):
+        """
+        Args:
+            params: Further RandomForestClassifier parameters (e.g. the
+                best_params_ of a tuning.HyperparameterSearch, n_jobs).
+        """
+        self.model = RandomForestClassifier(n_estimators=n_estimators, random_state=random_state, **params)
         self.is_trained = False
+        # Update round each tree was grown in (0 = initial training).
+        self.tree_rounds = []
 
     def train(self, X, y):
         """
         Trains the model on the provided data.
         """
         print(f"Training Random Forest with {len(X)} samples...")
+        self.model.set_params(warm_start=False)
         self.model.fit(X, y)
         self.is_trained = True
+        self.tree_rounds = [0] * len(self.model.estimators_)
+
+    def update(self, X, y, n_new_trees=25, max_trees=MAX_TREES, retire="oldest", X_val=None, y_val=None):
+        """
+        Grows the trained forest with n_new_trees trees fitted on (X, y) only,
+        using warm start, then retires trees beyond max_trees.
+
+        X, y should be the new batch, optionally mixed with a replay sample of
+        older data so the new trees do not only see the latest distribution.
+
+        Args:
+            n_new_trees (int): Trees added in this round.
+            max_trees (int): Forest size cap (None = unbounded).
+            retire (str): 'oldest' drops the earliest trees; 'worst' drops the
+                trees with the lowest accuracy on (X_val, y_val).
+        """
+        if not self.is_trained:
+            raise ValueError("Model is not trained yet.")
+        # Warm start refits classes_ from (X, y); the existing trees still
+        # predict the trained classes, so the batch must hold exactly those.
+        batch_classes, trained_classes = set(np.unique(y)), set(self.model.classes_)
+        if batch_classes != trained_classes:
+            raise ValueError(f"Update batch classes {sorted(batch_classes)} differ from the trained "
+                             f"classes {sorted(trained_classes)}; grow the forest on a batch with all of them.")
+
+        print(f"Growing forest by {n_new_trees} trees on {len(X)} samples...")
+        round_id = max(self.tree_rounds, default=0) + 1
+        # Warm start seeds the new trees from random_state; at the tree cap the
+        # forest size repeats, so without a per-round seed every round would
+        # grow the same trees. The original seed is kept on the model.
+        base_seed = getattr(self.model, "base_random_state_", self.model.random_state)
+        self.model.base_random_state_ = base_seed
+        seed = base_seed + round_id if isinstance(base_seed, (int, np.integer)) else base_seed
+        self.model.set_params(warm_start=True, n_estimators=len(self.model.estimators_) + n_new_trees,
+                              random_state=seed)
+        self.model.fit(X, y)
+        self.model.set_params(warm_start=False)
+        self.tree_rounds += [round_id] * n_new_trees
+
+        if max_trees is not None and len(self.model.estimators_) > max_trees:
+            self.retire_trees(len(self.model.estimators_) - max_trees, retire, X_val, y_val)
+
+    def retire_trees(self, n_trees, policy="oldest", X_val=None, y_val=None):
+        """Removes n_trees trees from the forest according to `policy`."""
+        estimators = self.model.estimators_
+        if policy == "oldest":
+            drop = set(np.argsort(self.tree_rounds, kind="stable")[:n_trees])
+        elif policy == "worst":
+            if X_val is None or y_val is None:
+                raise ValueError("The 'worst' retirement policy needs validation data.")
+            X_val = np.asarray(X_val)
+            target = np.searchsorted(self.model.classes_, np.asarray(y_val))
+            scores = [np.mean(tree.predict(X_val) == target) for tree in estimators]
+            drop = set(np.argsort(scores, kind="stable")[:n_trees])
+        else:
+            raise ValueError(f"Unknown retirement policy: {policy}")
+
+        keep = [i for i in range(len(estimators)) if i not in drop]
+        self.model.estimators_ = [estimators[i] for i in keep]
+        self.tree_rounds = [self.tree_rounds[i] for i in keep]
+        self.model.set_params(n_estimators=len(keep))
 
     def predict(self, X):
         if not self.is_trained:
@@ -41,7 +116,43 @@ class MineralPredictor:
             "confusion_matrix": cm
         }
 
+    def evaluate_stream(self, batches, n_bins=10):
+        """
+        Evaluates on batches from an iterable or generator, with memory flat in
+        the holdout size.
+
+        Args:
+            batches (iterable): (X, y) pairs.
+            n_bins (int): Probability bins of the calibration table.
+
+        Returns:
+            dict: The keys of evaluate() (same values on the concatenated
+            batches), plus per-class scores, calibration and Brier score.
+        """
+        if not self.is_trained:
+            raise ValueError("Model is not trained yet.")
+
+        evaluation = StreamingEvaluation(self.model.classes_, n_bins=n_bins)
+        for X, y in batches:
+            if len(y):
+                evaluation.update(y, self.model.predict_proba(X))
+        return evaluation.result()
+
+    def compile(self):
+        """The forest as a CompiledForest: flat arrays and a vectorised predictor."""
+        if not self.is_trained:
+            raise ValueError("Model is not trained yet.")
+        return CompiledForest.from_sklearn(self.model)
+
+    def export_compiled(self, directory):
+        """Writes the compiled forest to `directory` (see CompiledForest.load)."""
+        self.compile().save(directory)
+        print(f"Compiled forest saved to {directory}")
+        return directory
+
     def save(self, filepath):
+        # Tree rounds travel with the forest so a later update can retire by age.
+        self.model.tree_rounds_ = list(self.tree_rounds)
         joblib.dump(self.model, filepath)
         print(f"Model saved to {filepath}")
 
@@ -49,6 +160,7 @@ class MineralPredictor:
         if os.path.exists(filepath):
             self.model = joblib.load(filepath)
             self.is_trained = True
+            self.tree_rounds = list(getattr(self.model, "tree_rounds_", [0] * len(self.model.estimators_)))
             print(f"Model loaded from {filepath}")
         else:
             print(f"Model file {filepath} not found.")
@@ -1,79 +1,298 @@
 import os
+import time
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from .data_generator import generate_synthetic_data
-from .model import MineralPredictor
+from .data_generator import generate_synthetic_data, _features, _occurrence
+from .data_store import PartitionedStore
+from .model import MineralPredictor, MAX_TREES
+from .tuning import HyperparameterSearch, fastest_meeting
+from .registry import ModelRegistry, store_fingerprint
+from .stages import Stage, StageCache, StagePipeline
 
 DATA_DIR = os.path.join("mineral_prediction", "data")
+# Legacy single-file store, migrated into the partitioned store on first use.
 PROCESSED_DATA_PATH = os.path.join(DATA_DIR, "processed", "all_data.csv")
+STORE_DIR = os.path.join(DATA_DIR, "processed", "all_data")
 MODEL_PATH = os.path.join("mineral_prediction", "model.joblib")
 
+# Incremental updates: trees grown per batch, and the replay of older data
+# mixed into each batch (fraction of the batch size, drawn from the last
+# REPLAY_PARTITIONS partitions).
+NEW_TREES_PER_UPDATE = 25
+REPLAY_PARTITIONS = 2
+REPLAY_RATIO = 0.5
+
+# Seed of the first partition's batch; later batches count up from it.
+BATCH_SEED = 42
+
 def ensure_dirs():
-    os.makedirs(os.path.dirname(PROCESSED_DATA_PATH), exist_ok=True)  
+    os.makedirs(STORE_DIR, exist_ok=True)
 
-def load_or_create_data(n_samples=1000, new_batch=False):
+def get_store():
     """
-    Loads existing data or creates new synthetic data.
-    If new_batch is True, generates new data and appends to existing.
+    Opens the training data store, moving a legacy all_data.csv into it as
+    the first partition.
     """
     ensure_dirs()
+    store = PartitionedStore(STORE_DIR)
+    if os.path.exists(PROCESSED_DATA_PATH) and not store.exists():
+        print("Migrating all_data.csv into the partitioned store...")
+        store.append(pd.read_csv(PROCESSED_DATA_PATH))
+        os.remove(PROCESSED_DATA_PATH)
+    return store
+
+def _new_batch(store, n_samples):
+    """
+    A synthetic batch seeded by the id of the partition it will become, so
+    every appended batch is new data (the first is the random_state=42 set).
+    """
+    return generate_synthetic_data(n_samples=n_samples, random_state=BATCH_SEED + store.next_id() - 1)
+
+def load_or_create_data(n_samples=1000, new_batch=False, columns=None):
+    """
+    Loads existing data or creates new synthetic data.
+    If new_batch is True, generates new data and appends it to the store as
+    a new partition; only the new batch is written.
+
+    Args:
+        columns (list): Columns to read (default: all).
+    """
+    store = get_store()
     
-    if os.path.exists(PROCESSED_DATA_PATH) and new_batch:
-        print("Loading existing data and appending new batch...")
-        existing_df = pd.read_csv(PROCESSED_DATA_PATH)
-        new_df = generate_synthetic_data(n_samples=n_samples)
-        combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-        combined_df.to_csv(PROCESSED_DATA_PATH, index=False)
-        return combined_df
-    elif os.path.exists(PROCESSED_DATA_PATH) and not new_batch:
+    if store.exists() and new_batch:
+        print("Appending new batch...")
+        store.append(_new_batch(store, n_samples))
+    elif store.exists():
         print("Loading existing data...")
-        return pd.read_csv(PROCESSED_DATA_PATH)
     else:
         print("Generating initial data...")
-        df = generate_synthetic_data(n_samples=n_samples)
-        df.to_csv(PROCESSED_DATA_PATH, index=False)
-        return df
+        store.append(_new_batch(store, n_samples))
+    return store.read(columns=columns)
 
-def run_pipeline(mode="initial", n_samples=1000):
+def _update_sample(store, partition_id):
+    """
+    Data of an incremental update: the new partition, and a replay sample
+    from the REPLAY_PARTITIONS partitions before it (None if there are none).
+    Reads stay proportional to the batch size, not the history.
+
+    Returns:
+        tuple: (new partition DataFrame, replay DataFrame or None)
+    """
+    new_df = store.read_partitions([partition_id])
+    ids = [p["id"] for p in store.partitions() if p["id"] < partition_id][-REPLAY_PARTITIONS:]
+    if not ids:
+        return new_df, None
+    previous = store.read_partitions(ids)
+    replay = previous.sample(n=min(len(previous), int(len(new_df) * REPLAY_RATIO)), random_state=42)
+    return new_df, replay
+
+def _save_model(predictor, metrics, mode):
+    """Saves the model to MODEL_PATH and registers it as the new live version."""
+    predictor.save(MODEL_PATH)
+    ModelRegistry().register(predictor, metrics, store_fingerprint(get_store()), mode=mode)
+
+def _print_metrics(metrics):
+    print("\nModel Evaluation:")
+    print(f"Accuracy: {metrics['accuracy']:.4f}")
+    print("\nClassification Report:")
+    print(metrics['report'])
+
+def _stage_generate(mode, n_samples):
+    """Fills the store: a fresh dataset ('initial') or one more batch ('update')."""
+    store = get_store()
+    if mode == "update" and store.exists():
+        print("Appending new batch...")
+    else:
+        print("Generating initial data...")
+        store.clear()
+    store.append(_new_batch(store, n_samples))
+    return store_fingerprint(store)
+
+def _store_unchanged(fingerprint):
+    store = get_store()
+    return store.exists() and store_fingerprint(store) == fingerprint
+
+def _stage_split(generate, test_size, random_state):
+    df = get_store().read()
+    X = df.drop('mineral_occurrence', axis=1)
+    y = df['mineral_occurrence']
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=random_state)
+    return {"X_train": X_train, "X_test": X_test, "y_train": y_train, "y_test": y_test}
+
+def _stage_train(split, model_params):
+    # Full retrain: a fresh RF on the accumulated dataset
+    predictor = MineralPredictor(**model_params)
+    predictor.train(split["X_train"], split["y_train"])
+    return predictor
+
+def _stage_evaluate(train, split):
+    return train.evaluate(split["X_test"], split["y_test"])
+
+def _stage_save(train, evaluate, mode):
+    _save_model(train, evaluate, mode)
+    return ModelRegistry().current_version()
+
+def _model_saved(version):
+    return os.path.exists(MODEL_PATH) and ModelRegistry().current_version() == version
+
+def pipeline_stages(mode="initial", n_samples=1000, test_size=0.2, random_state=42, model_params=None):
+    """
+    The full-retrain pipeline as declared stages: generate -> split -> train
+    -> evaluate -> save. Appending a batch ('update') always runs; the
+    stages after it are keyed by the resulting store contents.
+    """
+    return [
+        # generate_synthetic_data only wraps the feature and occurrence models,
+        # so those are listed too: editing either must regenerate the data.
+        Stage("generate", _stage_generate, params={"mode": mode, "n_samples": n_samples},
+              depends=(generate_synthetic_data, _features, _occurrence, _new_batch), cache=mode != "update", valid=_store_unchanged),
+        Stage("split", _stage_split, inputs=("generate",),
+              params={"test_size": test_size, "random_state": random_state}),
+        Stage("train", _stage_train, inputs=("split",), params={"model_params": dict(model_params or {})},
+              depends=(MineralPredictor,)),
+        Stage("evaluate", _stage_evaluate, inputs=("train", "split")),
+        Stage("save", _stage_save, inputs=("train", "evaluate"), params={"mode": mode}, valid=_model_saved),
+    ]
+
+def run_pipeline(mode="initial", n_samples=1000, incremental=True, model_params=None, force=(), use_cache=True):
     """
     Runs the training pipeline.
     mode: 'initial' (train from scratch) or 'update' (add data and retrain)
+    With incremental=True and a saved model, 'update' grows the saved forest
+    on the new batch (plus a replay sample) instead of retraining on all data.
+
+    Stages whose inputs, parameters and code are unchanged since a previous
+    run are loaded from the stage cache instead of running again.
+
+    Args:
+        model_params (dict): MineralPredictor parameters (n_estimators, max_depth, ...).
+        force (sequence): Stages to rerun regardless of the cache, e.g. ('evaluate',).
+        use_cache (bool): False runs every stage without reading or writing the cache.
     """
     print(f"--- Running Pipeline: {mode.upper()} ---")
-    
-    # 1. Data Handling
-    if mode == "update":
-        df = load_or_create_data(n_samples=n_samples, new_batch=True)
-    else:
-        # For initial, we might want to clear old data or just load what's there if we want to restart
-        if os.path.exists(PROCESSED_DATA_PATH):
-            os.remove(PROCESSED_DATA_PATH)
-        df = load_or_create_data(n_samples=n_samples, new_batch=False)
-    
+
+    if mode == "update" and incremental and os.path.exists(MODEL_PATH) and get_store().exists():
+        return run_incremental_update(n_samples=n_samples)
+
+    stages = pipeline_stages(mode, n_samples, model_params=model_params)
+    pipeline = StagePipeline(stages, StageCache() if use_cache else None)
+    outputs = pipeline.run(force=force)
+
+    metrics = outputs["evaluate"]
+    _print_metrics(metrics)
+    return metrics
+
+def run_incremental_update(n_samples=1000, n_new_trees=NEW_TREES_PER_UPDATE, max_trees=MAX_TREES):
+    """
+    Appends a new batch and grows the saved forest with n_new_trees trees
+    fitted on it, retiring the oldest trees beyond max_trees.
+
+    The holdout is drawn from the new batch only and the replay sample goes
+    to training, so no tree, old or new, has seen the rows it is scored on.
+    """
+    store = get_store()
+    entry = store.append(_new_batch(store, n_samples))
+    new_df, replay = _update_sample(store, entry["id"])
+
+    X = new_df.drop('mineral_occurrence', axis=1)
+    y = new_df['mineral_occurrence']
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    if replay is not None:
+        X_train = pd.concat([X_train, replay.drop('mineral_occurrence', axis=1)], ignore_index=True)
+        y_train = pd.concat([y_train, replay['mineral_occurrence']], ignore_index=True)
+
+    predictor = MineralPredictor()
+    predictor.load(MODEL_PATH)
+    predictor.update(X_train, y_train, n_new_trees=n_new_trees, max_trees=max_trees)
+
+    metrics = predictor.evaluate(X_test, y_test)
+    metrics["n_trees"] = len(predictor.model.estimators_)
+    _print_metrics(metrics)
+    _save_model(predictor, metrics, "incremental")
+    return metrics
+
+def run_tuning(method="halving", cv=5, workers=None, min_accuracy=None, param_grid=None):
+    """
+    Tuning mode: searches forest parameters with k-fold CV on a process pool,
+    prints the leaderboard and trains/saves the chosen model.
+
+    Args:
+        method (str): 'grid' or 'halving' (see tuning.HyperparameterSearch).
+        min_accuracy (float): When given, the fastest-predicting candidate
+            that reaches this CV accuracy is chosen instead of the most accurate.
+
+    Returns:
+        DataFrame: The leaderboard.
+    """
+    print(f"--- Running Pipeline: TUNE ({method}) ---")
+    df = load_or_create_data()
     X = df.drop('mineral_occurrence', axis=1)
     y = df['mineral_occurrence']
-    
-    # 2. Split
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
-    # 3. Model
-    predictor = MineralPredictor()
-    
-    # If updating, we could technically load the old model, but for RF retraining is better
-    # predictor.train will retrain a fresh RF on the accumulated dataset
+
+    search = HyperparameterSearch(param_grid=param_grid, method=method, cv=cv, workers=workers)
+    leaderboard = search.fit(X_train, y_train)
+    columns = ["rank", "accuracy", "accuracy_std", "f1", "roc_auc", "fit_seconds", "predict_us_per_row", "params"]
+    print(leaderboard[columns].head(10).to_string(index=False))
+
+    params = search.best_params_
+    if min_accuracy is not None:
+        choice = fastest_meeting(leaderboard, min_accuracy)
+        if choice is None:
+            print(f"Warning: No candidate reaches accuracy {min_accuracy:.3f}; using the most accurate one.")
+        else:
+            params = choice["params"]
+    print(f"Selected parameters: {params}")
+
+    predictor = MineralPredictor(**params)
     predictor.train(X_train, y_train)
-    
-    # 4. Evaluate
     metrics = predictor.evaluate(X_test, y_test)
-    print("\nModel Evaluation:")
-    print(f"Accuracy: {metrics['accuracy']:.4f}")
-    print("\nClassification Report:")
-    print(metrics['report'])
-    
-    # 5. Save
-    predictor.save(MODEL_PATH)
-    
-    return metrics
+    _print_metrics(metrics)
+    _save_model(predictor, metrics, "tune")
+    return leaderboard
+
+def compare_update_strategies(n_batches=6, n_samples=1000, n_new_trees=NEW_TREES_PER_UPDATE, max_trees=MAX_TREES):
+    """
+    Replays a stream of batches and, after each one, compares a full retrain
+    on all data so far with an incremental warm-start update, on a fixed
+    held-out test set.
+
+    Returns:
+        DataFrame: One row per batch with accuracy and wall time of both strategies.
+    """
+    target = 'mineral_occurrence'
+    test = generate_synthetic_data(n_samples=n_samples, random_state=10_000)
+    X_test, y_test = test.drop(target, axis=1), test[target]
+
+    batches = [generate_synthetic_data(n_samples=n_samples, random_state=seed) for seed in range(n_batches)]
+    incremental = MineralPredictor()
+    incremental.train(batches[0].drop(target, axis=1), batches[0][target])
+
+    rows = []
+    for i in range(1, n_batches):
+        history = pd.concat(batches[:i + 1], ignore_index=True)
+        start = time.perf_counter()
+        full = MineralPredictor()
+        full.train(history.drop(target, axis=1), history[target])
+        full_time = time.perf_counter() - start
+
+        previous = pd.concat(batches[max(0, i - REPLAY_PARTITIONS):i], ignore_index=True)
+        replay = previous.sample(n=min(len(previous), int(n_samples * REPLAY_RATIO)), random_state=42)
+        update = pd.concat([batches[i], replay], ignore_index=True)
+        start = time.perf_counter()
+        incremental.update(update.drop(target, axis=1), update[target], n_new_trees=n_new_trees, max_trees=max_trees)
+        incremental_time = time.perf_counter() - start
+
+        rows.append({
+            "batch": i,
+            "history_rows": len(history),
+            "full_accuracy": full.evaluate(X_test, y_test)["accuracy"],
+            "full_seconds": full_time,
+            "incremental_accuracy": incremental.evaluate(X_test, y_test)["accuracy"],
+            "incremental_seconds": incremental_time,
+            "incremental_trees": len(incremental.model.estimators_),
+        })
+    return pd.DataFrame(rows)
 
 if __name__ == "__main__":
     # Example usage
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import joblib
+import numpy as np
+import pandas as pd
+from .model import MineralPredictor
+from .compiled_forest import CompiledForest
+
+REGISTRY_DIR = os.path.join("mineral_prediction", "registry")
+CURRENT_NAME = "CURRENT"
+MODEL_NAME = "model.joblib"
+METADATA_NAME = "metadata.json"
+COMPILED_NAME = "forest"
+
+
+def frame_fingerprint(df):
+    """Hash of a training DataFrame (columns and every row)."""
+    digest = hashlib.sha1(",".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def store_fingerprint(store):
+    """Hash of a PartitionedStore's manifest: which batches, how many rows, their statistics."""
+    manifest = json.dumps(store.manifest(), sort_keys=True)
+    return hashlib.sha1(manifest.encode()).hexdigest()
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ModelRegistry:
+    """
+    Versioned model artifacts on disk.
+
+    Each version lives in its own directory (v0001, v0002, ...) with the
+    uncompressed forest, its compiled form (forest/) and a metadata.json (training data fingerprint,
+    metrics, parameters). A CURRENT file names the live version; it is
+    replaced atomically, so readers see either the old or the new version,
+    never a partial one.
+    """
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+        self.current_path = os.path.join(root, CURRENT_NAME)
+
+    def versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(int(d[1:]) for d in os.listdir(self.root) if d.startswith("v") and d[1:].isdigit())
+
+    def current_version(self):
+        try:
+            with open(self.current_path) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _version_dir(self, version):
+        return os.path.join(self.root, f"v{version:04d}")
+
+    def register(self, predictor, metrics=None, data_fingerprint=None, activate=True, **extra):
+        """
+        Stores a trained predictor as a new version.
+
+        Args:
+            predictor (MineralPredictor): Trained model.
+            metrics (dict): Evaluation metrics to record.
+            data_fingerprint (str): Identity of the training data (see frame_fingerprint).
+            activate (bool): Make it the CURRENT version.
+
+        Returns:
+            int: The new version number.
+        """
+        if not predictor.is_trained:
+            raise ValueError("Model is not trained yet.")
+        os.makedirs(self.root, exist_ok=True)
+        version = max(self.versions(), default=0) + 1
+        metadata = {
+            "version": version,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "data_fingerprint": data_fingerprint,
+            "metrics": _jsonable({k: v for k, v in (metrics or {}).items() if k != "report"}),
+            "params": _jsonable(predictor.model.get_params()),
+            "n_trees": len(predictor.model.estimators_),
+            **_jsonable(extra),
+        }
+
+        # Build the version in a temporary directory and rename it into place.
+        staging = tempfile.mkdtemp(dir=self.root, prefix=".staging-")
+        try:
+            predictor.model.tree_rounds_ = list(predictor.tree_rounds)
+            # Uncompressed, so load() can memory-map the stored arrays.
+            joblib.dump(predictor.model, os.path.join(staging, MODEL_NAME), compress=0)
+            predictor.compile().save(os.path.join(staging, COMPILED_NAME))
+            with open(os.path.join(staging, METADATA_NAME), "w") as f:
+                json.dump(metadata, f, indent=2)
+            os.rename(staging, self._version_dir(version))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        if activate:
+            self.activate(version)
+        print(f"Registered model version {version}")
+        return version
+
+    def activate(self, version):
+        """Atomically points CURRENT at `version`."""
+        if not os.path.isdir(self._version_dir(version)):
+            raise ValueError(f"Model version {version} does not exist.")
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".current-")
+        with os.fdopen(fd, "w") as f:
+            f.write(str(version))
+        os.replace(tmp, self.current_path)
+
+    def metadata(self, version=None):
+        version = self.current_version() if version is None else version
+        with open(os.path.join(self._version_dir(version), METADATA_NAME)) as f:
+            return json.load(f)
+
+    def load(self, version=None, mmap=True):
+        """
+        Loads a version (default: CURRENT) as a MineralPredictor.
+
+        With mmap=True joblib memory-maps the arrays it stored instead of
+        reading them onto the heap. scikit-learn copies each tree's node
+        arrays into the tree on unpickling, so those still end up on the heap.
+        """
+        version = self.current_version() if version is None else version
+        if version is None:
+            raise FileNotFoundError(f"No model registered in {self.root}.")
+        predictor = MineralPredictor()
+        predictor.model = joblib.load(os.path.join(self._version_dir(version), MODEL_NAME),
+                                      mmap_mode="r" if mmap else None)
+        predictor.is_trained = True
+        predictor.tree_rounds = list(getattr(predictor.model, "tree_rounds_", [0] * len(predictor.model.estimators_)))
+        predictor.version = version
+        return predictor
+
+    def load_compiled(self, version=None, mmap=True):
+        """
+        Loads a version (default: CURRENT) as a CompiledForest, for scoring
+        without scikit-learn. The arrays are memory-mapped with mmap=True.
+        """
+        version = self.current_version() if version is None else version
+        if version is None:
+            raise FileNotFoundError(f"No model registered in {self.root}.")
+        directory = os.path.join(self._version_dir(version), COMPILED_NAME)
+        if not os.path.isdir(directory):
+            # Versions registered before compiled forests were stored.
+            forest = self.load(version, mmap=False).compile()
+        else:
+            forest = CompiledForest.load(directory, mmap=mmap)
+        forest.version = version
+        return forest
+
+
+_warm = {}
+_warm_lock = threading.Lock()
+
+
+def get_model(root=REGISTRY_DIR):
+    """
+    Process-wide warm predictor for the registry's CURRENT version.
+
+    The first call loads the model; later calls (every Streamlit rerun and
+    session in this process) reuse it and only stat the CURRENT file. When a
+    new version is activated, the next call loads it and swaps it in; callers
+    holding the previous instance keep using it undisturbed.
+    """
+    registry = ModelRegistry(root)
+    try:
+        stamp = os.stat(registry.current_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    entry = _warm.get(root)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+
+    with _warm_lock:
+        entry = _warm.get(root)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+        version = registry.current_version()
+        if entry is not None and entry[1].version == version:
+            predictor = entry[1]
+        else:
+            predictor = registry.load(version)
+        _warm[root] = (stamp, predictor)
+        return predictor
@@ -0,0 +1,164 @@
+import os
+import time
+import glob
+import inspect
+import tempfile
+import joblib
+
+CACHE_DIR = os.path.join("mineral_prediction", "cache", "stages")
+
+# Cached outputs kept per stage; older entries are removed on write.
+KEEP_PER_STAGE = 4
+
+
+def _source(obj):
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return getattr(obj, "__qualname__", repr(obj))
+
+
+class Stage:
+    """
+    One declared pipeline step.
+
+    The stage's key is a fingerprint of its parameters, the keys of the
+    stages it reads from and the source code of its function (plus any
+    `depends` objects), so editing a stage invalidates it and everything
+    downstream, but nothing upstream.
+    """
+
+    def __init__(self, name, func, inputs=(), params=None, depends=(), cache=True, valid=None):
+        """
+        Args:
+            name (str): Stage name; upstream outputs are passed to `func` under it.
+            func (callable): Called as func(**upstream_outputs, **params).
+            inputs (sequence): Names of the stages whose outputs `func` takes.
+            params (dict): Keyword parameters, part of the key.
+            depends (sequence): Functions or classes whose source is part of the key.
+            cache (bool): Store the output. Uncached stages always run and are
+                keyed by a hash of their output instead.
+            valid (callable): Checks a cached output is still usable (e.g. that
+                a file it describes is still in place); False reruns the stage.
+        """
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = dict(params or {})
+        self.depends = tuple(depends)
+        self.cache = cache
+        self.valid = valid
+
+    def key(self, upstream_keys):
+        code = [_source(self.func)] + [_source(d) for d in self.depends]
+        return joblib.hash((self.name, self.params, [upstream_keys[n] for n in self.inputs], code))
+
+
+class StageCache:
+    """
+    Stage outputs on disk, one joblib file per (stage, key).
+    """
+
+    def __init__(self, root=CACHE_DIR, keep=KEEP_PER_STAGE):
+        self.root = root
+        self.keep = keep
+
+    def _path(self, name, key):
+        return os.path.join(self.root, name, key + ".joblib")
+
+    def get(self, name, key):
+        """
+        Returns:
+            tuple: (hit, output)
+        """
+        path = self._path(name, key)
+        try:
+            output = joblib.load(path)
+        except FileNotFoundError:
+            return False, None
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable cache entry {path}: {e}")
+            return False, None
+        os.utime(path)
+        return True, output
+
+    def put(self, name, key, output):
+        path = self._path(name, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        try:
+            joblib.dump(output, tmp, compress=0)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._prune(name)
+
+    def _prune(self, name):
+        entries = sorted(glob.glob(os.path.join(self.root, name, "*.joblib")), key=os.path.getmtime)
+        for path in entries[:-self.keep]:
+            os.remove(path)
+
+    def clear(self, name=None):
+        """Removes the cached outputs of one stage, or of all stages."""
+        pattern = os.path.join(self.root, name or "*", "*.joblib")
+        for path in glob.glob(pattern):
+            os.remove(path)
+
+
+class StagePipeline:
+    """
+    Runs declared stages in order, skipping those whose key is cached.
+    """
+
+    def __init__(self, stages, cache=None):
+        """
+        Args:
+            stages (list): Stage objects, each after the stages it reads from.
+            cache (StageCache): Output cache; None runs every stage.
+        """
+        self.stages = list(stages)
+        self.cache = cache
+        self.report = []
+
+    def run(self, force=()):
+        """
+        Args:
+            force (sequence): Stage names to rerun even when cached; the stages
+                downstream of them rerun too.
+
+        Returns:
+            dict: Stage name -> output.
+        """
+        outputs, keys = {}, {}
+        rerun = set(force)
+        self.report = []
+        for stage in self.stages:
+            start = time.perf_counter()
+            key = stage.key(keys)
+            forced = stage.name in rerun or any(n in rerun for n in stage.inputs)
+
+            hit = False
+            if stage.cache and self.cache is not None and not forced:
+                hit, output = self.cache.get(stage.name, key)
+                if hit and stage.valid is not None and not stage.valid(output):
+                    hit = False
+
+            if not hit:
+                output = stage.func(**{n: outputs[n] for n in stage.inputs}, **stage.params)
+                if stage.cache and self.cache is not None:
+                    self.cache.put(stage.name, key, output)
+                if forced:
+                    # Anything reading from a forced stage reruns as well.
+                    rerun.add(stage.name)
+            if not stage.cache:
+                key = joblib.hash((stage.name, output))
+
+            outputs[stage.name] = output
+            keys[stage.name] = key
+            seconds = time.perf_counter() - start
+            self.report.append({"stage": stage.name, "cached": hit, "seconds": seconds, "key": key})
+            print(f"[{stage.name}] {'cached' if hit else 'ran'} ({seconds:.2f}s)")
+        return outputs
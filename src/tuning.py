@@ -0,0 +1,207 @@
+import os
+import time
+import shutil
+import tempfile
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold
+from sklearn.metrics import accuracy_score, f1_score, roc_auc_score
+
+# Forest parameters searched by default.
+PARAM_GRID = {
+    "n_estimators": [50, 100, 200],
+    "max_depth": [None, 8, 16],
+    "min_samples_leaf": [1, 5],
+    "max_features": ["sqrt", 0.5],
+}
+
+METRICS = ("accuracy", "f1", "roc_auc")
+
+
+def expand_grid(param_grid):
+    """All parameter combinations of a grid, as a list of dicts."""
+    keys = sorted(param_grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(param_grid[k] for k in keys))]
+
+
+def _share(X, y, directory):
+    """Writes the training matrix to .npy files that workers memory-map."""
+    x_path = os.path.join(directory, "X.npy")
+    y_path = os.path.join(directory, "y.npy")
+    np.save(x_path, np.ascontiguousarray(X, dtype=np.float32))
+    np.save(y_path, np.asarray(y))
+    return x_path, y_path
+
+
+def _fit_fold(task):
+    """
+    Fits and scores one (parameters, fold) pair. Runs in a worker process;
+    the data arrives as file paths and is memory-mapped, not pickled.
+    """
+    x_path, y_path, params, fold, n_folds, n_samples, random_state = task
+    X = np.load(x_path, mmap_mode="r")
+    y = np.load(y_path, mmap_mode="r")
+
+    splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+    train_idx, val_idx = list(splitter.split(np.zeros(len(y)), y))[fold]
+    if n_samples is not None and n_samples < len(train_idx):
+        # Successive-halving budget: a fixed random subset of the training fold.
+        train_idx = np.sort(np.random.default_rng(random_state).choice(train_idx, n_samples, replace=False))
+
+    model = RandomForestClassifier(random_state=random_state, n_jobs=1, **params)
+    start = time.perf_counter()
+    model.fit(X[train_idx], y[train_idx])
+    fit_seconds = time.perf_counter() - start
+
+    X_val = X[val_idx]
+    start = time.perf_counter()
+    proba = model.predict_proba(X_val)
+    predict_seconds = time.perf_counter() - start
+    y_val = y[val_idx]
+    y_pred = model.classes_[proba.argmax(axis=1)]
+
+    scores = {
+        "accuracy": accuracy_score(y_val, y_pred),
+        "f1": f1_score(y_val, y_pred, average="binary" if len(model.classes_) == 2 else "macro"),
+    }
+    if len(model.classes_) == 2 and len(np.unique(y_val)) == 2:
+        scores["roc_auc"] = roc_auc_score(y_val, proba[:, 1])
+    else:
+        scores["roc_auc"] = np.nan
+    return {
+        "fit_seconds": fit_seconds,
+        "predict_seconds": predict_seconds,
+        "predict_us_per_row": predict_seconds / max(1, len(val_idx)) * 1e6,
+        **scores,
+    }
+
+
+class HyperparameterSearch:
+    """
+    Grid or successive-halving search over RandomForest parameters with
+    stratified k-fold CV on a process pool.
+
+    The training matrix is written once to a temporary .npy file and every
+    worker memory-maps it, so candidates and folds do not each pickle a copy.
+    """
+
+    def __init__(self, param_grid=None, method="grid", cv=5, workers=None, scoring="accuracy",
+                 factor=3, min_samples=None, random_state=42):
+        """
+        Args:
+            param_grid (dict): Parameter name -> list of values (default: PARAM_GRID).
+            method (str): 'grid' (every candidate on all data) or 'halving'.
+            cv (int): Number of folds.
+            workers (int): Worker processes (default: all cores).
+            scoring (str): Metric that ranks candidates ('accuracy', 'f1' or 'roc_auc').
+            factor (int): Halving: keep 1/factor of the candidates per round and
+                multiply their training samples by factor.
+            min_samples (int): Halving: training samples per fold in the first round.
+            random_state (int): Seed for folds, subsets and forests.
+        """
+        if method not in ("grid", "halving"):
+            raise ValueError(f"Unknown search method: {method}")
+        if scoring not in METRICS:
+            raise ValueError(f"Unknown scoring metric: {scoring}")
+        self.param_grid = param_grid or PARAM_GRID
+        self.method = method
+        self.cv = cv
+        self.workers = workers or os.cpu_count() or 1
+        self.scoring = scoring
+        self.factor = factor
+        self.min_samples = min_samples
+        self.random_state = random_state
+        self.leaderboard_ = None
+        self.best_params_ = None
+
+    def _evaluate(self, pool, paths, candidates, n_samples, round_id):
+        tasks = []
+        for i, params in enumerate(candidates):
+            for fold in range(self.cv):
+                tasks.append((i, (paths[0], paths[1], params, fold, self.cv, n_samples, self.random_state)))
+
+        results = list(pool.map(_fit_fold, [task for _, task in tasks]))
+        rows = []
+        for i, params in enumerate(candidates):
+            folds = [r for (c, _), r in zip(tasks, results) if c == i]
+            row = {"params": params, "round": round_id, "n_samples": n_samples}
+            for key in ("fit_seconds", "predict_seconds", "predict_us_per_row") + METRICS:
+                values = [f[key] for f in folds]
+                row[key] = float(np.mean(values))
+                if key in METRICS:
+                    row[f"{key}_std"] = float(np.std(values))
+            rows.append(row)
+        return rows
+
+    def fit(self, X, y):
+        """
+        Runs the search.
+
+        Returns:
+            DataFrame: The leaderboard, best first: one row per candidate
+            (scored on its largest budget) with mean/std CV metrics, fit
+            time, predict time and the candidate's parameters.
+        """
+        candidates = expand_grid(self.param_grid)
+        n_train = len(y) - len(y) // self.cv
+        directory = tempfile.mkdtemp(prefix="mineral_tuning_")
+        rows = []
+        try:
+            paths = _share(X, y, directory)
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                if self.method == "grid":
+                    rows = self._evaluate(pool, paths, candidates, None, 0)
+                else:
+                    # Enough rounds to narrow the candidates down to one, with the
+                    # last round on the full training folds.
+                    rounds = max(0, int(np.ceil(np.log(len(candidates)) / np.log(self.factor))))
+                    n_samples = self.min_samples or max(50, n_train // self.factor ** rounds)
+                    round_id = 0
+                    while True:
+                        budget = None if n_samples >= n_train else n_samples
+                        round_rows = self._evaluate(pool, paths, candidates, budget, round_id)
+                        rows.extend(round_rows)
+                        if budget is None:
+                            break
+                        ranked = sorted(round_rows, key=lambda r: -r[self.scoring])
+                        keep = max(1, len(candidates) // self.factor)
+                        candidates = [r["params"] for r in ranked[:keep]]
+                        # A lone survivor goes straight to the full training folds.
+                        n_samples = n_train if len(candidates) == 1 else n_samples * self.factor
+                        round_id += 1
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self.leaderboard_ = self._rank(rows)
+        self.best_params_ = self.leaderboard_.iloc[0]["params"]
+        return self.leaderboard_
+
+    def _rank(self, rows):
+        board = pd.DataFrame(rows)
+        # Candidates are ranked on their last (largest budget) round.
+        board["key"] = board["params"].map(repr)
+        final = board.sort_values("round").groupby("key", sort=False).tail(1)
+        final = final.sort_values(["round", self.scoring, "fit_seconds"], ascending=[False, False, True])
+        final = final.drop(columns="key").reset_index(drop=True)
+        final.insert(0, "rank", range(1, len(final) + 1))
+        for name in sorted(self.param_grid):
+            final[name] = final["params"].map(lambda p, n=name: p.get(n))
+        return final
+
+
+def fastest_meeting(leaderboard, min_score, metric="accuracy", speed="predict_us_per_row"):
+    """
+    Fastest candidate whose mean CV `metric` reaches min_score, or None.
+    With halving, candidates dropped early were scored on smaller training
+    subsets (see the n_samples column).
+
+    Args:
+        speed (str): 'predict_us_per_row' (inference cost) or 'fit_seconds'.
+    """
+    eligible = leaderboard[leaderboard[metric] >= min_score]
+    if eligible.empty:
+        return None
+    return eligible.sort_values([speed, metric], ascending=[True, False]).iloc[0]
@@ -0,0 +1,171 @@
+import datetime
+import threading
+
+import pytest
+
+from gee_cache import TTLCache, SceneSearch
+from mock_services import FakeEarthEngine
+
+
+class FakeClock:
+    """Manually advanced time source for TTLCache."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class CountingLoad:
+    """A load function returning 'value-<n>' for its n-th call."""
+
+    def __init__(self, fail=0):
+        self.calls = 0
+        self.fail = fail
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.fail:
+            raise RuntimeError("load failed")
+        return f"value-{self.calls}"
+
+
+def test_fresh_entry_is_served_from_cache():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+    load = CountingLoad()
+
+    assert cache.get("k", load) == "value-1"
+    clock.advance(9)
+    assert cache.get("k", load) == "value-1"
+    assert load.calls == 1
+    assert cache.stats['misses'] == 1 and cache.stats['hits'] == 1
+
+
+def test_expired_entry_is_reloaded_without_stale_ttl():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+    load = CountingLoad()
+
+    cache.get("k", load)
+    clock.advance(10)
+    assert cache.get("k", load) == "value-2"
+    assert cache.stats['misses'] == 2 and cache.stats['stale_hits'] == 0
+
+
+def test_concurrent_gets_share_one_load():
+    cache = TTLCache(ttl=10, clock=FakeClock())
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("k", load))) for _ in range(5)]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # Let every other caller join the load in flight before it finishes.
+    while cache.stats['joined'] < 4:
+        threading.Event().wait(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["value"] * 5
+    assert len(calls) == 1
+    assert cache.stats['misses'] == 1 and cache.stats['joined'] == 4 and cache.stats['loads'] == 1
+
+
+def test_stale_entry_is_served_while_it_refreshes():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, stale_ttl=5, clock=clock)
+    load = CountingLoad()
+
+    cache.get("k", load)
+    clock.advance(12)
+    assert cache.get("k", load) == "value-1"
+    cache.wait("k")
+    assert cache.peek("k") == "value-2"
+    assert cache.stats['stale_hits'] == 1 and load.calls == 2
+
+    # The refreshed entry is fresh again from the time it was loaded.
+    assert cache.get("k", load) == "value-2"
+    assert cache.stats['hits'] == 1
+
+
+def test_entry_past_stale_ttl_blocks_on_a_new_load():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, stale_ttl=5, clock=clock)
+    load = CountingLoad()
+
+    cache.get("k", load)
+    clock.advance(15)
+    assert cache.get("k", load) == "value-2"
+    assert cache.stats['stale_hits'] == 0 and cache.stats['misses'] == 2
+
+
+def test_failed_load_is_not_cached_and_is_retried():
+    cache = TTLCache(ttl=10, clock=FakeClock())
+    load = CountingLoad(fail=1)
+
+    with pytest.raises(RuntimeError):
+        cache.get("k", load)
+    assert cache.peek("k") is None
+    assert cache.get("k", load) == "value-2"
+    assert cache.stats['errors'] == 1 and cache.stats['loads'] == 1
+
+
+def test_failed_refresh_keeps_the_stale_value():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, stale_ttl=5, clock=clock)
+    values = iter(["value-1"])
+
+    def load():
+        return next(values)  # StopIteration after the first call
+
+    cache.get("k", load)
+    clock.advance(12)
+    assert cache.get("k", load) == "value-1"
+    cache.wait("k")
+    assert cache.peek("k") == "value-1"
+    assert cache.stats['errors'] == 1
+
+
+def test_scene_search_hits_earth_engine_once_per_window():
+    ee = FakeEarthEngine(n_scenes=8)
+    search = SceneSearch(ee, TTLCache(ttl=60, clock=FakeClock()))
+    today = datetime.date.today()
+
+    scenes = search.search(30.07, -20.33, days=30, max_cloud=100, limit=5, today=today)
+    assert search.search(30.07, -20.33, days=30, max_cloud=100, limit=5, today=today) == scenes
+    assert ee.search_calls == 1
+    assert 0 < len(scenes) <= 5
+    assert [s['ee_obj']['properties']['system:time_start'] for s in scenes] == \
+        sorted((s['ee_obj']['properties']['system:time_start'] for s in scenes), reverse=True)
+
+    # A new day moves the window, so the search runs again.
+    search.search(30.07, -20.33, days=30, max_cloud=100, limit=5, today=today + datetime.timedelta(days=1))
+    assert ee.search_calls == 2
+
+
+def test_scene_search_retries_after_earth_engine_error():
+    ee = FakeEarthEngine()
+    search = SceneSearch(ee, TTLCache(ttl=60, clock=FakeClock()))
+
+    ee.fail = True
+    with pytest.raises(RuntimeError):
+        search.search(30.07, -20.33, max_cloud=100)
+    ee.fail = False
+    assert search.search(30.07, -20.33, max_cloud=100)
+    assert ee.search_calls == 1
+    assert search.cache.stats['errors'] == 1
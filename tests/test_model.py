@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from src.model import MineralPredictor
+
+
+def _batch(n, classes, seed):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, 4))
+    y = np.resize(np.asarray(classes), n)
+    return X, y
+
+
+def test_update_grows_the_forest():
+    predictor = MineralPredictor(n_estimators=10)
+    predictor.train(*_batch(60, [0, 1], 0))
+    predictor.update(*_batch(30, [0, 1], 1), n_new_trees=5)
+    assert len(predictor.model.estimators_) == 15
+    assert predictor.predict_proba(_batch(3, [0, 1], 2)[0]).shape == (3, 2)
+
+
+def test_update_rejects_a_batch_missing_a_trained_class():
+    predictor = MineralPredictor(n_estimators=10)
+    predictor.train(*_batch(60, [0, 1], 0))
+
+    with pytest.raises(ValueError, match="differ from the trained classes"):
+        predictor.update(*_batch(30, [0], 1), n_new_trees=5)
+
+    # The forest is left as it was and still predicts both classes.
+    assert len(predictor.model.estimators_) == 10
+    assert list(predictor.model.classes_) == [0, 1]
+    assert predictor.predict_proba(_batch(3, [0, 1], 2)[0]).shape == (3, 2)
+
+
+def test_update_rejects_a_batch_with_an_unseen_class():
+    predictor = MineralPredictor(n_estimators=10)
+    predictor.train(*_batch(60, [0, 1], 0))
+    with pytest.raises(ValueError):
+        predictor.update(*_batch(30, [0, 1, 2], 1), n_new_trees=5)
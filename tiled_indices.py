@@ -0,0 +1,293 @@
+import os
+import re
+import math
+import threading
+from functools import partial
+
+try:
+    import rasterio
+    from rasterio.windows import Window
+    HAS_RASTERIO = True
+except ImportError:
+    HAS_RASTERIO = False
+
+from mineral_indices import Sentinel2Indices
+from parallel_tiles import TileExecutor
+from lineaments import LineamentDetector, halo_for_sigma, CANNY_SIGMA
+from raster_overviews import overview_level, open_at, preferred_source
+
+# Band order of the 10-band district stack (data/Clipped_Zvishavane_District_20m.tif).
+DEFAULT_BAND_ORDER = ('B2', 'B3', 'B4', 'B5', 'B6', 'B7', 'B8', 'B8A', 'B11', 'B12')
+
+# Tile-size arrays needed on top of the input bands and the finished outputs.
+# Tiles are evaluated in compute mode, whose intermediates are chunk-sized,
+# so one spare array covers the chunk scratch space and GDAL's read buffer.
+WORKING_ARRAYS = 1
+
+# Bytes per pixel of a haloed lineament tile: the SWIR1 crop, the stretched
+# copy and the float64 Gaussian/Sobel/magnitude arrays of Canny.
+LINEAMENT_BYTES_PER_PIXEL = 80
+
+STRUCTURE_INDEX = 'Geological Structures (Lineaments)'
+
+
+def output_filename(name):
+    """'Iron Oxide (Red/Blue)' -> 'iron_oxide_red_blue.tif'"""
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_') + '.tif'
+
+
+def tile_pixels_for_budget(budget_mb, n_bands, n_outputs=1, tiles_in_flight=1, itemsize=4):
+    """
+    Number of pixels one tile may hold so that `tiles_in_flight` tiles, each
+    with its band stack, outputs and working arrays, fit into budget_mb.
+    """
+    bytes_per_pixel = itemsize * (n_bands + n_outputs + WORKING_ARRAYS) * tiles_in_flight
+    return max(1, int(budget_mb * 1024 * 1024 // bytes_per_pixel))
+
+
+def plan_windows(height, width, max_pixels, block_shape=(256, 256)):
+    """
+    Splits a raster into windows of at most max_pixels pixels, aligned to the
+    source block layout.
+
+    Strip-organised rasters (one block spans the full width) are cut into
+    full-width strips; tiled rasters into square tiles that are a whole number
+    of blocks. Windows are returned in row-major (spatial) order.
+    """
+    block_h, block_w = block_shape
+    if block_w >= width:
+        tile_w = width
+        tile_h = max(1, max_pixels // width)
+        if tile_h > block_h:
+            tile_h -= tile_h % block_h
+    else:
+        side = max(1, int(math.sqrt(max_pixels)))
+        tile_w = max(block_w, side - side % block_w)
+        tile_h = max(block_h, side - side % block_h)
+        while tile_w * tile_h > max_pixels and tile_w > block_w:
+            tile_w -= block_w
+        while tile_w * tile_h > max_pixels and tile_h > block_h:
+            tile_h -= block_h
+
+    windows = []
+    for row in range(0, height, tile_h):
+        for col in range(0, width, tile_w):
+            windows.append(Window(col, row, min(tile_w, width - col), min(tile_h, height - row)))
+    return windows
+
+
+def read_bands(src, window, band_order, names=None, dtype='float32'):
+    """
+    Reads the bands needed for `names` from an open rasterio dataset.
+
+    Nodata pixels are set to 0, the background value Sentinel2Indices
+    already treats as invalid.
+    """
+    needed = set()
+    for name in names or Sentinel2Indices.REQUIRED_BANDS:
+        needed.update(Sentinel2Indices.REQUIRED_BANDS[name])
+
+    bands = {}
+    for i, band in enumerate(band_order):
+        if band not in needed or i >= src.count:
+            continue
+        data = src.read(i + 1, window=window, out_dtype=dtype)
+        if src.nodata is not None:
+            data[data == src.nodata] = 0
+        bands[band] = data
+    return bands
+
+
+_local = threading.local()
+
+
+def _open_dataset(path, level=None):
+    """
+    One read handle per worker thread or process; GDAL handles are not
+    thread-safe. `level` opens one of the raster's overviews instead.
+    """
+    datasets = getattr(_local, 'datasets', None)
+    if datasets is None:
+        datasets = _local.datasets = {}
+    if (path, level) not in datasets:
+        datasets[path, level] = open_at(path, level)
+    return datasets[path, level]
+
+
+def _close_datasets():
+    for src in getattr(_local, 'datasets', {}).values():
+        src.close()
+    _local.datasets = {}
+
+
+def read_window(path, band_index, nodata, rows, cols, level=None):
+    """Reads one band for a (rows, cols) slice pair with nodata set to 0."""
+    src = _open_dataset(path, level)
+    data = src.read(band_index, window=Window.from_slices(rows, cols), out_dtype='float32')
+    if nodata is not None:
+        data[data == nodata] = 0
+    return data
+
+
+def compute_window(path, band_order, names, window, level=None):
+    """
+    Computes the named indices for one window of a raster (or of its
+    overview `level`).
+
+    Module-level so it can run on a process pool as well as a thread pool.
+
+    Returns:
+        tuple: (window, dict of index name -> float32 array)
+    """
+    src = _open_dataset(path, level)
+    calc = Sentinel2Indices(read_bands(src, window, band_order, names))
+    return window, calc.compute(names, dtype='float32')
+
+
+class TiledIndexEngine:
+    """
+    Computes Sentinel-2 indices over a GeoTIFF block by block and streams
+    each index to its own GeoTIFF, so peak memory is set by the tile budget
+    rather than by the size of the scene.
+    """
+
+    def __init__(self, path, band_order=DEFAULT_BAND_ORDER, tile_budget_mb=256, indices=None,
+                 workers=1, kind='thread', resolution=None):
+        """
+        Args:
+            path (str): Multi-band GeoTIFF holding the Sentinel-2 bands.
+            band_order (sequence): Band name of each raster band, in file order.
+            tile_budget_mb (float): Memory all tiles in flight (bands, outputs and
+                working arrays) may use together.
+            indices (list): Index names to compute (default: all of them).
+            workers (int): Tiles computed in parallel (None = all cores).
+            kind (str): 'thread' or 'process' pool (see TileExecutor).
+            resolution (float): Largest acceptable output pixel size in CRS
+                units: the indices are computed on the coarsest overview (of the
+                raster's COG when there is one, see raster_overviews) whose
+                pixels are no larger. Outputs are at that overview's own pixel
+                size, which is finer when no overview matches; self.resolution
+                holds it. None = native pixels.
+        """
+        if not HAS_RASTERIO:
+            raise ImportError("rasterio is required for tiled processing.")
+        self.path = preferred_source(path)
+        self.level = overview_level(self.path, resolution)
+        with open_at(self.path, self.level) as src:
+            self.resolution = max(abs(src.res[0]), abs(src.res[1]))
+        if resolution is not None and self.resolution < resolution * 0.99:
+            print(f"Warning: No overview of {self.path} has {resolution:g} unit pixels; "
+                  f"computing at {self.resolution:g}.")
+        self.band_order = tuple(band_order)
+        self.tile_budget_mb = tile_budget_mb
+        self.executor = TileExecutor(workers, kind)
+
+        if indices is None:
+            indices = list(Sentinel2Indices.INDEX_METHODS)
+        # Per-pixel indices go through compute_window; lineaments need haloed
+        # tiles and run through LineamentDetector.
+        self.indices = []
+        self.structures = False
+        for name in indices:
+            if not all(b in self.band_order for b in Sentinel2Indices.REQUIRED_BANDS[name]):
+                print(f"Warning: Missing bands for {name} in {path}.")
+            elif name == STRUCTURE_INDEX:
+                self.structures = True
+            elif name in Sentinel2Indices.NEIGHBOURHOOD_INDICES:
+                print(f"Warning: {name} needs neighbouring pixels and is skipped in tiled mode.")
+            else:
+                self.indices.append(name)
+
+    def _band_count(self):
+        needed = set()
+        for name in self.indices:
+            needed.update(Sentinel2Indices.REQUIRED_BANDS[name])
+        return len(needed)
+
+    def windows(self, src):
+        """Tile layout for an open dataset under the configured budget."""
+        max_pixels = tile_pixels_for_budget(
+            self.tile_budget_mb, self._band_count(), len(self.indices),
+            tiles_in_flight=self.executor.max_pending if self.executor.workers > 1 else 1,
+        )
+        return plan_windows(src.height, src.width, max_pixels, src.block_shapes[0])
+
+    def lineament_tile_size(self):
+        """Lineament tile edge (before the halo) under the configured budget."""
+        in_flight = self.executor.max_pending if self.executor.workers > 1 else 1
+        pixels = self.tile_budget_mb * 1024 * 1024 / in_flight / LINEAMENT_BYTES_PER_PIXEL
+        return max(64, int(math.sqrt(pixels)) - 2 * halo_for_sigma(CANNY_SIGMA))
+
+    def _output_profile(self, src):
+        profile = src.profile.copy()
+        profile.update(
+            driver='GTiff', count=1, dtype='float32', nodata=0,
+            tiled=True, blockxsize=256, blockysize=256,
+            compress='deflate', predictor=3, BIGTIFF='IF_SAFER',
+        )
+        # A single float band cannot keep the source's RGB photometric tag.
+        profile.pop('photometric', None)
+        return profile
+
+    def run(self, output_dir):
+        """
+        Computes every configured index and writes it to output_dir.
+
+        Returns:
+            dict: Index name -> path of the written GeoTIFF.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        names = self.indices + ([STRUCTURE_INDEX] if self.structures else [])
+        paths = {name: os.path.join(output_dir, output_filename(name)) for name in names}
+
+        # Keep GDAL's block cache inside the same budget as the tiles.
+        cache_mb = max(16, int(self.tile_budget_mb // 4))
+        with rasterio.Env(GDAL_CACHEMAX=cache_mb):
+            with open_at(self.path, self.level) as src:
+                profile = self._output_profile(src)
+                windows = self.windows(src)
+                shape = (src.height, src.width)
+                nodata = src.nodata
+            outputs = {name: rasterio.open(p, 'w', **profile) for name, p in paths.items()}
+            try:
+                # Workers only read and compute; every write happens here, in
+                # tile order, so the output files need no locking.
+                compute = partial(compute_window, self.path, self.band_order, self.indices, level=self.level)
+                for window, results in self.executor.imap(compute, windows):
+                    for name, result in results.items():
+                        outputs[name].write(result, 1, window=window)
+
+                if self.structures:
+                    self._run_lineaments(outputs[STRUCTURE_INDEX], shape, nodata)
+            finally:
+                for dst in outputs.values():
+                    dst.close()
+                # Serial runs read through this thread's handle cache.
+                _close_datasets()
+        return paths
+
+    def _run_lineaments(self, dst, shape, nodata):
+        detector = LineamentDetector(tile_size=self.lineament_tile_size(), workers=self.executor.workers)
+        read = partial(read_window, self.path, self.band_order.index('B11') + 1, nodata, level=self.level)
+
+        def write(rows, cols, edges):
+            dst.write(edges, 1, window=Window.from_slices(rows, cols))
+
+        detector.detect(read, shape, write)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tiled Sentinel-2 index computation.")
+    parser.add_argument("raster", help="Multi-band Sentinel-2 GeoTIFF")
+    parser.add_argument("output_dir", help="Directory for the per-index GeoTIFFs")
+    parser.add_argument("--tile-budget-mb", type=float, default=256)
+    parser.add_argument("--workers", type=int, default=1, help="0 = all cores")
+    parser.add_argument("--resolution", type=float, help="Largest output pixel size (CRS units); reads the coarsest overview within it")
+    args = parser.parse_args()
+
+    engine = TiledIndexEngine(args.raster, tile_budget_mb=args.tile_budget_mb, workers=args.workers or None,
+                              resolution=args.resolution)
+    for name, path in engine.run(args.output_dir).items():
+        print(f"{name}: {path}")
@@ -0,0 +1,289 @@
+"""
+Zonal statistics of index rasters over polygons (the district boundary,
+claims drawn with the folium Draw plugin, ...).
+
+Each polygon set is rasterized once into compact zone-label arrays that are
+cached and reused for every index. Aggregation is one pass per index with
+bincount reductions over all zones at once, so cost grows with the number of
+pixels inside polygons, not with the number of polygons.
+"""
+import json
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+try:
+    import rasterio
+    from rasterio import features
+    from rasterio.warp import transform_geom
+    HAS_RASTERIO = True
+except ImportError:
+    HAS_RASTERIO = False
+
+try:
+    from shapely.geometry import shape as to_shape
+    from shapely.strtree import STRtree
+    HAS_SHAPELY = True
+except ImportError:
+    HAS_SHAPELY = False
+
+DEFAULT_PERCENTILES = (10, 50, 90)
+# Pixels more than this many standard deviations above the scene mean count as anomalous.
+ANOMALY_SIGMA = 2.0
+MASK_CACHE_SIZE = 32
+
+# Polygons handed over by folium's Draw plugin / st_folium are WGS84 lon/lat.
+DRAW_CRS = 'EPSG:4326'
+
+
+def load_polygons(source, crs=None, source_crs=DRAW_CRS, id_field=None):
+    """
+    Normalises polygon input into a list of (zone id, GeoJSON geometry) pairs
+    in the raster CRS.
+
+    Args:
+        source: A vector file path (e.g. data/Zvishavane_District_Boundary.shp),
+            a GeoJSON FeatureCollection / Feature / geometry dict (as returned
+            by st_folium's `all_drawings`), or a list of such dicts.
+        crs: CRS of the raster the zones will be applied to.
+        source_crs: CRS of dict/list input (file input carries its own).
+        id_field (str): Feature property to use as zone id (default: position).
+    """
+    if isinstance(source, str):
+        import geopandas as gpd
+        frame = gpd.read_file(source)
+        if crs is not None:
+            frame = frame.to_crs(crs)
+        ids = frame[id_field] if id_field else range(len(frame))
+        return [(zone_id, geom.__geo_interface__) for zone_id, geom in zip(ids, frame.geometry)]
+
+    if isinstance(source, dict):
+        if source.get('type') == 'FeatureCollection':
+            items = source['features']
+        else:
+            items = [source]
+    else:
+        items = list(source)
+
+    polygons = []
+    for position, item in enumerate(items):
+        geometry = item.get('geometry', item) if isinstance(item, dict) else item.__geo_interface__
+        properties = item.get('properties') or {} if isinstance(item, dict) else {}
+        zone_id = properties.get(id_field, position) if id_field else position
+        if crs is not None and source_crs is not None:
+            geometry = transform_geom(source_crs, crs, geometry)
+        polygons.append((zone_id, geometry))
+    return polygons
+
+
+def _overlap_layers(geometries):
+    """
+    Assigns each polygon to a layer such that polygons in one layer do not
+    overlap, so every pixel belongs to at most one zone per label raster.
+    """
+    if not HAS_SHAPELY or len(geometries) < 2:
+        return [0] * len(geometries)
+    shapes = [to_shape(g) for g in geometries]
+    tree = STRtree(shapes)
+    layers = []
+    for i, geom in enumerate(shapes):
+        taken = set()
+        for j in tree.query(geom, predicate='intersects'):
+            if j < i and not geom.touches(shapes[j]):
+                taken.add(layers[j])
+        layer = 0
+        while layer in taken:
+            layer += 1
+        layers.append(layer)
+    return layers
+
+
+class ZoneMask:
+    """
+    Rasterized zones, stored compactly: for each non-overlapping layer, the
+    flat indices of the pixels inside any zone (grouped by zone) and their
+    zone ordinal.
+    """
+
+    def __init__(self, zone_ids, layers):
+        self.zone_ids = list(zone_ids)
+        # list of (flat pixel indices, zone ordinals), sorted by ordinal
+        self.layers = layers
+
+    @property
+    def pixel_count(self):
+        return sum(len(pixels) for pixels, _ in self.layers)
+
+
+class ZonalStatistics:
+    """
+    Per-zone summaries (count, mean, std, min, max, percentiles, anomaly pixel
+    counts) of index rasters that share one grid.
+    """
+
+    def __init__(self, shape, transform, crs=None, percentiles=DEFAULT_PERCENTILES,
+                 anomaly_sigma=ANOMALY_SIGMA, all_touched=False):
+        """
+        Args:
+            shape (tuple): (height, width) of the index rasters.
+            transform (Affine): Their geotransform.
+            crs: Their CRS (used to reproject polygon input).
+            percentiles (sequence): Percentiles reported per zone.
+            anomaly_sigma (float): Default anomaly threshold, in scene standard
+                deviations above the scene mean.
+            all_touched (bool): Rasterize every pixel a polygon touches, not just
+                those whose centre is inside (useful for small claims).
+        """
+        if not HAS_RASTERIO:
+            raise ImportError("rasterio is required for zonal statistics.")
+        self.shape = tuple(shape)
+        self.transform = transform
+        self.crs = crs
+        self.percentiles = tuple(percentiles)
+        self.anomaly_sigma = anomaly_sigma
+        self.all_touched = all_touched
+        self._masks = OrderedDict()
+
+    @classmethod
+    def from_raster(cls, path, **kwargs):
+        """Zonal statistics on the grid of an existing raster (e.g. a tiled-engine output)."""
+        with rasterio.open(path) as src:
+            return cls((src.height, src.width), src.transform, src.crs, **kwargs)
+
+    def zones(self, polygons):
+        """
+        Rasterizes (zone id, geometry) pairs into a ZoneMask, reusing the cached
+        mask when the same polygons were rasterized before.
+        """
+        key = hashlib.sha1(json.dumps(
+            [[str(zone_id), geometry] for zone_id, geometry in polygons], sort_keys=True, default=str,
+        ).encode()).hexdigest()
+        if key in self._masks:
+            self._masks.move_to_end(key)
+            return self._masks[key]
+
+        zone_ids = [zone_id for zone_id, _ in polygons]
+        geometries = [geometry for _, geometry in polygons]
+        assignment = _overlap_layers(geometries)
+
+        layers = []
+        for layer in range(max(assignment, default=-1) + 1):
+            shapes = [(geometries[i], i + 1) for i in range(len(geometries)) if assignment[i] == layer]
+            labels = features.rasterize(
+                shapes, out_shape=self.shape, transform=self.transform,
+                fill=0, dtype='int32', all_touched=self.all_touched,
+            ).ravel()
+            pixels = np.flatnonzero(labels)
+            ordinals = labels[pixels] - 1
+            order = np.argsort(ordinals, kind='stable')
+            layers.append((pixels[order], ordinals[order]))
+            del labels
+
+        mask = ZoneMask(zone_ids, layers)
+        self._masks[key] = mask
+        if len(self._masks) > MASK_CACHE_SIZE:
+            self._masks.popitem(last=False)
+        return mask
+
+    def scene_thresholds(self, layers, nodata=0):
+        """Default anomaly threshold per index: scene mean + anomaly_sigma * std."""
+        thresholds = {}
+        for name, values in layers.items():
+            valid = values[np.isfinite(values) & (values != nodata)] if nodata is not None else values[np.isfinite(values)]
+            thresholds[name] = float(valid.mean() + self.anomaly_sigma * valid.std()) if valid.size else np.inf
+        return thresholds
+
+    def summarize(self, polygons, layers, thresholds=None, nodata=0):
+        """
+        Summarises every index layer inside every zone.
+
+        Args:
+            polygons: (zone id, geometry) pairs (see load_polygons) or a ZoneMask.
+            layers (dict): Index name -> 2-D array on this grid, e.g. the
+                output of Sentinel2Indices.compute().
+            thresholds (dict): Index name -> anomaly threshold (default: scene_thresholds()).
+            nodata: Value excluded from statistics (indices use 0 as background); None keeps all.
+
+        Returns:
+            DataFrame: One row per (zone, index).
+        """
+        mask = polygons if isinstance(polygons, ZoneMask) else self.zones(polygons)
+        if thresholds is None:
+            thresholds = self.scene_thresholds(layers, nodata)
+        n_zones = len(mask.zone_ids)
+
+        frames = []
+        for name, values in layers.items():
+            if values.shape != self.shape:
+                raise ValueError(f"Layer {name} has shape {values.shape}, expected {self.shape}.")
+            flat = values.ravel()
+            stats = self._empty_stats(n_zones)
+            for pixels, ordinals in mask.layers:
+                self._accumulate(stats, flat[pixels], ordinals, n_zones, thresholds.get(name, np.inf), nodata)
+            frames.append(self._finish(stats, mask.zone_ids, name))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def _empty_stats(self, n_zones):
+        return {
+            'count': np.zeros(n_zones, dtype=np.int64),
+            'sum': np.zeros(n_zones),
+            'sum_sq': np.zeros(n_zones),
+            'min': np.full(n_zones, np.inf),
+            'max': np.full(n_zones, -np.inf),
+            'anomaly_pixels': np.zeros(n_zones, dtype=np.int64),
+            'percentiles': np.full((len(self.percentiles), n_zones), np.nan),
+        }
+
+    def _accumulate(self, stats, values, ordinals, n_zones, threshold, nodata):
+        valid = np.isfinite(values)
+        if nodata is not None:
+            valid &= values != nodata
+        values = values[valid].astype(np.float64, copy=False)
+        ordinals = ordinals[valid]
+        if values.size == 0:
+            return
+
+        stats['count'] += np.bincount(ordinals, minlength=n_zones)
+        stats['sum'] += np.bincount(ordinals, weights=values, minlength=n_zones)
+        stats['sum_sq'] += np.bincount(ordinals, weights=values * values, minlength=n_zones)
+        stats['anomaly_pixels'] += np.bincount(ordinals[values > threshold], minlength=n_zones)
+
+        # Sort values within each zone (ordinals are already grouped) once;
+        # min, max and percentiles are then index arithmetic on segments.
+        order = np.lexsort((values, ordinals))
+        values = values[order]
+        zones, starts, counts = np.unique(ordinals[order], return_index=True, return_counts=True)
+        ends = starts + counts - 1
+        np.minimum.at(stats['min'], zones, values[starts])
+        np.maximum.at(stats['max'], zones, values[ends])
+        for i, q in enumerate(self.percentiles):
+            position = starts + (counts - 1) * (q / 100.0)
+            below = np.floor(position).astype(np.int64)
+            above = np.minimum(below + 1, ends)
+            gamma = position - below
+            stats['percentiles'][i, zones] = values[below] + (values[above] - values[below]) * gamma
+
+    def _finish(self, stats, zone_ids, name):
+        count = stats['count']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = stats['sum'] / count
+            std = np.sqrt(np.maximum(stats['sum_sq'] / count - mean * mean, 0))
+            anomaly_fraction = stats['anomaly_pixels'] / count
+        empty = count == 0
+        frame = pd.DataFrame({
+            'zone_id': zone_ids,
+            'index': name,
+            'count': count,
+            'mean': mean,
+            'std': std,
+            'min': np.where(empty, np.nan, stats['min']),
+            'max': np.where(empty, np.nan, stats['max']),
+        })
+        for i, q in enumerate(self.percentiles):
+            frame[f'p{q:g}'] = stats['percentiles'][i]
+        frame['anomaly_pixels'] = stats['anomaly_pixels']
+        frame['anomaly_fraction'] = anomaly_fraction
+        return frame